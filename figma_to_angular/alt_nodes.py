@@ -3,87 +3,308 @@ Módulo para la representación intermedia de nodos (similar a AltNodes)
 Basado en el concepto de FigmaToCode pero implementado específicamente para Angular
 """
 
+import logging
 import re
-from typing import Dict, List, Optional, Any, Union, Tuple
+import sys
+from collections import deque
+from functools import lru_cache
+from typing import Dict, List, Optional, Any, Union, Tuple, Iterator, NamedTuple, Callable
+
+import numpy as np
+
+import layout_geometry as geometry
+
+logger = logging.getLogger(__name__)
+
+
+# Valores CSS de align-items para los códigos de alineación de layout_geometry
+_ALIGN_ITEMS = {
+    geometry.ALIGN_START: "flex-start",
+    geometry.ALIGN_END: "flex-end",
+    geometry.ALIGN_CENTER: "center",
+    geometry.ALIGN_SPACE_BETWEEN: "space-between",
+}
+
+# A partir de este número de hijos la geometría se analiza con arrays NumPy; por
+# debajo, construir los arrays cuesta más que lo que se ahorra (como
+# VECTORIZE_MIN_COLORS en code_generator)
+VECTORIZE_MIN_CHILDREN = 256
+
+
+class _LayoutKernels(NamedTuple):
+    """Funciones de análisis geométrico de una misma implementación (listas o arrays)"""
+    aligned_along: Callable
+    spacing_along: Callable
+    detect_alignment: Callable
+    grid_bands: Callable
+    average_band_gap: Callable
+
+
+_ARRAY_KERNELS = _LayoutKernels(
+    geometry.aligned_along, geometry.spacing_along, geometry.detect_alignment,
+    geometry.grid_bands, geometry.average_band_gap,
+)
+_SMALL_KERNELS = _LayoutKernels(
+    geometry.aligned_along_small, geometry.spacing_along_small, geometry.detect_alignment_small,
+    geometry.grid_bands_small, geometry.average_band_gap_small,
+)
+
+# Diccionario vacío compartido para lecturas de solo lectura (no modificar)
+_EMPTY: Dict = {}
+
+# Expresiones regulares precompiladas para la limpieza de nombres
+_RE_NONALNUM = re.compile(r'[^a-zA-Z0-9_\-\s]')
+_RE_WS = re.compile(r'\s+')
+
+# Reglas de detección de componentes Material por nombre, en orden de prioridad:
+# (subcadena, componente, tipo de nodo Figma requerido o None)
+_COMPONENT_RULES = (
+    ("button", "mat-button", None),
+    ("card", "mat-card", None),
+    ("input", "mat-form-field", None),
+    ("textfield", "mat-form-field", None),
+    ("select", "mat-select", None),
+    ("dropdown", "mat-select", None),
+    ("checkbox", "mat-checkbox", None),
+    ("radio", "mat-radio", None),
+    ("tab", "mat-tab-group", "FRAME"),
+    ("dialog", "mat-dialog", None),
+    ("modal", "mat-dialog", None),
+    ("menu", "mat-menu", None),
+    ("toolbar", "mat-toolbar", None),
+    ("icon", "mat-icon", None),
+    ("chip", "mat-chip", None),
+    ("tag", "mat-chip", None),
+    ("progress", "mat-progress-bar", None),
+)
+
+# Filtro rápido: la mayoría de los nombres no contiene ninguna palabra clave y
+# se descartan con una sola búsqueda en lugar de recorrer todas las reglas
+_COMPONENT_RE = re.compile("|".join(needle for needle, _, _ in _COMPONENT_RULES) + "|btn$")
+
+
+@lru_cache(maxsize=4096)
+def _clean_name_cached(name: str) -> str:
+    """Normaliza un nombre de Figma; memoizado porque los nombres se repiten mucho"""
+    if not name:
+        return "element"
+    
+    # Reemplazar espacios y caracteres especiales
+    clean = _RE_NONALNUM.sub('', name)
+    clean = _RE_WS.sub('-', clean).lower()
+    
+    # Asegurar que comienza con una letra
+    if clean and not clean[0].isalpha():
+        clean = "el-" + clean
+        
+    return clean or "element"
+
+
+@lru_cache(maxsize=8192, typed=True)
+def _figma_color_to_strings(r: float, g: float, b: float, alpha: float, opacity: float) -> Tuple[str, str]:
+    """
+    Convierte un color de Figma (canales 0-1) a sus cadenas CSS (rgba, hex);
+    memoizado porque los documentos reutilizan los mismos colores de marca
+    """
+    r = int(r * 255)
+    g = int(g * 255)
+    b = int(b * 255)
+    a = opacity * alpha
+    
+    # Empaquetar los tres canales en un entero y formatear el hex de una vez;
+    # el & 0xFF evita que un canal fuera de rango ensanche la salida
+    packed = ((r & 0xFF) << 16) | ((g & 0xFF) << 8) | (b & 0xFF)
+    return f"rgba({r}, {g}, {b}, {a})", "#%06x" % packed
+
+
+
+def _solid_fill(fill: Dict) -> Dict:
+    """Fill de color sólido"""
+    color = fill.get("color", {})
+    rgba, hex_color = _figma_color_to_strings(
+        color.get("r", 0), color.get("g", 0), color.get("b", 0),
+        color.get("a", 1), fill.get("opacity", 1)
+    )
+    
+    return {
+        "type": "color",
+        "color": rgba,
+        "hex": hex_color
+    }
+
+
+def _image_fill(fill: Dict) -> Dict:
+    """Fill de imagen"""
+    return {
+        "type": "image",
+        "imageRef": fill.get("imageRef", "")
+    }
+
+
+def _linear_gradient_fill(fill: Dict) -> Dict:
+    """Fill de gradiente lineal"""
+    return {
+        "type": "gradient",
+        "gradientType": "linear",
+        "gradientHandlePositions": fill.get("gradientHandlePositions", []),
+        "gradientStops": fill.get("gradientStops", [])
+    }
+
+
+def _drop_shadow_effect(effect: Dict) -> Dict:
+    """Efecto de sombra proyectada"""
+    color = effect.get("color", {})
+    rgba, _ = _figma_color_to_strings(
+        color.get("r", 0), color.get("g", 0), color.get("b", 0),
+        color.get("a", 1), effect.get("opacity", 1)
+    )
+    offset = effect.get("offset", {})
+    
+    return {
+        "type": "shadow",
+        "color": rgba,
+        "offset": {
+            "x": offset.get("x", 0),
+            "y": offset.get("y", 0)
+        },
+        "radius": effect.get("radius", 0),
+        "spread": effect.get("spread", 0)
+    }
+
+
+# Conversión por tipo de fill/efecto de Figma; los tipos no listados se ignoran
+_FILL_HANDLERS = {
+    "SOLID": _solid_fill,
+    "IMAGE": _image_fill,
+    "GRADIENT_LINEAR": _linear_gradient_fill,
+}
+
+_EFFECT_HANDLERS = {
+    "DROP_SHADOW": _drop_shadow_effect,
+}
+
+class NodePosition:
+    """Posición de un nodo; registro con slots en lugar de un dict por nodo"""
+    __slots__ = ('x', 'y', 'position')
+
+    def __init__(self, x: float = 0, y: float = 0, position: str = "relative"):
+        self.x = x
+        self.y = y
+        self.position = position
+
+    def to_dict(self) -> Dict:
+        return {"x": self.x, "y": self.y, "position": self.position}
+
+
+class NodeSize:
+    """Tamaño de un nodo y si cada dimensión es fija o flexible"""
+    __slots__ = ('width', 'height', 'width_type', 'height_type')
+
+    def __init__(self, width: Union[float, str] = "auto", height: Union[float, str] = "auto",
+                 width_type: str = "flexible", height_type: str = "flexible"):
+        self.width = width
+        self.height = height
+        self.width_type = width_type
+        self.height_type = height_type
+
+    def to_dict(self) -> Dict:
+        return {
+            "width": self.width,
+            "height": self.height,
+            "width_type": self.width_type,
+            "height_type": self.height_type
+        }
 
 
 class AngularNode:
     """
     Nodo intermedio para optimización y procesamiento antes de la conversión a Angular
     """
+    # Sin __dict__ por instancia: menos memoria y acceso a atributos más rápido
+    __slots__ = (
+        'id', 'name', 'type', 'parent', 'children',
+        'position', 'size', 'style', 'layout', 'content',
+        'component_type', 'is_container', 'flex_props', 'grid_props', 'warnings',
+        'bbox', '_child_boxes'
+    )
+
     def __init__(self, figma_node: Dict, parent=None):
         self.id = figma_node.get("id", "")
         self.name = self._clean_name(figma_node.get("name", ""))
-        self.type = figma_node.get("type", "")
+        # Los tipos se repiten en miles de nodos: se internan para compartir
+        # una sola cadena y comparar por identidad
+        self.type = sys.intern(figma_node.get("type", "") or "")
         self.parent = parent
         self.children: List['AngularNode'] = []
         
         # Propiedades específicas extraídas del nodo Figma
         self.position = self._extract_position(figma_node)
         self.size = self._extract_size(figma_node)
+        self.bbox = self._extract_bbox()
         self.style = self._extract_style(figma_node)
         self.layout = self._extract_layout(figma_node)
         self.content = self._extract_content(figma_node)
         
         # Propiedades para la conversión a Angular
-        self.component_type = self._detect_component_type(figma_node)
+        self.component_type = sys.intern(self._detect_component_type(figma_node))
         self.is_container = self._determine_if_container(figma_node)
         self.flex_props = {}  # Se llenará durante el análisis de layout
         self.grid_props = {}  # Se llenará durante el análisis de layout
         self.warnings = []
         
+        # Geometría de los hijos como matriz (N, 4), calculada bajo demanda
+        self._child_boxes = None
+        
     def _clean_name(self, name: str) -> str:
         """Limpia el nombre para usarlo como identificador"""
-        if not name:
-            return "element"
-        
-        # Reemplazar espacios y caracteres especiales
-        clean = re.sub(r'[^a-zA-Z0-9_\-\s]', '', name)
-        clean = re.sub(r'\s+', '-', clean).lower()
-        
-        # Asegurar que comienza con una letra
-        if clean and not clean[0].isalpha():
-            clean = "el-" + clean
-            
-        return clean or "element"
+        return _clean_name_cached(name or "")
     
-    def _extract_position(self, node: Dict) -> Dict:
+    def _extract_position(self, node: Dict) -> NodePosition:
         """Extrae información de posición del nodo"""
-        position = {"x": 0, "y": 0, "position": "relative"}
+        position = NodePosition()
         
         if "absoluteBoundingBox" in node:
             bbox = node["absoluteBoundingBox"]
-            position["x"] = bbox.get("x", 0)
-            position["y"] = bbox.get("y", 0)
+            position.x = bbox.get("x", 0)
+            position.y = bbox.get("y", 0)
         
         # Verificar si el nodo tiene posición absoluta
-        if node.get("constraints", {}).get("horizontal") == "LEFT_RIGHT" or node.get("constraints", {}).get("vertical") == "TOP_BOTTOM":
-            position["position"] = "absolute"
+        constraints = node.get("constraints") or _EMPTY
+        if constraints.get("horizontal") == "LEFT_RIGHT" or constraints.get("vertical") == "TOP_BOTTOM":
+            position.position = "absolute"
         
         return position
     
-    def _extract_size(self, node: Dict) -> Dict:
+    def _extract_size(self, node: Dict) -> NodeSize:
         """Extrae información de tamaño del nodo"""
-        size = {"width": "auto", "height": "auto"}
+        size = NodeSize()
         
         if "absoluteBoundingBox" in node:
             bbox = node["absoluteBoundingBox"]
-            size["width"] = bbox.get("width", 0)
-            size["height"] = bbox.get("height", 0)
+            size.width = bbox.get("width", 0)
+            size.height = bbox.get("height", 0)
         
         # Verificar restricciones de tamaño
-        if node.get("constraints", {}).get("width") == "FIXED":
-            size["width_type"] = "fixed"
-        else:
-            size["width_type"] = "flexible"
+        constraints = node.get("constraints") or _EMPTY
+        if constraints.get("width") == "FIXED":
+            size.width_type = "fixed"
             
-        if node.get("constraints", {}).get("height") == "FIXED":
-            size["height_type"] = "fixed"
-        else:
-            size["height_type"] = "flexible"
+        if constraints.get("height") == "FIXED":
+            size.height_type = "fixed"
         
         return size
     
+    def _extract_bbox(self) -> Optional[Tuple[float, float, float, float]]:
+        """
+        Bounding box (x, y, ancho, alto) en floats para el análisis de layout;
+        None si algún valor no es numérico (p. ej. tamaño "auto" sin bounding box)
+        """
+        values = (self.position.x, self.position.y, self.size.width, self.size.height)
+        for value in values:
+            if not isinstance(value, (int, float)):
+                return None
+        return tuple(float(value) for value in values)
+    
     def _extract_style(self, node: Dict) -> Dict:
         """Extrae información de estilo del nodo"""
         style = {
@@ -99,44 +320,23 @@ class AngularNode:
         if "fills" in node and isinstance(node["fills"], list):
             for fill in node["fills"]:
                 if fill.get("visible", True):
-                    if fill["type"] == "SOLID":
-                        color = fill.get("color", {})
-                        r = int(color.get("r", 0) * 255)
-                        g = int(color.get("g", 0) * 255)
-                        b = int(color.get("b", 0) * 255)
-                        a = fill.get("opacity", 1) * color.get("a", 1)
-                        
-                        style["fills"].append({
-                            "type": "color",
-                            "color": f"rgba({r}, {g}, {b}, {a})",
-                            "hex": f"#{r:02x}{g:02x}{b:02x}"
-                        })
-                    elif fill["type"] == "IMAGE":
-                        style["fills"].append({
-                            "type": "image",
-                            "imageRef": fill.get("imageRef", "")
-                        })
-                    elif fill["type"] == "GRADIENT_LINEAR":
-                        style["fills"].append({
-                            "type": "gradient",
-                            "gradientType": "linear",
-                            "gradientHandlePositions": fill.get("gradientHandlePositions", []),
-                            "gradientStops": fill.get("gradientStops", [])
-                        })
+                    handler = _FILL_HANDLERS.get(fill["type"])
+                    if handler:
+                        style["fills"].append(handler(fill))
         
         # Procesar strokes (bordes)
         if "strokes" in node and isinstance(node["strokes"], list) and node["strokes"]:
             for stroke in node["strokes"]:
                 if stroke.get("visible", True) and stroke["type"] == "SOLID":
                     color = stroke.get("color", {})
-                    r = int(color.get("r", 0) * 255)
-                    g = int(color.get("g", 0) * 255)
-                    b = int(color.get("b", 0) * 255)
-                    a = stroke.get("opacity", 1) * color.get("a", 1)
+                    rgba, hex_color = _figma_color_to_strings(
+                        color.get("r", 0), color.get("g", 0), color.get("b", 0),
+                        color.get("a", 1), stroke.get("opacity", 1)
+                    )
                     
                     style["strokes"].append({
-                        "color": f"rgba({r}, {g}, {b}, {a})",
-                        "hex": f"#{r:02x}{g:02x}{b:02x}",
+                        "color": rgba,
+                        "hex": hex_color,
                         "weight": node.get("strokeWeight", 1),
                         "align": node.get("strokeAlign", "INSIDE"),
                         "style": node.get("strokeDashes", []) and "dashed" or "solid"
@@ -146,23 +346,9 @@ class AngularNode:
         if "effects" in node and isinstance(node["effects"], list):
             for effect in node["effects"]:
                 if effect.get("visible", True):
-                    if effect["type"] == "DROP_SHADOW":
-                        color = effect.get("color", {})
-                        r = int(color.get("r", 0) * 255)
-                        g = int(color.get("g", 0) * 255)
-                        b = int(color.get("b", 0) * 255)
-                        a = effect.get("opacity", 1) * color.get("a", 1)
-                        
-                        style["effects"].append({
-                            "type": "shadow",
-                            "color": f"rgba({r}, {g}, {b}, {a})",
-                            "offset": {
-                                "x": effect.get("offset", {}).get("x", 0),
-                                "y": effect.get("offset", {}).get("y", 0)
-                            },
-                            "radius": effect.get("radius", 0),
-                            "spread": effect.get("spread", 0)
-                        })
+                    handler = _EFFECT_HANDLERS.get(effect["type"])
+                    if handler:
+                        style["effects"].append(handler(effect))
         
         # Procesar propiedades de texto
         if node.get("type") == "TEXT" and "style" in node:
@@ -261,35 +447,16 @@ class AngularNode:
         """
         name = node.get("name", "").lower()
         
-        # Detección basada en nombre
-        if "button" in name or name.endswith("btn"):
-            return "mat-button"
-        elif "card" in name:
-            return "mat-card"
-        elif "input" in name or "textfield" in name:
-            return "mat-form-field"
-        elif "select" in name or "dropdown" in name:
-            return "mat-select"
-        elif "checkbox" in name:
-            return "mat-checkbox"
-        elif "radio" in name:
-            return "mat-radio"
-        elif "tab" in name and node.get("type") == "FRAME":
-            return "mat-tab-group"
-        elif "dialog" in name or "modal" in name:
-            return "mat-dialog"
-        elif "menu" in name:
-            return "mat-menu"
-        elif "toolbar" in name:
-            return "mat-toolbar"
-        elif "icon" in name:
-            return "mat-icon"
-        elif "chip" in name or "tag" in name:
-            return "mat-chip"
-        elif "progress" in name:
-            if "circular" in name or "spinner" in name:
-                return "mat-progress-spinner"
-            return "mat-progress-bar"
+        # Detección basada en nombre (la primera regla que coincide gana)
+        if _COMPONENT_RE.search(name):
+            if name.endswith("btn"):
+                return "mat-button"
+            node_type = node.get("type")
+            for needle, component_type, required_type in _COMPONENT_RULES:
+                if needle in name and (required_type is None or node_type == required_type):
+                    if component_type == "mat-progress-bar" and ("circular" in name or "spinner" in name):
+                        return "mat-progress-spinner"
+                    return component_type
         
         # Detección basada en apariencia
         if node.get("type") == "TEXT" and "style" in node:
@@ -314,26 +481,47 @@ class AngularNode:
         """Añade un nodo hijo"""
         self.children.append(child)
         child.parent = self
+        
+        # Invalidar la geometría cacheada de los hijos
+        self._child_boxes = None
     
-    def to_dict(self) -> Dict:
-        """Convierte el nodo a un diccionario para depuración"""
-        result = {
-            "id": self.id,
-            "name": self.name,
-            "type": self.type,
-            "component_type": self.component_type,
-            "is_container": self.is_container,
-            "position": self.position,
-            "size": self.size,
-            "layout": self.layout,
-            "has_parent": self.parent is not None,
-            "children_count": len(self.children)
-        }
+    def children_geometry(self) -> Optional[np.ndarray]:
+        """
+        Devuelve los bounding boxes de los hijos como matriz float64 (N, 4) con
+        columnas x, y, ancho, alto; se construye una vez y se reutiliza.
+        None si algún hijo no tiene geometría numérica
+        """
+        if self._child_boxes is None:
+            boxes = [c.bbox for c in self.children]
+            if None in boxes:
+                return None
+            # Orden por columnas: cada eje es un bloque contiguo de memoria
+            self._child_boxes = np.array(boxes, dtype=np.float64, order="F").reshape(-1, 4)
+        
+        return self._child_boxes
+    
+    def iter_dict(self) -> Iterator[Tuple[str, Any]]:
+        """
+        Genera los pares (clave, valor) de to_dict sin materializar el
+        diccionario; útil para volcar árboles grandes
+        """
+        yield "id", self.id
+        yield "name", self.name
+        yield "type", self.type
+        yield "component_type", self.component_type
+        yield "is_container", self.is_container
+        yield "position", self.position.to_dict()
+        yield "size", self.size.to_dict()
+        yield "layout", self.layout
+        yield "has_parent", self.parent is not None
+        yield "children_count", len(self.children)
         
         if self.warnings:
-            result["warnings"] = self.warnings
-            
-        return result
+            yield "warnings", self.warnings
+    
+    def to_dict(self) -> Dict:
+        """Convierte el nodo a un diccionario para depuración"""
+        return dict(self.iter_dict())
 
 
 def convert_to_angular_nodes(figma_nodes: List[Dict]) -> List[AngularNode]:
@@ -348,54 +536,53 @@ def convert_to_angular_nodes(figma_nodes: List[Dict]) -> List[AngularNode]:
     """
     # Verificación de entrada
     if not figma_nodes:
-        print("Warning: No se proporcionaron nodos Figma para convertir")
+        logger.warning("No se proporcionaron nodos Figma para convertir")
         return []
         
     node_map = {}  # Mapeo de ID a nodo para mantener la estructura
     root_nodes = []
+    pending = []  # Relaciones (parent_id, id) a resolver con el mapa completo
+    ignored = 0  # Nodos malformados o que fallaron al convertirse
     
-    # Para prevenir errores por nodos malformados
-    valid_nodes = []
+    # Pasada única: validar, crear los nodos y registrar las relaciones
     for node in figma_nodes:
+        # Para prevenir errores por nodos malformados
         if not isinstance(node, dict) or "id" not in node:
-            print(f"Warning: Ignorando nodo sin ID: {type(node)}")
+            ignored += 1
             continue
-        valid_nodes.append(node)
-    
-    # Primera pasada: crear los nodos
-    try:
-        for node in valid_nodes:
-            try:
-                angular_node = AngularNode(node)
-                node_map[angular_node.id] = angular_node
-                
-                # Si no tiene parent_id, es un nodo raíz
-                if "parent_id" not in node:
-                    root_nodes.append(angular_node)
-            except Exception as e:
-                print(f"Error al convertir nodo {node.get('id', 'unknown')}: {str(e)}")
-    except Exception as e:
-        print(f"Error en primera pasada: {str(e)}")
-    
-    # Segunda pasada: establecer relaciones padre-hijo
-    try:
-        for node in valid_nodes:
-            try:
-                if "parent_id" in node and node["parent_id"] in node_map:
-                    parent = node_map[node["parent_id"]]
-                    if node["id"] in node_map:
-                        child = node_map[node["id"]]
-                        parent.add_child(child)
-            except Exception as e:
-                print(f"Error al establecer relación para nodo {node.get('id', 'unknown')}: {str(e)}")
-    except Exception as e:
-        print(f"Error en segunda pasada: {str(e)}")
+        
+        # Único punto con EAFP: los datos de Figma pueden venir con campos de
+        # tipos inesperados en cualquier parte del nodo
+        try:
+            angular_node = AngularNode(node)
+        except Exception as e:
+            logger.debug("Error al convertir nodo %s: %s", node.get("id", "unknown"), e)
+            ignored += 1
+            continue
+        
+        node_map[angular_node.id] = angular_node
+        
+        # Si no tiene parent_id, es un nodo raíz
+        if "parent_id" not in node:
+            root_nodes.append(angular_node)
+        else:
+            pending.append((node["parent_id"], node["id"]))
+    
+    # Un único aviso en lugar de uno por nodo
+    if ignored:
+        logger.warning("Se ignoraron %d nodos malformados o que no se pudieron convertir", ignored)
+    
+    # Establecer relaciones padre-hijo; se resuelven contra el mapa ya completo
+    # porque el árbol aplanado emite los hijos antes que sus padres
+    for parent_id, child_id in pending:
+        if parent_id in node_map and child_id in node_map:
+            node_map[parent_id].add_child(node_map[child_id])
     
     # En caso de que no se hayan detectado nodos raíz, buscar el primero
     if not root_nodes and node_map:
         first_node = list(node_map.values())[0]
         root_nodes.append(first_node)
-        print(f"No se detectaron nodos raíz, usando el primer nodo como raíz: {first_node.id}")
+        logger.warning("No se detectaron nodos raíz, usando el primer nodo como raíz: %s", first_node.id)
     
     return root_nodes
 
@@ -408,21 +595,18 @@ def analyze_layout(nodes: List[AngularNode]):
         nodes: Lista de nodos AngularNode raíz
     """
     if not nodes:
-        print("Warning: No hay nodos para analizar layout")
+        logger.warning("No hay nodos para analizar layout")
         return
-        
-    try:
-        for node in nodes:
-            try:
-                _analyze_node_layout(node)
-                
-                # Procesar hijos recursivamente
-                for child in node.children:
-                    analyze_layout([child])
-            except Exception as e:
-                print(f"Error al analizar layout de nodo {node.id}: {str(e)}")
-    except Exception as e:
-        print(f"Error general en analyze_layout: {str(e)}")
+
+    # Recorrido por niveles con una cola (sin recursión); cada padre se
+    # analiza antes que sus hijos, igual que en el recorrido en profundidad
+    queue = deque(nodes)
+    while queue:
+        node = queue.popleft()
+        _analyze_node_layout(node)
+
+        # No se poda por is_container: nodos como CANVAS tienen hijos sin serlo
+        queue.extend(node.children)
 
 
 def _analyze_node_layout(node: AngularNode):
@@ -435,293 +619,116 @@ def _analyze_node_layout(node: AngularNode):
     # Si no es un contenedor o no tiene hijos, no hay nada que analizar
     if not node.is_container or not node.children:
         return
+    
+    # Geometría de los hijos; sin bounding box el tamaño queda como "auto"
+    # y no hay geometría que comparar. Los contenedores pequeños (la inmensa
+    # mayoría) se analizan con listas; solo los grandes usan la matriz NumPy
+    if len(node.children) < VECTORIZE_MIN_CHILDREN:
+        boxes = [c.bbox for c in node.children]
+        if None in boxes:
+            logger.debug("Nodo %s con hijos sin geometría numérica; se omite su layout", node.id)
+            return
+        xs, ys, ws, hs = (list(column) for column in zip(*boxes))
+        kernels = _SMALL_KERNELS
+    else:
+        boxes = node.children_geometry()
+        if boxes is None:
+            logger.debug("Nodo %s con hijos sin geometría numérica; se omite su layout", node.id)
+            return
+        # Columnas de la matriz (vistas contiguas) compartidas por todos los helpers
+        xs, ys, ws, hs = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+        kernels = _ARRAY_KERNELS
         
     # Verificar si los hijos están alineados horizontal o verticalmente
-    if _children_aligned_horizontally(node.children):
+    if kernels.aligned_along(xs, ys):
         node.layout["type"] = "auto-layout"
         node.layout["direction"] = "horizontal"
         node.flex_props = {"display": "flex", "flex-direction": "row"}
         
         # Calcular spacing promedio entre elementos
-        spacing = _calculate_horizontal_spacing(node.children)
+        spacing = kernels.spacing_along(xs, ws)
         if spacing > 0:
             node.layout["spacing"] = spacing
             node.flex_props["gap"] = f"{spacing}px"
             
         # Detectar alineación vertical
-        v_alignment = _detect_vertical_alignment(node.children)
+        v_alignment = _ALIGN_ITEMS.get(kernels.detect_alignment(ys, hs))
         if v_alignment:
             node.flex_props["align-items"] = v_alignment
             
-    elif _children_aligned_vertically(node.children):
+    elif kernels.aligned_along(ys, xs):
         node.layout["type"] = "auto-layout"
         node.layout["direction"] = "vertical"
         node.flex_props = {"display": "flex", "flex-direction": "column"}
         
         # Calcular spacing promedio entre elementos
-        spacing = _calculate_vertical_spacing(node.children)
+        spacing = kernels.spacing_along(ys, hs)
         if spacing > 0:
             node.layout["spacing"] = spacing
             node.flex_props["gap"] = f"{spacing}px"
             
         # Detectar alineación horizontal
-        h_alignment = _detect_horizontal_alignment(node.children)
+        h_alignment = _ALIGN_ITEMS.get(kernels.detect_alignment(xs, ws))
         if h_alignment:
             node.flex_props["align-items"] = h_alignment
     
     # Si tenemos una cuadrícula (grid)
-    elif _appears_to_be_grid(node.children):
-        node.layout["type"] = "grid"
-        cols, rows = _detect_grid_dimensions(node.children)
-        node.grid_props = {
-            "display": "grid",
-            "grid-template-columns": f"repeat({cols}, 1fr)",
-            "grid-template-rows": f"repeat({rows}, auto)"
-        }
-        
-        # Calcular gaps para grid
-        h_gap, v_gap = _calculate_grid_gaps(node.children, cols, rows)
-        if h_gap > 0:
-            node.grid_props["column-gap"] = f"{h_gap}px"
-        if v_gap > 0:
-            node.grid_props["row-gap"] = f"{v_gap}px"
+    else:
+        grid = _detect_grid(xs, ys, kernels)
+        if grid is not None:
+            cols, rows, col_index, row_index = grid
+            node.layout["type"] = "grid"
+            node.grid_props = {
+                "display": "grid",
+                "grid-template-columns": f"repeat({cols}, 1fr)",
+                "grid-template-rows": f"repeat({rows}, auto)"
+            }
+            
+            # Calcular gaps para grid reutilizando las bandas ya detectadas
+            h_gap, v_gap = _calculate_grid_gaps(xs, ys, ws, hs, cols, rows, col_index, row_index, kernels)
+            if h_gap > 0:
+                node.grid_props["column-gap"] = f"{h_gap}px"
+            if v_gap > 0:
+                node.grid_props["row-gap"] = f"{v_gap}px"
     
     # Buscar elementos que están posicionados absolutamente
-    positioned_elements = [c for c in node.children if c.position["position"] == "absolute"]
+    positioned_elements = [c for c in node.children if c.position.position == "absolute"]
     if positioned_elements:
         # Si es un contenedor con posicionamiento absoluto, debemos asegurarnos de que sea relativo
         if not node.flex_props and not node.grid_props:
-            node.position["position"] = "relative"
-
-
-def _children_aligned_horizontally(children: List[AngularNode]) -> bool:
-    """Verifica si los hijos están principalmente alineados horizontalmente"""
-    if not children or len(children) < 2:
-        return False
-        
-    # Verificar si todos los elementos están aproximadamente a la misma altura (Y)
-    y_positions = [c.position["y"] for c in children]
-    y_avg = sum(y_positions) / len(y_positions)
-    max_deviation = 5  # Permitir pequeñas desviaciones (5px)
-    
-    aligned = all(abs(y - y_avg) <= max_deviation for y in y_positions)
-    
-    # Verificar que los elementos están distribuidos horizontalmente
-    if aligned:
-        x_positions = [c.position["x"] for c in children]
-        return max(x_positions) - min(x_positions) > 20  # Desviación significativa en X
-        
-    return False
-
-
-def _children_aligned_vertically(children: List[AngularNode]) -> bool:
-    """Verifica si los hijos están principalmente alineados verticalmente"""
-    if not children or len(children) < 2:
-        return False
-        
-    # Verificar si todos los elementos están aproximadamente a la misma posición X
-    x_positions = [c.position["x"] for c in children]
-    x_avg = sum(x_positions) / len(x_positions)
-    max_deviation = 5  # Permitir pequeñas desviaciones (5px)
-    
-    aligned = all(abs(x - x_avg) <= max_deviation for x in x_positions)
-    
-    # Verificar que los elementos están distribuidos verticalmente
-    if aligned:
-        y_positions = [c.position["y"] for c in children]
-        return max(y_positions) - min(y_positions) > 20  # Desviación significativa en Y
-        
-    return False
+            node.position.position = "relative"
 
 
-def _calculate_horizontal_spacing(children: List[AngularNode]) -> float:
-    """Calcula el espaciado horizontal promedio entre elementos"""
-    if len(children) < 2:
-        return 0
-        
-    # Ordenar por posición X
-    sorted_children = sorted(children, key=lambda c: c.position["x"])
-    
-    # Calcular diferencias entre elementos adyacentes
-    spacings = []
-    for i in range(len(sorted_children) - 1):
-        curr_right = sorted_children[i].position["x"] + sorted_children[i].size["width"]
-        next_left = sorted_children[i+1].position["x"]
-        spacings.append(next_left - curr_right)
-    
-    # Devolver promedio si hay valores positivos
-    positive_spacings = [s for s in spacings if s > 0]
-    if positive_spacings:
-        return sum(positive_spacings) / len(positive_spacings)
-    return 0
-
-
-def _calculate_vertical_spacing(children: List[AngularNode]) -> float:
-    """Calcula el espaciado vertical promedio entre elementos"""
-    if len(children) < 2:
-        return 0
-        
-    # Ordenar por posición Y
-    sorted_children = sorted(children, key=lambda c: c.position["y"])
-    
-    # Calcular diferencias entre elementos adyacentes
-    spacings = []
-    for i in range(len(sorted_children) - 1):
-        curr_bottom = sorted_children[i].position["y"] + sorted_children[i].size["height"]
-        next_top = sorted_children[i+1].position["y"]
-        spacings.append(next_top - curr_bottom)
+def _detect_grid(xs, ys, kernels: "_LayoutKernels") -> Optional[Tuple[int, int, Any, Any]]:
+    """
+    Verifica si los elementos parecen estar en una cuadrícula
     
-    # Devolver promedio si hay valores positivos
-    positive_spacings = [s for s in spacings if s > 0]
-    if positive_spacings:
-        return sum(positive_spacings) / len(positive_spacings)
-    return 0
-
-
-def _detect_vertical_alignment(children: List[AngularNode]) -> Optional[str]:
-    """Detecta la alineación vertical de los elementos"""
-    if not children:
+    Returns:
+        (columnas, filas, índice de columna, índice de fila) o None si no es una cuadrícula
+    """
+    if len(xs) < 4:  # Una cuadrícula debe tener al menos 4 elementos
         return None
-        
-    # Verificar alineación al inicio (top)
-    y_positions = [c.position["y"] for c in children]
-    if all(abs(y - min(y_positions)) < 5 for y in y_positions):
-        return "flex-start"
-        
-    # Verificar alineación al final (bottom)
-    bottom_positions = [c.position["y"] + c.size["height"] for c in children]
-    if all(abs(b - max(bottom_positions)) < 5 for b in bottom_positions):
-        return "flex-end"
-    
-    # Verificar alineación central
-    parent_height = max(bottom_positions) - min(y_positions)
-    centers = [c.position["y"] + c.size["height"]/2 for c in children]
-    center_avg = sum(centers) / len(centers)
-    if all(abs(c - center_avg) < 10 for c in centers):
-        return "center"
     
-    # Espaciado uniforme
-    if len(set(y_positions)) > 1 and len(children) > 2:
-        return "space-between"
-        
-    return None
-
-
-def _detect_horizontal_alignment(children: List[AngularNode]) -> Optional[str]:
-    """Detecta la alineación horizontal de los elementos"""
-    if not children:
+    # Detectar posibles columnas; sin varias columnas no hace falta mirar las filas
+    cols, col_index = kernels.grid_bands(xs)
+    if cols < 2:
         return None
-        
-    # Verificar alineación al inicio (left)
-    x_positions = [c.position["x"] for c in children]
-    if all(abs(x - min(x_positions)) < 5 for x in x_positions):
-        return "flex-start"
-        
-    # Verificar alineación al final (right)
-    right_positions = [c.position["x"] + c.size["width"] for c in children]
-    if all(abs(r - max(right_positions)) < 5 for r in right_positions):
-        return "flex-end"
-    
-    # Verificar alineación central
-    parent_width = max(right_positions) - min(x_positions)
-    centers = [c.position["x"] + c.size["width"]/2 for c in children]
-    center_avg = sum(centers) / len(centers)
-    if all(abs(c - center_avg) < 10 for c in centers):
-        return "center"
-    
-    # Espaciado uniforme
-    if len(set(x_positions)) > 1 and len(children) > 2:
-        return "space-between"
-        
-    return None
-
-
-def _appears_to_be_grid(children: List[AngularNode]) -> bool:
-    """Verifica si los elementos parecen estar en una cuadrícula"""
-    if len(children) < 4:  # Una cuadrícula debe tener al menos 4 elementos
-        return False
-        
-    # Detectar posibles columnas
-    x_positions = set()
-    for child in children:
-        x_positions.add(round(child.position["x"] / 10) * 10)  # Redondear a decenas para agrupar
     
     # Detectar posibles filas
-    y_positions = set()
-    for child in children:
-        y_positions.add(round(child.position["y"] / 10) * 10)  # Redondear a decenas para agrupar
+    rows, row_index = kernels.grid_bands(ys)
+    if rows < 2:
+        return None
     
-    # Si hay múltiples columnas y filas, podría ser una cuadrícula
-    return len(x_positions) > 1 and len(y_positions) > 1
+    return int(cols), int(rows), col_index, row_index
 
 
-def _detect_grid_dimensions(children: List[AngularNode]) -> Tuple[int, int]:
-    """Detecta las dimensiones aproximadas de la cuadrícula (columnas, filas)"""
-    # Detectar columnas distintivas
-    x_positions = set()
-    for child in children:
-        x_positions.add(round(child.position["x"] / 10) * 10)  # Redondear a decenas
+def _calculate_grid_gaps(xs, ys, ws, hs, cols: int, rows: int,
+                         col_index, row_index, kernels: "_LayoutKernels") -> Tuple[float, float]:
+    """Calcula los espacios entre columnas y filas en una cuadrícula"""
+    # Gaps horizontales: entre el borde derecho de cada columna y el izquierdo de la siguiente
+    h_gap = float(kernels.average_band_gap(xs, ws, col_index, cols))
     
-    # Detectar filas distintivas
-    y_positions = set()
-    for child in children:
-        y_positions.add(round(child.position["y"] / 10) * 10)  # Redondear a decenas
+    # Gaps verticales: entre el borde inferior de cada fila y el superior de la siguiente
+    v_gap = float(kernels.average_band_gap(ys, hs, row_index, rows))
     
-    return len(x_positions), len(y_positions)
-
-
-def _calculate_grid_gaps(children: List[AngularNode], cols: int, rows: int) -> Tuple[float, float]:
-    """Calcula los espacios entre columnas y filas en una cuadrícula"""
-    # Agrupar por columnas aproximadas
-    column_positions = {}
-    for child in children:
-        col_key = round(child.position["x"] / 10) * 10
-        if col_key not in column_positions:
-            column_positions[col_key] = []
-        column_positions[col_key].append(child)
-    
-    # Ordenar las columnas por posición
-    sorted_cols = sorted(column_positions.keys())
-    
-    # Calcular gaps horizontales
-    h_gaps = []
-    for i in range(len(sorted_cols) - 1):
-        col = sorted_cols[i]
-        next_col = sorted_cols[i+1]
-        
-        # Tomar el elemento más a la derecha de la columna actual
-        rightmost = max(column_positions[col], key=lambda c: c.position["x"] + c.size["width"])
-        # Tomar el elemento más a la izquierda de la columna siguiente
-        leftmost = min(column_positions[next_col], key=lambda c: c.position["x"])
-        
-        h_gaps.append(leftmost.position["x"] - (rightmost.position["x"] + rightmost.size["width"]))
-    
-    # Agrupar por filas aproximadas
-    row_positions = {}
-    for child in children:
-        row_key = round(child.position["y"] / 10) * 10
-        if row_key not in row_positions:
-            row_positions[row_key] = []
-        row_positions[row_key].append(child)
-    
-    # Ordenar las filas por posición
-    sorted_rows = sorted(row_positions.keys())
-    
-    # Calcular gaps verticales
-    v_gaps = []
-    for i in range(len(sorted_rows) - 1):
-        row = sorted_rows[i]
-        next_row = sorted_rows[i+1]
-        
-        # Tomar el elemento más abajo de la fila actual
-        bottommost = max(row_positions[row], key=lambda c: c.position["y"] + c.size["height"])
-        # Tomar el elemento más arriba de la fila siguiente
-        topmost = min(row_positions[next_row], key=lambda c: c.position["y"])
-        
-        v_gaps.append(topmost.position["y"] - (bottommost.position["y"] + bottommost.size["height"]))
-    
-    # Calcular promedios
-    h_gap = sum(h_gaps) / len(h_gaps) if h_gaps else 0
-    v_gap = sum(v_gaps) / len(v_gaps) if v_gaps else 0
-    
-    return h_gap, v_gap
\ No newline at end of file
+    return h_gap, v_gap
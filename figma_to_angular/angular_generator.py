@@ -3,26 +3,201 @@ Generador de código Angular optimizado con soporte para Angular Material
 """
 
 import re
-from typing import Dict, List, Optional, Any, Union, Tuple
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Dict, List, Optional, Any, Union, Tuple, Callable
 from alt_nodes import AngularNode
 
 
+# Expresiones regulares precompiladas
+_KEBAB_NON_ALNUM = re.compile(r'[^a-zA-Z0-9]')
+_KEBAB_DASHES = re.compile(r'-+')
+_RGBA_RE = re.compile(r'rgba\((\d+),\s*(\d+),\s*(\d+),\s*([\d.]+)\)')
+
+# Plantilla del componente TypeScript; las secciones opcionales se insertan
+# ya formateadas (o vacías)
+_TS_TEMPLATE = (
+    "import {{ Component, OnInit }} from '@angular/core';\n"
+    "{material_import}"
+    "\n"
+    "@Component({{\n"
+    "  selector: '{selector}',\n"
+    "  templateUrl: './{name}.component.html',\n"
+    "  styleUrls: ['./{name}.component.scss']\n"
+    "}})\n"
+    "export class {class_name}Component implements OnInit {{\n"
+    "{form_model}"
+    "  constructor() {{ }}\n"
+    "\n"
+    "  ngOnInit(): void {{\n"
+    "    // Initialize component\n"
+    "  }}\n"
+    "{form_submit}"
+    "}}"
+)
+_TS_FORM_MODEL = (
+    "  // Form model\n"
+    "  formData = {\n"
+    "    // Add form fields here\n"
+    "  };\n"
+    "\n"
+)
+_TS_FORM_SUBMIT = (
+    "\n"
+    "  onSubmit(): void {\n"
+    "    // Handle form submission\n"
+    "    console.log('Form submitted:', this.formData);\n"
+    "  }\n"
+)
+
+# Etiqueta de texto según el tamaño de fuente: _FONT_TAGS[i] aplica desde
+# _FONT_BINS[i - 1] (incluido) hasta _FONT_BINS[i]
+_FONT_BINS = (16, 18, 24, 32)
+_FONT_TAGS = ("span", "p", "h3", "h2", "h1")
+
+# Etiquetas de texto que se generan en una sola línea con su contenido
+_INLINE_TAGS = frozenset({"h1", "h2", "h3", "h4", "h5", "h6", "p", "span", "strong", "em"})
+
+# Componentes que requieren un modelo de formulario en el TypeScript
+_FORM_TYPES = frozenset({"mat-form-field", "mat-select"})
+
+# Plantillas HTML de los componentes Material (listas para str.format)
+_MAT_TEMPLATES = {
+    "mat-button": '{indent}<button mat-raised-button color="primary" class="{cls}">{content}</button>',
+    "mat-form-field": (
+        '{indent}<mat-form-field class="{cls}">\n'
+        '{indent}  <mat-label>{content}</mat-label>\n'
+        '{indent}  <input matInput>\n'
+        '{indent}</mat-form-field>'
+    ),
+}
+
+# Fragmentos de los componentes Material que contienen a otros nodos
+_MAT_CARD_OPEN = '{indent}<mat-card class="mat-elevation-z2" class="{cls}">'
+_MAT_CARD_HEADER = (
+    '{indent}  <mat-card-header>\n'
+    '{indent}    <mat-card-title>{title}</mat-card-title>\n'
+    '{indent}  </mat-card-header>'
+)
+_MAT_CARD_CLOSE = '{indent}</mat-card>'
+_MAT_SELECT_OPEN = (
+    '{indent}<mat-form-field class="{cls}">\n'
+    '{indent}  <mat-label>{content}</mat-label>\n'
+    '{indent}  <mat-select>'
+)
+_MAT_SELECT_OPTION = '{indent}    <mat-option value="{value}">{content}</mat-option>'
+_MAT_SELECT_CLOSE = (
+    '{indent}  </mat-select>\n'
+    '{indent}</mat-form-field>'
+)
+_MAT_TAB_GROUP_OPEN = '{indent}<mat-tab-group class="{cls}">'
+_MAT_TAB_OPEN = '{indent}  <mat-tab label="{label}">'
+_MAT_TAB_CLOSE = '{indent}  </mat-tab>'
+_MAT_TAB_EXAMPLE = (
+    '{indent}  <mat-tab label="Tab 1">\n'
+    '{indent}    <div class="tab-content">Tab 1 Content</div>\n'
+    '{indent}  </mat-tab>\n'
+    '{indent}  <mat-tab label="Tab 2">\n'
+    '{indent}    <div class="tab-content">Tab 2 Content</div>\n'
+    '{indent}  </mat-tab>'
+)
+_MAT_TAB_GROUP_CLOSE = '{indent}</mat-tab-group>'
+
+# Plantilla de los elementos de texto estándar
+_TEXT_ELEMENT = '{indent}<{tag} class="{cls}">{content}</{tag}>'
+
+# Módulos de Angular Material conocidos, en el orden en que se importan;
+# los módulos usados se guardan como máscara de bits sobre esta tupla
+_MAT_MODULES = (
+    "MatButtonModule",
+    "MatCardModule",
+    "MatFormFieldModule",
+    "MatSelectModule",
+    "MatTabsModule",
+)
+_MAT_MODULE_INDEX = {module: i for i, module in enumerate(_MAT_MODULES)}
+
+
+def _is_alpha_value(text: str) -> bool:
+    """Equivale a [\\d.]+ de _RGBA_RE"""
+    return bool(text) and all(ch == "." or ch.isdecimal() for ch in text)
+
+
+@lru_cache(maxsize=1024)
+def _rgba_to_hex(rgba_color: str) -> Optional[str]:
+    """
+    Convierte una cadena "rgba(r, g, b, a)" al hex del color; None si no tiene
+    ese formato. El caso habitual se resuelve con split y las demás formas que
+    acepta _RGBA_RE se delegan en la expresión regular. Memoizado porque las
+    sombras de un documento suelen repetir unos pocos colores
+    """
+    if rgba_color.startswith("rgba(") and rgba_color.endswith(")"):
+        parts = rgba_color[5:-1].split(",")
+        if len(parts) == 4:
+            r, g, b, a = parts[0], parts[1].lstrip(), parts[2].lstrip(), parts[3].lstrip()
+            if r.isdecimal() and g.isdecimal() and b.isdecimal() and _is_alpha_value(a):
+                return f"#{int(r):02x}{int(g):02x}{int(b):02x}"
+    
+    rgba_match = _RGBA_RE.match(rgba_color)
+    if rgba_match:
+        r, g, b, _ = rgba_match.groups()
+        return f"#{int(r):02x}{int(g):02x}{int(b):02x}"
+    return None
+
+
+@lru_cache(maxsize=4096)
+def _css_class_name(name: str, node_type: str) -> str:
+    """Nombre de clase CSS de un nodo; memoizado porque HTML y SCSS lo piden por nodo"""
+    # Si no hay nombre específico, usar el tipo
+    return f"{name or node_type.lower()}-element"
+
+
+@lru_cache(maxsize=256)
+def _pascal_case(kebab_name: str) -> str:
+    """Convierte un nombre kebab-case a PascalCase"""
+    return "".join(word.capitalize() for word in kebab_name.split("-"))
+
+
+class MaterialSpec:
+    """Etiqueta HTML, módulos a importar y renderizador de un componente Material"""
+    __slots__ = ('tag', 'imports', 'import_mask', 'render')
+
+    def __init__(self, tag: str, imports: Tuple[str, ...], render: Callable):
+        self.tag = tag
+        self.imports = imports
+        self.import_mask = 0
+        for module in imports:
+            self.import_mask |= 1 << _MAT_MODULE_INDEX[module]
+        self.render = render
+
+
 class AngularGenerator:
     """
     Generador de código optimizado para Angular basado en AltNodes
     """
+    # Indentaciones por nivel, compartidas entre instancias y ampliadas bajo demanda
+    _INDENTS: List[str] = [""]
+    
     def __init__(self, use_material: bool = True, responsive: bool = True):
         self.use_material = use_material
         self.responsive = responsive
         self.component_name = "figma-component"
         self.component_selector = "app-figma-component"
         self.warnings = []
-        self.imports = set()  # Conjunto para mantener los imports
+        self._imports_mask = 0  # Bits de _MAT_MODULES usados
         
         # Variables extraídas del diseño
         self.colors = {}
+        self._colors_by_hex = {}  # Índice hex -> entrada de self.colors
         self.text_styles = {}
+        self._tokens_extracted = False  # Los tokens se extraen al generar el SCSS
         
+    @property
+    def imports(self) -> List[str]:
+        """Módulos de Angular Material usados, en orden de importación"""
+        mask = self._imports_mask
+        return [module for i, module in enumerate(_MAT_MODULES) if mask & (1 << i)]
+    
     def generate(self, nodes: List[AngularNode], options: Dict = {}) -> Dict[str, str]:
         """
         Genera código Angular completo para los nodos proporcionados
@@ -39,8 +214,8 @@ class AngularGenerator:
                 self.component_name = self._format_component_name(options["component_name"])
                 self.component_selector = f"app-{self.component_name}"
         
-        # Extraer colores y estilos
-        self._extract_design_tokens(nodes)
+        # Los colores y estilos se extraen bajo demanda, solo el SCSS los usa
+        self._tokens_extracted = False
         
         # Generar HTML, TS y SCSS
         html = self._generate_html(nodes)
@@ -56,24 +231,25 @@ class AngularGenerator:
     def _format_component_name(self, name: str) -> str:
         """Formatea un nombre de componente"""
         # Convertir a kebab-case para el selector
-        kebab = re.sub(r'[^a-zA-Z0-9]', '-', name.lower())
-        kebab = re.sub(r'-+', '-', kebab).strip('-')
-        return kebab
+        return _KEBAB_DASHES.sub('-', _KEBAB_NON_ALNUM.sub('-', name.lower())).strip('-')
     
     def _extract_design_tokens(self, nodes: List[AngularNode]):
         """Extrae tokens de diseño (colores, tipografía) de los nodos"""
-        # Extraer colores
-        for node in nodes:
+        # Recorrido en preorden con pila explícita; el orden importa porque
+        # los nombres de los colores y cuál gana ante un hex repetido dependen de él
+        stack = list(reversed(nodes))
+        while stack:
+            node = stack.pop()
             self._extract_colors(node)
-            
-            # Recursivamente procesar hijos
-            for child in node.children:
-                self._extract_design_tokens([child])
+            stack.extend(reversed(node.children))
                 
     def _extract_colors(self, node: AngularNode):
         """Extrae colores de un nodo"""
+        style = node.style
+        fills = style.get("fills") or ()
+        
         # Extraer colores de fills
-        for fill in node.style.get("fills", []):
+        for fill in fills:
             if fill.get("type") == "color" and "hex" in fill:
                 color_hex = fill["hex"]
                 # Generar un nombre para el color
@@ -81,15 +257,10 @@ class AngularGenerator:
                 if node.name:
                     color_name = f"{node.name}-color"
                 
-                # Añadir color si no existe ya
-                if color_hex not in [c["hex"] for c in self.colors.values()]:
-                    self.colors[color_name] = {
-                        "hex": color_hex,
-                        "rgba": fill.get("color", "")
-                    }
+                self._register_color(color_hex, fill.get("color", ""), color_name)
         
         # Extraer colores de strokes
-        for stroke in node.style.get("strokes", []):
+        for stroke in style.get("strokes") or ():
             if "hex" in stroke:
                 color_hex = stroke["hex"]
                 # Generar un nombre para el color
@@ -97,47 +268,48 @@ class AngularGenerator:
                 if node.name:
                     color_name = f"{node.name}-stroke"
                 
-                # Añadir color si no existe ya
-                if color_hex not in [c["hex"] for c in self.colors.values()]:
-                    self.colors[color_name] = {
-                        "hex": color_hex,
-                        "rgba": stroke.get("color", "")
-                    }
+                self._register_color(color_hex, stroke.get("color", ""), color_name)
         
         # Extraer colores de texto
-        if "text" in node.style and node.style.get("fills", []):
-            text_fill = node.style["fills"][0]
+        if "text" in style and fills:
+            text_fill = fills[0]
             if "hex" in text_fill:
                 color_hex = text_fill["hex"]
                 color_name = f"text-{len(self.colors) + 1}"
                 if node.name:
                     color_name = f"{node.name}-text"
                 
-                # Añadir color si no existe ya
-                if color_hex not in [c["hex"] for c in self.colors.values()]:
-                    self.colors[color_name] = {
-                        "hex": color_hex,
-                        "rgba": text_fill.get("color", "")
-                    }
+                self._register_color(color_hex, text_fill.get("color", ""), color_name)
         
         # Extraer colores de efectos (sombras)
-        for effect in node.style.get("effects", []):
+        for effect in style.get("effects") or ():
             if effect.get("type") == "shadow" and "color" in effect:
                 color_name = f"shadow-{len(self.colors) + 1}"
                 rgba_color = effect["color"]
                 
                 # Extraer valores RGBA
-                rgba_match = re.match(r'rgba\((\d+),\s*(\d+),\s*(\d+),\s*([\d.]+)\)', rgba_color)
-                if rgba_match:
-                    r, g, b, a = rgba_match.groups()
-                    hex_color = f"#{int(r):02x}{int(g):02x}{int(b):02x}"
-                    
-                    # Añadir color si no existe ya
-                    if hex_color not in [c["hex"] for c in self.colors.values()]:
-                        self.colors[color_name] = {
-                            "hex": hex_color,
-                            "rgba": rgba_color
-                        }
+                hex_color = _rgba_to_hex(rgba_color)
+                if hex_color is not None:
+                    self._register_color(hex_color, rgba_color, color_name)
+    
+    def _register_color(self, color_hex: str, rgba: str, color_name: str):
+        """Añade un color a las variables si su hex no existe ya"""
+        if color_hex in self._colors_by_hex:
+            return
+        
+        # Un nombre repetido reemplaza al color anterior, que deja de estar indexado
+        previous = self.colors.get(color_name)
+        if previous is not None:
+            del self._colors_by_hex[previous["hex"]]
+        
+        # El nombre de la variable SCSS se calcula una sola vez al registrar
+        color = {
+            "hex": color_hex,
+            "rgba": rgba,
+            "variable": f"$color-{color_name.replace(' ', '-').lower()}"
+        }
+        self.colors[color_name] = color
+        self._colors_by_hex[color_hex] = color
     
     def _generate_html(self, nodes: List[AngularNode]) -> str:
         """
@@ -149,195 +321,168 @@ class AngularGenerator:
         Returns:
             String con el código HTML
         """
+        # Todas las líneas se acumulan en una sola lista y se unen una vez
         html_parts = []
         
         # Si hay múltiples nodos raíz, envolverlos en un contenedor
         if len(nodes) > 1:
             html_parts.append('<div class="figma-component-container">')
             for node in nodes:
-                html_parts.append(self._generate_node_html(node, 1))
+                self._generate_node_html(node, 1, html_parts)
             html_parts.append('</div>')
         elif len(nodes) == 1:
-            html_parts.append(self._generate_node_html(nodes[0], 0))
+            self._generate_node_html(nodes[0], 0, html_parts)
         
         return "\n".join(html_parts)
     
-    def _generate_node_html(self, node: AngularNode, indent_level: int) -> str:
+    def _generate_node_html(self, node: AngularNode, indent_level: int, out: List[str]):
         """
         Genera el HTML para un nodo individual
         
         Args:
             node: Nodo a procesar
             indent_level: Nivel de indentación
-            
-        Returns:
-            String con el HTML para este nodo
+            out: Lista de líneas donde se añade el HTML de este nodo y sus hijos
         """
-        indent = "  " * indent_level
+        # Para los componentes de Angular Material, delegar en su renderizador
+        if self.use_material:
+            spec = _MATERIAL_SPECS.get(node.component_type)
+            if spec is not None:
+                self._imports_mask |= spec.import_mask
+                spec.render(self, node, indent_level, out)
+                return
+        
+        indent = self._indent(indent_level)
         class_name = self._get_class_name(node)
         element = self._get_element_tag(node)
         
-        # Atributos base
-        attributes = []
-        
-        # Para los componentes de Angular Material, aplicar las propiedades necesarias
-        if node.component_type.startswith("mat-") and self.use_material:
-            self._add_material_import(node.component_type)
-            
-            # Atributos específicos según el tipo de componente
-            if node.component_type == "mat-button":
-                attributes.append('mat-raised-button color="primary"')
-                
-                # Si es un botón, el contenido es el texto
-                content = node.style.get("text", {}).get("content", "Button")
-                html = f'{indent}<button {" ".join(attributes)} class="{class_name}">{content}</button>'
-                return html
-                
-            elif node.component_type == "mat-card":
-                attributes.append('class="mat-elevation-z2"')
-                
-                # Estructura de card
-                html_parts = [f'{indent}<mat-card {" ".join(attributes)} class="{class_name}">']
-                
-                # Si tiene hijos, procesarlos
-                if node.children:
-                    # El primer hijo con texto podría ser el título de la tarjeta
-                    title_node = next((c for c in node.children if c.type == "TEXT" and c.style.get("text", {})), None)
-                    if title_node:
-                        title_content = title_node.style.get("text", {}).get("content", "")
-                        html_parts.append(f'{indent}  <mat-card-header>')
-                        html_parts.append(f'{indent}    <mat-card-title>{title_content}</mat-card-title>')
-                        html_parts.append(f'{indent}  </mat-card-header>')
-                        
-                        # Procesar los demás hijos como contenido
-                        html_parts.append(f'{indent}  <mat-card-content>')
-                        for child in node.children:
-                            if child != title_node:  # Evitar duplicar el título
-                                html_parts.append(self._generate_node_html(child, indent_level + 2))
-                        html_parts.append(f'{indent}  </mat-card-content>')
-                    else:
-                        # Sin título específico, todos los hijos van al contenido
-                        html_parts.append(f'{indent}  <mat-card-content>')
-                        for child in node.children:
-                            html_parts.append(self._generate_node_html(child, indent_level + 2))
-                        html_parts.append(f'{indent}  </mat-card-content>')
-                
-                html_parts.append(f'{indent}</mat-card>')
-                return "\n".join(html_parts)
-                
-            elif node.component_type == "mat-form-field":
-                # Input field
-                content = node.style.get("text", {}).get("content", "")
-                placeholder = content if content else "Enter text"
-                
-                html_parts = [f'{indent}<mat-form-field class="{class_name}">']
-                html_parts.append(f'{indent}  <mat-label>{placeholder}</mat-label>')
-                html_parts.append(f'{indent}  <input matInput>')
-                html_parts.append(f'{indent}</mat-form-field>')
-                return "\n".join(html_parts)
-                
-            elif node.component_type == "mat-select":
-                placeholder = node.style.get("text", {}).get("content", "Select")
-                
-                html_parts = [f'{indent}<mat-form-field class="{class_name}">']
-                html_parts.append(f'{indent}  <mat-label>{placeholder}</mat-label>')
-                html_parts.append(f'{indent}  <mat-select>')
-                
-                # Si tiene hijos, usarlos como opciones
-                if node.children:
-                    for i, child in enumerate(node.children):
-                        content = child.style.get("text", {}).get("content", f"Option {i+1}")
-                        html_parts.append(f'{indent}    <mat-option value="{i}">{content}</mat-option>')
-                else:
-                    # Opciones de ejemplo
-                    html_parts.append(f'{indent}    <mat-option value="1">Option 1</mat-option>')
-                    html_parts.append(f'{indent}    <mat-option value="2">Option 2</mat-option>')
-                
-                html_parts.append(f'{indent}  </mat-select>')
-                html_parts.append(f'{indent}</mat-form-field>')
-                return "\n".join(html_parts)
-                
-            elif node.component_type == "mat-tab-group":
-                html_parts = [f'{indent}<mat-tab-group class="{class_name}">']
-                
-                # Cada hijo podría ser una tab
-                if node.children:
-                    for i, child in enumerate(node.children):
-                        tab_label = child.name or f"Tab {i+1}"
-                        html_parts.append(f'{indent}  <mat-tab label="{tab_label}">')
-                        
-                        # Si el hijo tiene contenido
-                        if child.children:
-                            html_parts.append(f'{indent}    <div class="tab-content">')
-                            for grandchild in child.children:
-                                html_parts.append(self._generate_node_html(grandchild, indent_level + 3))
-                            html_parts.append(f'{indent}    </div>')
-                        
-                        html_parts.append(f'{indent}  </mat-tab>')
-                else:
-                    # Tabs de ejemplo
-                    html_parts.append(f'{indent}  <mat-tab label="Tab 1">')
-                    html_parts.append(f'{indent}    <div class="tab-content">Tab 1 Content</div>')
-                    html_parts.append(f'{indent}  </mat-tab>')
-                    html_parts.append(f'{indent}  <mat-tab label="Tab 2">')
-                    html_parts.append(f'{indent}    <div class="tab-content">Tab 2 Content</div>')
-                    html_parts.append(f'{indent}  </mat-tab>')
-                
-                html_parts.append(f'{indent}</mat-tab-group>')
-                return "\n".join(html_parts)
-        
         # Elementos estándar
-        if element in ["h1", "h2", "h3", "h4", "h5", "h6", "p", "span", "strong", "em"]:
+        if element in _INLINE_TAGS:
             content = node.style.get("text", {}).get("content", "")
-            return f'{indent}<{element} class="{class_name}">{content}</{element}>'
+            out.append(_TEXT_ELEMENT.format(indent=indent, tag=element, cls=class_name, content=content))
+            return
             
-        # Si es un div o elemento estándar
-        html_parts = [f'{indent}<{element} class="{class_name}">']
-        
-        # Si tiene hijos, procesarlos
+        # Si es un div o elemento estándar con hijos, procesarlos
         if node.children:
+            out.append(f'{indent}<{element} class="{class_name}">')
             for child in node.children:
-                html_parts.append(self._generate_node_html(child, indent_level + 1))
+                self._generate_node_html(child, indent_level + 1, out)
         # Si es texto, añadir el contenido
         elif node.type == "TEXT":
             content = node.style.get("text", {}).get("content", "")
-            html_parts = [f'{indent}<{element} class="{class_name}">{content}']
+            out.append(f'{indent}<{element} class="{class_name}">{content}')
+        else:
+            out.append(f'{indent}<{element} class="{class_name}">')
         
-        html_parts.append(f'{indent}</{element}>')
-        return "\n".join(html_parts)
+        out.append(f'{indent}</{element}>')
+    
+    def _render_mat_button(self, node: AngularNode, indent_level: int, out: List[str]):
+        """HTML de un mat-button; el contenido es el texto del nodo"""
+        content = node.style.get("text", {}).get("content", "Button")
+        out.append(_MAT_TEMPLATES["mat-button"].format(
+            indent=self._indent(indent_level), cls=self._get_class_name(node), content=content))
+    
+    def _render_mat_card(self, node: AngularNode, indent_level: int, out: List[str]):
+        """HTML de un mat-card con título opcional y los hijos como contenido"""
+        indent = self._indent(indent_level)
+        out.append(_MAT_CARD_OPEN.format(indent=indent, cls=self._get_class_name(node)))
+        
+        # Si tiene hijos, procesarlos
+        if node.children:
+            # El primer hijo con texto podría ser el título de la tarjeta; los
+            # demás hijos van al contenido (una sola pasada separa ambos). Un
+            # mismo nodo puede repetirse en children: el título nunca se duplica
+            title_node = None
+            body_children = []
+            for child in node.children:
+                if title_node is None and child.type == "TEXT" and child.style.get("text"):
+                    title_node = child
+                elif child is not title_node:
+                    body_children.append(child)
+            
+            if title_node is not None:
+                title_content = title_node.style["text"].get("content", "")
+                out.append(_MAT_CARD_HEADER.format(indent=indent, title=title_content))
+            
+            out.append(f'{indent}  <mat-card-content>')
+            for child in body_children:
+                self._generate_node_html(child, indent_level + 2, out)
+            out.append(f'{indent}  </mat-card-content>')
+        
+        out.append(_MAT_CARD_CLOSE.format(indent=indent))
+    
+    def _render_mat_form_field(self, node: AngularNode, indent_level: int, out: List[str]):
+        """HTML de un campo de texto mat-form-field"""
+        content = node.style.get("text", {}).get("content", "")
+        placeholder = content if content else "Enter text"
+        out.append(_MAT_TEMPLATES["mat-form-field"].format(
+            indent=self._indent(indent_level), cls=self._get_class_name(node), content=placeholder))
+    
+    def _render_mat_select(self, node: AngularNode, indent_level: int, out: List[str]):
+        """HTML de un mat-select; los hijos se usan como opciones"""
+        indent = self._indent(indent_level)
+        placeholder = node.style.get("text", {}).get("content", "Select")
+        out.append(_MAT_SELECT_OPEN.format(indent=indent, cls=self._get_class_name(node), content=placeholder))
+        
+        # Si tiene hijos, usarlos como opciones
+        if node.children:
+            for i, child in enumerate(node.children):
+                content = child.style.get("text", {}).get("content", f"Option {i+1}")
+                out.append(_MAT_SELECT_OPTION.format(indent=indent, value=i, content=content))
+        else:
+            # Opciones de ejemplo
+            out.append(_MAT_SELECT_OPTION.format(indent=indent, value=1, content="Option 1"))
+            out.append(_MAT_SELECT_OPTION.format(indent=indent, value=2, content="Option 2"))
+        
+        out.append(_MAT_SELECT_CLOSE.format(indent=indent))
+    
+    def _render_mat_tab_group(self, node: AngularNode, indent_level: int, out: List[str]):
+        """HTML de un mat-tab-group; cada hijo es una tab"""
+        indent = self._indent(indent_level)
+        out.append(_MAT_TAB_GROUP_OPEN.format(indent=indent, cls=self._get_class_name(node)))
+        
+        # Cada hijo podría ser una tab
+        if node.children:
+            for i, child in enumerate(node.children):
+                tab_label = child.name or f"Tab {i+1}"
+                out.append(_MAT_TAB_OPEN.format(indent=indent, label=tab_label))
+                
+                # Si el hijo tiene contenido
+                if child.children:
+                    out.append(f'{indent}    <div class="tab-content">')
+                    for grandchild in child.children:
+                        self._generate_node_html(grandchild, indent_level + 3, out)
+                    out.append(f'{indent}    </div>')
+                
+                out.append(_MAT_TAB_CLOSE.format(indent=indent))
+        else:
+            # Tabs de ejemplo
+            out.append(_MAT_TAB_EXAMPLE.format(indent=indent))
+        
+        out.append(_MAT_TAB_GROUP_CLOSE.format(indent=indent))
+    
+    def _indent(self, level: int) -> str:
+        """Devuelve la indentación para un nivel, reutilizando las ya creadas"""
+        indents = self._INDENTS
+        if level >= len(indents):
+            indents.extend("  " * i for i in range(len(indents), level + 1))
+        return indents[level]
     
     def _get_element_tag(self, node: AngularNode) -> str:
         """Determina la etiqueta HTML apropiada para el nodo"""
         # Si es un componente de Material UI, usar el tag específico
-        if node.component_type.startswith("mat-") and self.use_material:
-            if node.component_type == "mat-button":
-                return "button"
-            elif node.component_type == "mat-card":
-                return "mat-card"
-            elif node.component_type == "mat-form-field":
-                return "mat-form-field"
-            elif node.component_type == "mat-select":
-                return "mat-form-field"
-            elif node.component_type == "mat-tab-group":
-                return "mat-tab-group"
-            # Añadir más componentes según sea necesario
+        if self.use_material:
+            spec = _MATERIAL_SPECS.get(node.component_type)
+            if spec is not None:
+                return spec.tag
         
         # Mapear tipos de nodo a elementos HTML
         if node.type == "TEXT":
             # Determinar el tipo de texto según el tamaño
             font_size = node.style.get("text", {}).get("fontSize", 16)
-            if font_size >= 32:
-                return "h1"
-            elif font_size >= 24:
-                return "h2"
-            elif font_size >= 18:
-                return "h3"
-            elif font_size >= 16:
-                return "p"
-            else:
-                return "span"
+            return _FONT_TAGS[bisect_right(_FONT_BINS, font_size)]
             
-        elif node.component_type in ["h1", "h2", "h3", "h4", "h5", "h6", "p", "span", "strong", "em"]:
+        elif node.component_type in _INLINE_TAGS:
             return node.component_type
             
         # Por defecto, usar divs
@@ -345,28 +490,7 @@ class AngularGenerator:
     
     def _get_class_name(self, node: AngularNode) -> str:
         """Genera un nombre de clase CSS para el nodo"""
-        base_class = node.name
-        
-        # Si no hay nombre específico, usar el tipo
-        if not base_class:
-            base_class = node.type.lower()
-            
-        return f"{base_class}-element"
-    
-    def _add_material_import(self, component_type: str):
-        """Añade la importación necesaria para un componente de Material"""
-        if component_type == "mat-button":
-            self.imports.add("MatButtonModule")
-        elif component_type == "mat-card":
-            self.imports.add("MatCardModule")
-        elif component_type == "mat-form-field":
-            self.imports.add("MatFormFieldModule")
-        elif component_type == "mat-select":
-            self.imports.add("MatSelectModule")
-            self.imports.add("MatFormFieldModule")
-        elif component_type == "mat-tab-group":
-            self.imports.add("MatTabsModule")
-        # Añadir más importaciones según sea necesario
+        return _css_class_name(node.name, node.type)
     
     def _generate_scss(self, nodes: List[AngularNode]) -> str:
         """
@@ -378,15 +502,19 @@ class AngularGenerator:
         Returns:
             String con el código SCSS
         """
+        # Extraer colores y estilos (una vez por generación)
+        if not self._tokens_extracted:
+            self._extract_design_tokens(nodes)
+            self._tokens_extracted = True
+        
         scss_parts = []
         
         # Generar variables SCSS para los colores extraídos
         if self.colors:
             scss_parts.append("// Design tokens")
             scss_parts.append("// Colors")
-            for name, color in self.colors.items():
-                variable_name = name.replace(" ", "-").lower()
-                scss_parts.append(f"$color-{variable_name}: {color['hex']};")
+            for color in self.colors.values():
+                scss_parts.append(f"{color['variable']}: {color['hex']};")
             scss_parts.append("")
         
         # Estilos para el contenedor principal
@@ -401,40 +529,43 @@ class AngularGenerator:
         
         # Generar estilos para cada nodo
         for node in nodes:
-            scss_parts.append(self._generate_node_scss(node))
+            self._generate_node_scss(node, scss_parts)
         
         return "\n".join(scss_parts)
     
-    def _generate_node_scss(self, node: AngularNode) -> str:
+    def _generate_node_scss(self, node: AngularNode, scss_parts: List[str]):
         """
         Genera el SCSS para un nodo individual
         
         Args:
             node: Nodo a procesar
-            
-        Returns:
-            String con el SCSS para este nodo
+            scss_parts: Lista de líneas donde se añade el SCSS de este nodo y sus hijos
         """
         class_name = self._get_class_name(node)
-        scss_parts = [f".{class_name} {{"]
+        scss_parts.append(f".{class_name} {{")
+        
+        style = node.style
+        fills = style.get("fills") or ()
+        strokes = style.get("strokes") or ()
+        effects = style.get("effects") or ()
         
         # Position
-        position_type = node.position.get("position", "relative")
+        position_type = node.position.position
         scss_parts.append(f"  position: {position_type};")
         
         # Si es absolute, añadir top/left
         if position_type == "absolute":
-            scss_parts.append(f"  top: {node.position['y']}px;")
-            scss_parts.append(f"  left: {node.position['x']}px;")
+            scss_parts.append(f"  top: {node.position.y}px;")
+            scss_parts.append(f"  left: {node.position.x}px;")
         
         # Size
-        if node.size["width_type"] == "fixed":
-            scss_parts.append(f"  width: {node.size['width']}px;")
+        if node.size.width_type == "fixed":
+            scss_parts.append(f"  width: {node.size.width}px;")
         elif self.responsive:
             scss_parts.append("  width: 100%;")
         
-        if node.size["height_type"] == "fixed":
-            scss_parts.append(f"  height: {node.size['height']}px;")
+        if node.size.height_type == "fixed":
+            scss_parts.append(f"  height: {node.size.height}px;")
         
         # Layout (Flex o Grid)
         if node.flex_props:
@@ -453,44 +584,42 @@ class AngularGenerator:
                     padding_values.append(f"{padding[side]}px")
                 scss_parts.append(f"  padding: {' '.join(padding_values)};")
         
+        # Valor CSS del primer fill de color (variable si está registrado);
+        # se usa tanto para el fondo como para el color del texto
+        color_value = None
+        for fill in fills:
+            if fill["type"] == "color":
+                color = self._colors_by_hex.get(fill["hex"])
+                color_value = color["variable"] if color is not None else fill["color"]
+                break
+        
         # Background
-        if node.style.get("fills"):
-            for fill in node.style["fills"]:
-                if fill["type"] == "color":
-                    color_name = None
-                    # Buscar si este color está en nuestras variables
-                    for name, color in self.colors.items():
-                        if color["hex"] == fill["hex"]:
-                            color_name = f"$color-{name.replace(' ', '-').lower()}"
-                            break
-                    
-                    if color_name:
-                        scss_parts.append(f"  background-color: {color_name};")
-                    else:
-                        scss_parts.append(f"  background-color: {fill['color']};")
-                    break
-                elif fill["type"] == "gradient" and fill["gradientType"] == "linear":
-                    # Implementación básica de gradiente
-                    scss_parts.append("  background: linear-gradient(to bottom, #ffffff, #f0f0f0);")
-                    scss_parts.append("  // Note: Gradient implementation is approximate")
-                    break
+        for fill in fills:
+            if fill["type"] == "color":
+                scss_parts.append(f"  background-color: {color_value};")
+                break
+            elif fill["type"] == "gradient" and fill["gradientType"] == "linear":
+                # Implementación básica de gradiente
+                scss_parts.append("  background: linear-gradient(to bottom, #ffffff, #f0f0f0);")
+                scss_parts.append("  // Note: Gradient implementation is approximate")
+                break
         
         # Border
-        if node.style.get("strokes"):
-            for stroke in node.style["strokes"]:
+        if strokes:
+            for stroke in strokes:
                 scss_parts.append(f"  border: {stroke['weight']}px {stroke['style']} {stroke['color']};")
                 break  # Solo usar el primer stroke
         
         # Border radius
-        if isinstance(node.style["radius"], (int, float)) and node.style["radius"] > 0:
-            scss_parts.append(f"  border-radius: {node.style['radius']}px;")
-        elif isinstance(node.style["radius"], dict):
-            radius = node.style["radius"]
+        radius = style["radius"]
+        if isinstance(radius, (int, float)) and radius > 0:
+            scss_parts.append(f"  border-radius: {radius}px;")
+        elif isinstance(radius, dict):
             scss_parts.append(f"  border-radius: {radius['topLeft']}px {radius['topRight']}px {radius['bottomRight']}px {radius['bottomLeft']}px;")
         
         # Shadow effects
-        if node.style.get("effects"):
-            for effect in node.style["effects"]:
+        if effects:
+            for effect in effects:
                 if effect["type"] == "shadow":
                     x = effect["offset"]["x"]
                     y = effect["offset"]["y"]
@@ -499,42 +628,37 @@ class AngularGenerator:
                     color = effect["color"]
                     scss_parts.append(f"  box-shadow: {x}px {y}px {blur}px {spread}px {color};")
         
-        # Text styles
-        if "text" in node.style:
-            text_style = node.style["text"]
-            scss_parts.append(f"  font-family: {text_style['fontFamily']}, sans-serif;")
-            scss_parts.append(f"  font-size: {text_style['fontSize']}px;")
-            scss_parts.append(f"  font-weight: {text_style['fontWeight']};")
-            scss_parts.append(f"  text-align: {text_style['textAlign']};")
+        # Text styles (valores por defecto iguales a los de AngularNode)
+        text_style = style.get("text")
+        if text_style is not None:
+            get = text_style.get
+            font_style = get("fontStyle", "normal")
+            text_decoration = get("textDecoration", "none")
+            line_height = get("lineHeight", "auto")
+            letter_spacing = get("letterSpacing", 0)
+            
+            scss_parts.append(
+                f"  font-family: {get('fontFamily', 'Roboto')}, sans-serif;\n"
+                f"  font-size: {get('fontSize', 14)}px;\n"
+                f"  font-weight: {get('fontWeight', 400)};\n"
+                f"  text-align: {get('textAlign', 'left')};"
+            )
             
-            if text_style['fontStyle'] != "normal":
-                scss_parts.append(f"  font-style: {text_style['fontStyle']};")
+            if font_style != "normal":
+                scss_parts.append(f"  font-style: {font_style};")
                 
-            if text_style['textDecoration'] != "none":
-                scss_parts.append(f"  text-decoration: {text_style['textDecoration']};")
+            if text_decoration != "none":
+                scss_parts.append(f"  text-decoration: {text_decoration};")
                 
-            if text_style['lineHeight'] != "auto":
-                scss_parts.append(f"  line-height: {text_style['lineHeight']}px;")
+            if line_height != "auto":
+                scss_parts.append(f"  line-height: {line_height}px;")
                 
-            if text_style['letterSpacing'] != 0:
-                scss_parts.append(f"  letter-spacing: {text_style['letterSpacing']}px;")
+            if letter_spacing != 0:
+                scss_parts.append(f"  letter-spacing: {letter_spacing}px;")
             
             # Text color
-            if node.style.get("fills"):
-                for fill in node.style["fills"]:
-                    if fill["type"] == "color":
-                        color_name = None
-                        # Buscar si este color está en nuestras variables
-                        for name, color in self.colors.items():
-                            if color["hex"] == fill["hex"]:
-                                color_name = f"$color-{name.replace(' ', '-').lower()}"
-                                break
-                        
-                        if color_name:
-                            scss_parts.append(f"  color: {color_name};")
-                        else:
-                            scss_parts.append(f"  color: {fill['color']};")
-                        break
+            if color_value is not None:
+                scss_parts.append(f"  color: {color_value};")
         
         # Media queries for responsiveness
         if self.responsive and node.is_container:
@@ -547,7 +671,7 @@ class AngularGenerator:
                 scss_parts.append("    flex-direction: column;")
                 
             # Ajustar tamaño
-            if node.size["width_type"] == "fixed" and node.size["width"] > 500:
+            if node.size.width_type == "fixed" and node.size.width > 500:
                 scss_parts.append("    width: 100%;")
                 
             scss_parts.append("  }")
@@ -557,9 +681,7 @@ class AngularGenerator:
         
         # Generar estilos para los hijos
         for child in node.children:
-            scss_parts.append(self._generate_node_scss(child))
-        
-        return "\n".join(scss_parts)
+            self._generate_node_scss(child, scss_parts)
     
     def _generate_typescript(self, nodes: List[AngularNode]) -> str:
         """
@@ -571,67 +693,45 @@ class AngularGenerator:
         Returns:
             String con el código TypeScript
         """
-        ts_parts = [
-            "import { Component, OnInit } from '@angular/core';",
-        ]
-        
         # Añadir importaciones de Angular Material
-        if self.use_material and self.imports:
-            ts_parts.append("import {")
-            for imp in sorted(self.imports):
-                ts_parts.append(f"  {imp},")
-            ts_parts.append("} from '@angular/material';")
-        
-        ts_parts.append("")
-        ts_parts.append("@Component({")
-        ts_parts.append(f"  selector: '{self.component_selector}',")
-        ts_parts.append(f"  templateUrl: './{self.component_name}.component.html',")
-        ts_parts.append(f"  styleUrls: ['./{self.component_name}.component.scss']")
-        ts_parts.append("})")
-        ts_parts.append(f"export class {self._to_class_name(self.component_name)}Component implements OnInit {{")
-        
-        # Añadir propiedades para los elementos interactivos
-        has_form_elements = any(node.component_type in ["mat-form-field", "mat-select"] for node in self._collect_all_nodes(nodes))
-        
-        if has_form_elements:
-            ts_parts.append("  // Form model")
-            ts_parts.append("  formData = {")
-            ts_parts.append("    // Add form fields here")
-            ts_parts.append("  };")
-            ts_parts.append("")
-        
-        # Añadir método ngOnInit
-        ts_parts.append("  constructor() { }")
-        ts_parts.append("")
-        ts_parts.append("  ngOnInit(): void {")
-        ts_parts.append("    // Initialize component")
-        ts_parts.append("  }")
-        
-        # Si hay elementos interactivos, añadir métodos
-        if has_form_elements:
-            ts_parts.append("")
-            ts_parts.append("  onSubmit(): void {")
-            ts_parts.append("    // Handle form submission")
-            ts_parts.append("    console.log('Form submitted:', this.formData);")
-            ts_parts.append("  }")
-        
-        ts_parts.append("}")
-        
-        return "\n".join(ts_parts)
+        material_import = ""
+        if self.use_material and self._imports_mask:
+            modules = "".join(f"  {imp},\n" for imp in self.imports)
+            material_import = f"import {{\n{modules}}} from '@angular/material';\n"
+        
+        # Añadir propiedades y métodos para los elementos interactivos
+        has_form_elements = self._any_node(nodes, lambda node: node.component_type in _FORM_TYPES)
+        
+        return _TS_TEMPLATE.format(
+            material_import=material_import,
+            selector=self.component_selector,
+            name=self.component_name,
+            class_name=self._to_class_name(self.component_name),
+            form_model=_TS_FORM_MODEL if has_form_elements else "",
+            form_submit=_TS_FORM_SUBMIT if has_form_elements else ""
+        )
     
     def _to_class_name(self, kebab_name: str) -> str:
         """Convierte un nombre kebab-case a PascalCase para nombres de clase"""
-        return "".join(word.capitalize() for word in kebab_name.split("-"))
+        return _pascal_case(kebab_name)
     
-    def _collect_all_nodes(self, nodes: List[AngularNode]) -> List[AngularNode]:
-        """Recopila todos los nodos (incluidos los hijos) en una lista plana"""
-        all_nodes = []
-        
-        def collect_recursive(node_list):
-            for node in node_list:
-                all_nodes.append(node)
-                if node.children:
-                    collect_recursive(node.children)
-        
-        collect_recursive(nodes)
-        return all_nodes
\ No newline at end of file
+    def _any_node(self, nodes: List[AngularNode], predicate: Callable[[AngularNode], bool]) -> bool:
+        """Indica si algún nodo del árbol cumple el predicado; se detiene en el primero"""
+        stack = list(nodes)
+        while stack:
+            node = stack.pop()
+            if predicate(node):
+                return True
+            stack.extend(node.children)
+        return False
+
+
+# Registro de componentes Material soportados; los demás tipos mat-* se
+# generan como elementos estándar
+_MATERIAL_SPECS = {
+    "mat-button": MaterialSpec("button", ("MatButtonModule",), AngularGenerator._render_mat_button),
+    "mat-card": MaterialSpec("mat-card", ("MatCardModule",), AngularGenerator._render_mat_card),
+    "mat-form-field": MaterialSpec("mat-form-field", ("MatFormFieldModule",), AngularGenerator._render_mat_form_field),
+    "mat-select": MaterialSpec("mat-form-field", ("MatSelectModule", "MatFormFieldModule"), AngularGenerator._render_mat_select),
+    "mat-tab-group": MaterialSpec("mat-tab-group", ("MatTabsModule",), AngularGenerator._render_mat_tab_group),
+}
@@ -1,75 +1,298 @@
+import os
+import sys
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, BinaryIO, Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple, Union
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import json
 import requests
 from figma_api import FigmaAPI
 
-def export_to_json(figma_data, output_path="exported_figma.json"):
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
+try:
+    import ijson
+except ImportError:  # ijson is optional; streaming falls back to a full load
+    ijson = None
+
+# Seconds a fetched node structure is reused across Streamlit reruns
+STRUCTURE_CACHE_TTL = 300
+
+# Seconds to wait for style metadata once the file itself has been fetched
+STYLE_FETCH_TIMEOUT = 30
+
+# Pre-resolved so error paths don't repeat the attribute lookup
+_st_error = st.error
+
+# Shared read-only fallback for missing dict fields
+_EMPTY = {}
+
+# Node types extracted when the caller doesn't specify any
+_DEFAULT_NODE_TYPES = tuple(sys.intern(t) for t in ("FRAME", "RECTANGLE", "TEXT", "GROUP", "COMPONENT"))
+
+# Stdlib fallback encoder for exports when orjson is not installed
+_JSON_ENCODER = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False)
+
+# Document version last written to each export path
+_exported_versions = {}
+
+def _document_version(figma_data: Dict) -> Optional[Tuple[Any, Any, str]]:
+    """Return a key identifying the document revision and content, or None if unknown"""
+    version = figma_data.get("version")
+    if not version:
+        return None
+    # A node-scoped fetch shares the file's version, so the written document is
+    # hashed too; otherwise it could be skipped in place of the full file
+    document = figma_data.get("document", {})
+    if orjson is not None:
+        data = orjson.dumps(document)
+    else:
+        data = json.dumps(document, separators=(",", ":")).encode("utf-8")
+    return (version, figma_data.get("lastModified", ""), hashlib.blake2b(data, digest_size=16).hexdigest())
+
+def _write_json_value(f: BinaryIO, value: Any) -> None:
+    """Encode a value as JSON into a binary file"""
+    if orjson is not None:
+        f.write(orjson.dumps(value))
+    else:
+        # iterencode yields chunks, so the full text is never held in memory
+        for chunk in _JSON_ENCODER.iterencode(value):
+            f.write(chunk.encode('utf-8'))
+
+def export_to_json(figma_data: Dict, output_path: str = "exported_figma.json", pretty: bool = False) -> Optional[str]:
     """
     Export Figma data to a JSON file in a format suitable for .jam imports
     
     Args:
         figma_data (dict): The Figma file data
         output_path (str): Where to save the exported JSON
+        pretty (bool): Indent the output for debugging instead of writing it compact
         
     Returns:
         str: Path to the exported file
     """
     try:
-        # Prepare the data structure for .jam format
-        jam_data = {
-            "document": figma_data.get("document", {}),
-            "name": figma_data.get("name", "Figma Export"),
-            "lastModified": figma_data.get("lastModified", ""),
-            "version": figma_data.get("version", ""),
-            "exportSource": "FigmaToCode"
-        }
+        # Skip the export if this exact revision and document were already written there
+        version = _document_version(figma_data)
+        if version is not None:
+            version = (version, pretty)
+        if version is not None and _exported_versions.get(output_path) == version and os.path.exists(output_path):
+            return output_path
+        
+        if pretty:
+            # Indented output for debugging
+            jam_data = {
+                "document": figma_data.get("document", {}),
+                "name": figma_data.get("name", "Figma Export"),
+                "lastModified": figma_data.get("lastModified", ""),
+                "version": figma_data.get("version", ""),
+                "exportSource": "FigmaToCode"
+            }
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(jam_data, f, indent=2, ensure_ascii=False)
+        else:
+            # Write the .jam fields one by one (compact: .jam consumers don't need
+            # pretty-printing), encoding each value straight into the file
+            with open(output_path, 'wb') as f:
+                f.write(b'{"document":')
+                _write_json_value(f, figma_data.get("document", {}))
+                f.write(b',"name":')
+                _write_json_value(f, figma_data.get("name", "Figma Export"))
+                f.write(b',"lastModified":')
+                _write_json_value(f, figma_data.get("lastModified", ""))
+                f.write(b',"version":')
+                _write_json_value(f, figma_data.get("version", ""))
+                f.write(b',"exportSource":"FigmaToCode"}')
         
-        # Save to file
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(jam_data, f, indent=2)
+        if version is not None:
+            _exported_versions[output_path] = version
             
         return output_path
     except Exception as e:
-        st.error(f"Error exporting data: {str(e)}")
+        _st_error(f"Error exporting data: {str(e)}")
         return None
         
-def extract_specific_nodes(figma_data, node_types=None, max_depth=3):
+def extract_specific_nodes(figma_data: Union[Dict, str], node_types: Optional[Iterable[str]] = None,
+                           max_depth: int = 3, max_results: Optional[int] = None) -> List[Dict]:
     """
     Extract only specific node types from Figma data
     
     Args:
-        figma_data (dict): The Figma file data
+        figma_data (dict or str): The Figma file data, or the path of an exported JSON file
         node_types (list): List of node types to extract (e.g., ["FRAME", "TEXT"])
         max_depth (int): Maximum depth to traverse
+        max_results (int, optional): Stop traversing once this many nodes are found
         
     Returns:
         list: Extracted nodes of the specified types
     """
-    if node_types is None:
-        node_types = ["FRAME", "RECTANGLE", "TEXT", "GROUP", "COMPONENT"]
+    return list(islice(iter_specific_nodes(figma_data, node_types, max_depth), max_results))
+    
+def iter_specific_nodes(figma_data: Union[Dict, str], node_types: Optional[Iterable[str]] = None,
+                        max_depth: int = 3) -> Iterator[Dict]:
+    """
+    Lazily yield nodes of specific types from Figma data, in document order
+    
+    The traversal only advances as far as the caller consumes, so stopping early
+    (e.g. with itertools.islice) skips the rest of the tree.
+    
+    Args:
+        figma_data (dict or str): The Figma file data, or the path of an exported JSON file
+        node_types (list): List of node types to extract (e.g., ["FRAME", "TEXT"])
+        max_depth (int): Maximum depth to traverse
+        
+    Yields:
+        dict: Extracted nodes of the specified types
+    """
+    if isinstance(figma_data, str):
+        yield from extract_specific_nodes_streaming(figma_data, node_types, max_depth)
+        return
         
-    extracted_nodes = []
+    yield from _traverse_nodes(figma_data.get("document", {}), _node_type_set(node_types), max_depth)
     
-    def traverse_node(node, current_depth=0):
-        if current_depth > max_depth:
-            return
+def _node_type_set(node_types: Optional[Iterable[str]]) -> FrozenSet[str]:
+    """Normalize the requested node types into a frozenset of interned strings"""
+    if node_types is None:
+        node_types = _DEFAULT_NODE_TYPES
+    return frozenset(sys.intern(t) for t in node_types)
+    
+def _traverse_nodes(root: Dict, node_types: FrozenSet[str], max_depth: int) -> Iterator[Dict]:
+    """Iterative pre-order DFS yielding the nodes whose type is in node_types"""
+    stack = [(root, 0)]
+    pop = stack.pop
+    push = stack.extend
+    while stack:
+        node, depth = pop()
             
         # Check if this node matches the requested types
-        if "type" in node and node["type"] in node_types:
-            extracted_nodes.append(node)
+        node_type = node.get("type")
+        if node_type is not None and node_type in node_types:
+            yield node
             
-        # Traverse children
-        if "children" in node:
-            for child in node["children"]:
-                traverse_node(child, current_depth + 1)
+        # Push children in reverse so they are visited left to right
+        if depth < max_depth:
+            children = node.get("children")
+            if children:
+                push((child, depth + 1) for child in reversed(children))
     
-    # Start traversal from the document
-    document = figma_data.get("document", {})
-    traverse_node(document)
+def _iter_document_children(path: str) -> Iterator[Dict]:
+    """Yield the top-level children of the document one at a time"""
+    if ijson is None:
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from json.load(f).get("document", {}).get("children", [])
+        return
+        
+    with open(path, 'rb') as f:
+        builder = None
+        for prefix, event, value in ijson.parse(f, use_float=True):
+            if builder is not None:
+                builder.event(event, value)
+                # Only the top-level child's own end_map has this exact prefix
+                if prefix == "document.children.item" and event == "end_map":
+                    yield builder.value
+                    builder = None
+            elif prefix == "document.children.item" and event == "start_map":
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
     
-    return extracted_nodes
+def extract_specific_nodes_streaming(path: str, node_types: Optional[Iterable[str]] = None,
+                                     max_depth: int = 3) -> Iterator[Dict]:
+    """
+    Extract specific node types from an exported Figma JSON file without loading it whole
+    
+    Each top-level child of the document is materialized on its own and filtered,
+    so memory stays proportional to the largest page rather than the whole file.
+    The document root itself is never yielded.
+    
+    Args:
+        path (str): Path to the exported JSON file
+        node_types (list): List of node types to extract (e.g., ["FRAME", "TEXT"])
+        max_depth (int): Maximum depth to traverse
+        
+    Yields:
+        dict: Extracted nodes of the specified types, in document order
+    """
+    if max_depth < 1:
+        return
+        
+    node_types = _node_type_set(node_types)
+    for child in _iter_document_children(path):
+        # The child sits at depth 1, so its own subtree has one level less
+        yield from _traverse_nodes(child, node_types, max_depth - 1)
+    
+def _walk_frames(document: Dict, max_depth: int, frames_out: List[Dict], components_out: List[Dict]) -> None:
+    """
+    Collect frame summaries in a single pre-order pass, classifying them as
+    frames or components as they are found
+    """
+    # Node types reported by get_figma_node_structure, mapped to their bucket
+    append_to_bucket = {
+        "FRAME": frames_out.append,
+        "COMPONENT": components_out.append,
+        "COMPONENT_SET": components_out.append
+    }
+    
+    stack = [(document, 0)]
+    pop = stack.pop
+    push = stack.extend
+    while stack:
+        node, depth = pop()
+        
+        node_type = node.get("type")
+        append = append_to_bucket.get(node_type)
+        if append is not None:
+            bbox = node.get("absoluteBoundingBox") or _EMPTY
+            frame_data = {
+                "id": node.get("id", ""),
+                "name": node.get("name", "Untitled Frame"),
+                "type": node_type,
+                "width": bbox.get("width", 0),
+                "height": bbox.get("height", 0),
+                "childCount": len(node.get("children", [])),
+                "hasAutoLayout": "layoutMode" in node
+            }
+            append(frame_data)
+        
+        if depth < max_depth:
+            children = node.get("children")
+            if children:
+                push((child, depth + 1) for child in reversed(children))
+    
+@st.cache_data(ttl=STRUCTURE_CACHE_TTL, show_spinner=False)
+def _fetch_file_and_styles(_figma_api: FigmaAPI, access_token: str, file_key: str,
+                           node_id: Optional[str]) -> Tuple[Dict, Optional[Dict]]:
+    """
+    Fetch file data and style metadata, cached across reruns per token/file/node
     
-def get_figma_node_structure(figma_api, file_key, node_id=None):
+    Failures raise instead of returning None so they are never cached.
+    Both requests run concurrently: style metadata on a worker thread (sharing
+    the script context so its st.error calls still render) and the file here.
+    """
+    ctx = get_script_run_ctx()
+    executor = ThreadPoolExecutor(max_workers=1, initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx))
+    try:
+        styles_future = executor.submit(_figma_api.get_style_metadata, file_key)
+        file_data = _figma_api.get_file(file_key, node_id)
+        if file_data is None:
+            raise ValueError("Could not fetch the Figma file")
+        
+        # Style metadata is not critical, so continue even if it fails
+        try:
+            style_metadata = styles_future.result(timeout=STYLE_FETCH_TIMEOUT)
+        except Exception:
+            style_metadata = None
+    finally:
+        executor.shutdown(wait=False)
+    
+    return file_data, style_metadata
+    
+def get_figma_node_structure(figma_api: FigmaAPI, file_key: str, node_id: Optional[str] = None) -> Optional[Dict]:
     """
     Get a structured representation of Figma nodes similar to what v0/Lovable use
     
@@ -82,11 +305,8 @@ def get_figma_node_structure(figma_api, file_key, node_id=None):
         dict: Structured node data
     """
     try:
-        # Get the file data
-        file_data = figma_api.get_file(file_key, node_id)
-        
-        # Extract specific nodes
-        frames = extract_specific_nodes(file_data, ["FRAME", "COMPONENT", "COMPONENT_SET"], max_depth=2)
+        # Get the file data and style metadata (cached across reruns)
+        file_data, style_metadata = _fetch_file_and_styles(figma_api, figma_api.access_token, file_key, node_id)
         
         # Create a structure similar to what v0/Lovable might use
         structured_data = {
@@ -96,34 +316,15 @@ def get_figma_node_structure(figma_api, file_key, node_id=None):
             "styles": {}
         }
         
-        # Process frames
-        for frame in frames:
-            frame_data = {
-                "id": frame.get("id", ""),
-                "name": frame.get("name", "Untitled Frame"),
-                "type": frame.get("type", ""),
-                "width": frame.get("absoluteBoundingBox", {}).get("width", 0),
-                "height": frame.get("absoluteBoundingBox", {}).get("height", 0),
-                "childCount": len(frame.get("children", [])),
-                "hasAutoLayout": "layoutMode" in frame
-            }
-            
-            if frame["type"] == "COMPONENT" or frame["type"] == "COMPONENT_SET":
-                structured_data["components"].append(frame_data)
-            else:
-                structured_data["frames"].append(frame_data)
+        # Extract and classify frames in one pass
+        _walk_frames(file_data.get("document", {}), 2, structured_data["frames"], structured_data["components"])
                 
-        # Get style metadata if available
-        try:
-            style_metadata = figma_api.get_style_metadata(file_key)
-            if style_metadata and "meta" in style_metadata and "styles" in style_metadata["meta"]:
-                structured_data["styles"] = style_metadata["meta"]["styles"]
-        except:
-            # Style metadata is not critical, so continue even if it fails
-            pass
+        # Add style metadata if available
+        if style_metadata and "meta" in style_metadata and "styles" in style_metadata["meta"]:
+            structured_data["styles"] = style_metadata["meta"]["styles"]
             
         return structured_data
     
     except Exception as e:
-        st.error(f"Error getting node structure: {str(e)}")
+        _st_error(f"Error getting node structure: {str(e)}")
         return None
\ No newline at end of file
@@ -2,12 +2,301 @@ import os
 import streamlit as st
 import time
 import json
-from figma_api import FigmaAPI
-from code_generator import generate_angular_code
-from image_to_code import generate_angular_from_image
+import threading
+import hashlib
+import sqlite3
+import uuid
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from utils import save_file, read_file, validate_inputs
 from cost_estimator import estimate_cost
 
+def script_thread_pool(max_workers=1):
+    """Thread pool whose workers share the script context, so their st.* calls still render"""
+    ctx = get_script_run_ctx()
+    return ThreadPoolExecutor(
+        max_workers=max_workers,
+        initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx)
+    )
+
+# Seconds Figma responses are reused across reruns
+FIGMA_CACHE_TTL = 600
+
+# Seconds the debug "Test API Connection" call may take before failing
+API_TEST_TIMEOUT = 5
+
+class _UncachedResult(Exception):
+    """Raised inside a cached fetch to hand back a failed response without caching it"""
+    def __init__(self, value):
+        super().__init__()
+        self.value = value
+
+def _token_hash(token):
+    """Cache key for an access token, so the secret itself is never part of it"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+@st.cache_resource(show_spinner=False)
+def _cached_figma_client(token_hash, _access_token):
+    from figma_api import FigmaAPI
+    return FigmaAPI(_access_token)
+
+def figma_client(access_token):
+    """Long-lived Figma client for a token, reused across reruns along with its pooled session"""
+    return _cached_figma_client(_token_hash(access_token), access_token)
+
+@st.cache_data(ttl=FIGMA_CACHE_TTL, show_spinner=False)
+def _cached_get_file(file_key, node_id, token_hash, _figma_api):
+    file_data = _figma_api.get_file(file_key, node_id)
+    if not file_data:
+        raise _UncachedResult(file_data)
+    return file_data
+
+@st.cache_data(ttl=FIGMA_CACHE_TTL, show_spinner=False)
+def _cached_get_image_urls(file_key, ids, token_hash, _figma_api):
+    images = _figma_api.get_image_urls(file_key, list(ids))
+    if not images:
+        raise _UncachedResult(images)
+    return images
+
+def fetch_figma_file(figma_api, file_key, node_id):
+    """Get a Figma file, reusing successful responses across reruns"""
+    try:
+        return _cached_get_file(file_key, node_id, _token_hash(figma_api.access_token), figma_api)
+    except _UncachedResult as failed:
+        return failed.value
+
+def fetch_image_urls(figma_api, file_key, ids):
+    """Get image URLs for the given nodes, reusing successful responses across reruns"""
+    try:
+        return _cached_get_image_urls(file_key, tuple(ids), _token_hash(figma_api.access_token), figma_api)
+    except _UncachedResult as failed:
+        return failed.value
+
+def download_preview(url):
+    """Download the preview image in 64 KB chunks, releasing the connection as soon as it's read"""
+    import requests
+    with requests.get(url, stream=True, timeout=10) as response:
+        return b"".join(response.iter_content(65536))
+
+def show_preview_download(slot, preview_future):
+    """Fill the placeholder with the preview download button once the image has arrived"""
+    try:
+        st.session_state.preview_image = preview_future.result()
+        slot.download_button(
+            "Download Preview Image",
+            data=st.session_state.preview_image,
+            file_name="figma_preview.png",
+            mime="image/png"
+        )
+    except Exception as e:
+        slot.warning(f"Couldn't generate preview: {str(e)}")
+
+@st.cache_data(show_spinner=False)
+def cached_cost_estimate(node_limit, model, provider):
+    """Cost estimate for the sidebar; it only depends on its arguments"""
+    return estimate_cost(node_limit, model, provider=provider)
+
+# Conversion history lives on disk so session state doesn't hold every generated code.
+# Each session keeps its latest HISTORY_LIMIT items, and items from any session are
+# dropped after HISTORY_MAX_AGE_DAYS
+HISTORY_DB = "history.db"
+HISTORY_LIMIT = 20
+HISTORY_MAX_AGE_DAYS = 7
+
+def _history_connection():
+    conn = sqlite3.connect(HISTORY_DB)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS history "
+        "(ts TEXT, session_id TEXT, file_key TEXT, node_id TEXT, code TEXT)"
+    )
+    return conn
+
+def add_history_item(file_key, node_id, code):
+    """Record a conversion in this session's history, pruning items that can no longer be shown"""
+    now = time.time()
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
+    cutoff = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now - HISTORY_MAX_AGE_DAYS * 86400))
+    session_id = st.session_state.history_session_id
+    try:
+        with closing(_history_connection()) as conn, conn:
+            conn.execute(
+                "INSERT INTO history (ts, session_id, file_key, node_id, code) VALUES (?, ?, ?, ?, ?)",
+                (timestamp, session_id, file_key, node_id, code)
+            )
+            # Only the latest HISTORY_LIMIT items of a session are ever loaded
+            conn.execute(
+                "DELETE FROM history WHERE session_id = ? AND rowid NOT IN "
+                "(SELECT rowid FROM history WHERE session_id = ? ORDER BY rowid DESC LIMIT ?)",
+                (session_id, session_id, HISTORY_LIMIT)
+            )
+            # Sessions that ended long ago (timestamps sort as text)
+            conn.execute("DELETE FROM history WHERE ts < ?", (cutoff,))
+    except sqlite3.Error as e:
+        # The conversion itself succeeded; only the history entry is lost
+        st.warning(f"Couldn't save this conversion to the history: {str(e)}")
+
+def load_history():
+    """
+    Latest conversions of this session, newest first
+    
+    Items carry a `code_ref` instead of the code itself; use load_history_code to fetch it
+    """
+    try:
+        with closing(_history_connection()) as conn:
+            rows = conn.execute(
+                "SELECT rowid, ts, file_key, node_id FROM history WHERE session_id = ? ORDER BY rowid DESC LIMIT ?",
+                (st.session_state.history_session_id, HISTORY_LIMIT)
+            ).fetchall()
+    except sqlite3.Error as e:
+        # E.g. an unwritable working directory; the rest of the page still works
+        st.warning(f"Couldn't load the conversion history: {str(e)}")
+        return []
+    return [
+        {"timestamp": ts, "file_key": file_key, "node_id": node_id, "code_ref": code_ref}
+        for code_ref, ts, file_key, node_id in rows
+    ]
+
+def load_history_code(code_ref):
+    """Code of a single history item"""
+    try:
+        with closing(_history_connection()) as conn:
+            row = conn.execute("SELECT code FROM history WHERE rowid = ?", (code_ref,)).fetchone()
+    except sqlite3.Error as e:
+        st.warning(f"Couldn't load this history item: {str(e)}")
+        return ""
+    return row[0] if row else ""
+
+def content_digest(content):
+    """Short fingerprint used to tell whether generated content changed between reruns"""
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).digest()
+
+def set_generated_code(code):
+    """Store newly generated code along with its digest, computed once per generation"""
+    st.session_state.generated_code = code
+    st.session_state.generated_code_digest = content_digest(code)
+
+def save_file_if_changed(file_path, content, digest=None):
+    """
+    Write the file only if this session hasn't already written the same content to it
+    
+    `digest` can be passed when the content's fingerprint is already known
+    """
+    if digest is None:
+        digest = content_digest(content)
+    saved_digests = st.session_state.setdefault("saved_file_digests", {})
+    if saved_digests.get(file_path) != digest:
+        if save_file(file_path, content):
+            saved_digests[file_path] = digest
+
+def set_env_if_changed(name, value):
+    """Update an environment variable only when its value actually changes"""
+    if os.environ.get(name) != value:
+        os.environ[name] = value
+
+def apply_api_keys(openai_api_key, azure_api_key):
+    """Expose the submitted API keys to the generators through the environment"""
+    set_env_if_changed("OPENAI_API_KEY", openai_api_key)
+    if azure_api_key:
+        set_env_if_changed("AZURE_OPENAI_API_KEY", azure_api_key)
+
+# Markers that delimit each file in the generated code
+HTML_MARKER = "<!-- component.html -->"
+SCSS_MARKER = "/* component.scss */"
+
+def split_preview_code(code):
+    """
+    Extract the HTML and SCSS parts of the generated code for the preview
+    
+    Returns:
+        tuple: (html_code, scss_code); html_code is None if the HTML can't be delimited
+    """
+    html_start = code.find(HTML_MARKER)
+    scss_start = code.find(SCSS_MARKER)
+    
+    # If scss not found, the HTML ends at the next code block
+    html_end = scss_start if scss_start != -1 else code.find("\n\n", html_start + 20)
+    if html_end <= html_start:
+        return None, ""
+    
+    html_code = code[html_start:html_end].strip().replace(HTML_MARKER, "").strip()
+    scss_code = code[scss_start:].replace(SCSS_MARKER, "").strip() if scss_start != -1 else ""
+    return html_code, scss_code
+
+# Static skeleton of the preview page, filled with the generated HTML and SCSS
+PREVIEW_TEMPLATE = """
+                    <!DOCTYPE html>
+                    <html>
+                    <head>
+                        <meta charset="UTF-8">
+                        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+                        <title>Angular Component Preview</title>
+                        <!-- Include fonts if needed -->
+                        <link href="https://fonts.googleapis.com/css2?family=Roboto:wght@300;400;500;700&display=swap" rel="stylesheet">
+                        <link href="https://fonts.googleapis.com/css2?family=Material+Icons&display=swap" rel="stylesheet">
+                        <!-- Base styles to improve rendering -->
+                        <style>
+                            body {{
+                                font-family: 'Roboto', Arial, sans-serif;
+                                margin: 0;
+                                padding: 0;
+                                box-sizing: border-box;
+                                background-color: #f5f5f5;
+                            }}
+                            .component-preview {{
+                                background-color: white;
+                                padding: 20px;
+                                border-radius: 8px;
+                                box-shadow: 0 2px 10px rgba(0, 0, 0, 0.1);
+                                margin: 20px auto;
+                                max-width: 1200px;
+                                overflow: auto;
+                            }}
+                            /* Angular Material mock styles */
+                            .mat-button {{
+                                display: inline-block;
+                                padding: 8px 16px;
+                                border-radius: 4px;
+                                background-color: #3f51b5;
+                                color: white;
+                                font-weight: 500;
+                                text-align: center;
+                                text-decoration: none;
+                                cursor: pointer;
+                            }}
+                            .mat-card {{
+                                background-color: #fff;
+                                border-radius: 4px;
+                                box-shadow: 0 2px 1px -1px rgba(0,0,0,.2), 0 1px 1px 0 rgba(0,0,0,.14), 0 1px 3px 0 rgba(0,0,0,.12);
+                                padding: 16px;
+                                margin-bottom: 16px;
+                            }}
+                            /* Custom SCSS from generated code */
+                            {scss_code}
+                        </style>
+                    </head>
+                    <body>
+                        <div class="component-preview">
+                            {html_code}
+                        </div>
+                    </body>
+                    </html>
+                    """
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def build_preview_html(code_digest, _code):
+    """
+    Build the preview page for the generated code, or None if its HTML can't be extracted
+    
+    Cached on the code's digest so reruns don't hash the whole code again
+    """
+    html_code, scss_code = split_preview_code(_code)
+    if html_code is None:
+        return None
+    
+    # Create a preview HTML with the styles and enhanced display
+    return PREVIEW_TEMPLATE.format(scss_code=scss_code, html_code=html_code)
+
 # Set page configuration
 st.set_page_config(
     page_title="FigmaToCode - Convert Figma Designs to Angular",
@@ -18,8 +307,11 @@ st.set_page_config(
 # Initialize session state variables
 if 'generated_code' not in st.session_state:
     st.session_state.generated_code = ""
-if 'conversion_history' not in st.session_state:
-    st.session_state.conversion_history = []
+    st.session_state.generated_code_digest = b""
+if 'history_session_id' not in st.session_state:
+    st.session_state.history_session_id = uuid.uuid4().hex
+    # History items whose code the user asked to see
+    st.session_state.shown_history = set()
 if 'file_key' not in st.session_state:
     st.session_state.file_key = ""
 if 'node_id' not in st.session_state:
@@ -28,6 +320,11 @@ if 'access_token' not in st.session_state:
     st.session_state.access_token = ""
 if 'preview_url' not in st.session_state:
     st.session_state.preview_url = ""
+if 'preview_image' not in st.session_state:
+    st.session_state.preview_image = b""
+if 'io_pool' not in st.session_state:
+    # Per-session pool for downloads that shouldn't block the script
+    st.session_state.io_pool = ThreadPoolExecutor(max_workers=4)
 if 'debug_info' not in st.session_state:
     st.session_state.debug_info = {
         "token_count": 0,
@@ -35,6 +332,14 @@ if 'debug_info' not in st.session_state:
     }
 if 'show_debug' not in st.session_state:
     st.session_state.show_debug = False
+if 'env_defaults' not in st.session_state:
+    # Widget defaults taken from the environment, read once per session
+    st.session_state.env_defaults = {
+        name: os.environ[name]
+        for name in ("OPENAI_API_KEY", "AZURE_OPENAI_API_KEY", "ACCESS_TOKEN")
+        if name in os.environ
+    }
+env_defaults = st.session_state.env_defaults
 
 # Main page header
 st.title("🎨 FigmaToCode")
@@ -51,7 +356,7 @@ with st.sidebar:
         # Standard OpenAI API Key
         openai_api_key = st.text_input(
             "OpenAI API Key", 
-            value=os.environ.get("OPENAI_API_KEY", ""),
+            value=env_defaults.get("OPENAI_API_KEY", ""),
             type="password",
             help="Your OpenAI API key to use for code generation"
         )
@@ -69,7 +374,7 @@ with st.sidebar:
         # Azure OpenAI API settings
         azure_api_key = st.text_input(
             "Azure OpenAI API Key",
-            value=os.environ.get("AZURE_OPENAI_API_KEY", ""),
+            value=env_defaults.get("AZURE_OPENAI_API_KEY", ""),
             type="password",
             help="Your Azure OpenAI API key"
         )
@@ -92,7 +397,7 @@ with st.sidebar:
     st.subheader("Figma Settings")
     access_token = st.text_input(
         "Figma Access Token", 
-        value=os.environ.get("ACCESS_TOKEN", st.session_state.access_token),
+        value=env_defaults.get("ACCESS_TOKEN", st.session_state.access_token),
         type="password",
         help="Your Figma personal access token"
     )
@@ -108,22 +413,25 @@ with st.sidebar:
         help="Limit the number of nodes to process (higher = more complete design but higher cost)"
     )
     
+    use_cache = st.checkbox(
+        "Reuse cached responses",
+        value=True,
+        help="Return the earlier result when the same design is converted again with the same settings. Turn off to get a fresh generation."
+    )
+    
     # Store model choice in session state
-    selected_model = azure_model if azure_api_key and azure_endpoint and azure_model else openai_model
+    use_azure_pricing = bool(azure_api_key and azure_endpoint and azure_model)
+    selected_model = azure_model if use_azure_pricing else openai_model
     
     # Show cost estimate
     if node_limit > 0:
-        cost_estimate = estimate_cost(node_limit, selected_model)
+        cost_estimate = cached_cost_estimate(node_limit, selected_model, "azure" if use_azure_pricing else "openai")
         st.info(f"Estimated cost: {cost_estimate['formatted_total']} USD")
         with st.expander("Cost details"):
             st.write(f"Model: {cost_estimate['model']}")
             st.write(f"Input tokens: {cost_estimate['input_tokens']} (${cost_estimate['input_cost']:.4f})")
             st.write(f"Output tokens: {cost_estimate['output_tokens']} (${cost_estimate['output_cost']:.4f})")
             st.write(f"Total cost: ${cost_estimate['total_cost']:.4f}")
-            
-    # Set environment variables
-    if azure_api_key:
-        os.environ["AZURE_OPENAI_API_KEY"] = azure_api_key
     
     # Instructions
     st.markdown("---")
@@ -160,36 +468,40 @@ with col1:
     if input_method == "Figma API":
         st.subheader("Figma Design Input")
         
-        # File Key and Node ID inputs
-        file_key = st.text_input(
-            "Figma File Key",
-            value=st.session_state.file_key,
-            help="The key in the URL after /file/ (e.g., figma.com/file/**key**/...)"
-        )
-        
-        node_id = st.text_input(
-            "Node ID (Optional)",
-            value=st.session_state.node_id,
-            help="ID of specific node to convert (leave empty for entire file)"
-        )
-        
-        if not st.session_state.access_token:
-            st.warning("⚠️ Please set your Figma Personal Access Token in the sidebar")
-        
-        # Design specifications and details
-        st.subheader("Design Specifications")
-        
-        # Options for responsiveness and additional features
-        responsive = st.checkbox("Generate Responsive Layout", value=True)
-        
-        additional_instructions = st.text_area(
-            "Additional Instructions",
-            placeholder="Describe any specific styling, behavior, or features you want in the generated Angular components...",
-            height=150
-        )
+        # Inputs are grouped in a form so typing doesn't rerun the script until submitted
+        with st.form("figma_form"):
+            # File Key and Node ID inputs
+            file_key = st.text_input(
+                "Figma File Key",
+                value=st.session_state.file_key,
+                help="The key in the URL after /file/ (e.g., figma.com/file/**key**/...)"
+            )
+            
+            node_id = st.text_input(
+                "Node ID (Optional)",
+                value=st.session_state.node_id,
+                help="ID of specific node to convert (leave empty for entire file)"
+            )
+            
+            if not st.session_state.access_token:
+                st.warning("⚠️ Please set your Figma Personal Access Token in the sidebar")
+            
+            # Design specifications and details
+            st.subheader("Design Specifications")
+            
+            # Options for responsiveness and additional features
+            responsive = st.checkbox("Generate Responsive Layout", value=True)
+            
+            additional_instructions = st.text_area(
+                "Additional Instructions",
+                placeholder="Describe any specific styling, behavior, or features you want in the generated Angular components...",
+                height=150
+            )
+            
+            # Conversion button
+            submitted = st.form_submit_button("Convert to Angular")
         
-        # Conversion button
-        if st.button("Convert to Angular"):
+        if submitted:
             # Validate Figma API inputs
             valid, error_message = validate_inputs(file_key, access_token, openai_api_key)
             
@@ -202,36 +514,38 @@ with col1:
                 st.session_state.access_token = access_token
                 
                 # Set environment variables for API keys
-                os.environ["OPENAI_API_KEY"] = openai_api_key
+                apply_api_keys(openai_api_key, azure_api_key)
                 
                 # Show progress
                 with st.spinner("Fetching design from Figma..."):
                     # Initialize Figma API
-                    figma_api = FigmaAPI(access_token)
+                    figma_api = figma_client(access_token)
                     
                     try:
-                        # Get Figma file data
-                        file_data = figma_api.get_file(file_key, node_id)
+                        # Get Figma file data; when the node is known up front, its
+                        # preview URL is requested at the same time
+                        with script_thread_pool() as pool:
+                            images_future = pool.submit(fetch_image_urls, figma_api, file_key, [node_id]) if node_id else None
+                            file_data = fetch_figma_file(figma_api, file_key, node_id)
                         
                         if file_data:
                             # Show a preview of the design
+                            preview_future = None
                             try:
                                 # Get the first node ID if not specified
                                 preview_node_id = node_id if node_id else file_data["document"]["id"]
-                                images = figma_api.get_image_urls(file_key, [preview_node_id])
+                                images = images_future.result() if images_future else fetch_image_urls(figma_api, file_key, [preview_node_id])
                                 
                                 if images and preview_node_id in images:
                                     st.session_state.preview_url = images[preview_node_id]
                                     st.success("Preview obtained successfully!")
                                     
-                                    # Download button for the preview image
-                                    import requests
-                                    st.download_button(
-                                        "Download Preview Image",
-                                        data=requests.get(st.session_state.preview_url).content,
-                                        file_name="figma_preview.png",
-                                        mime="image/png"
+                                    # Download the image in the background while the code is generated;
+                                    # its download button goes in this placeholder
+                                    preview_future = st.session_state.io_pool.submit(
+                                        download_preview, st.session_state.preview_url
                                     )
+                                    preview_download_slot = st.empty()
                                 else:
                                     st.warning("Preview not available for this node")
                             except Exception as e:
@@ -243,45 +557,44 @@ with col1:
                                 st.image(st.session_state.preview_url, use_container_width=True)
                             
                             # Continue with code generation
-                            # Progress indicator for code generation
-                            with st.spinner("Generating Angular components..."):
-                                # Determine which API to use
-                                use_azure = bool(azure_api_key and azure_endpoint and azure_model)
-                                
-                                # Import the mixed approach generator
-                                from enhanced_generator import process_figma_with_mixed_approach
-                                
-                                # Generate Angular code using the mixed approach
-                                code = process_figma_with_mixed_approach(
-                                    file_data,
-                                    openai_api_key=openai_api_key,
-                                    responsive=responsive,
-                                    additional_instructions=additional_instructions,
-                                    use_azure=use_azure,
-                                    azure_endpoint=azure_endpoint,
-                                    azure_model=azure_model,
-                                    node_limit=node_limit,
-                                    openai_model=openai_model,
-                                    use_material=use_material
-                                )
-                                
-                                # Save generated code
-                                st.session_state.generated_code = code
-                                
-                                # Add to conversion history
-                                timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-                                history_item = {
-                                    "timestamp": timestamp,
-                                    "file_key": file_key,
-                                    "node_id": node_id,
-                                    "code": code
-                                }
-                                st.session_state.conversion_history.insert(0, history_item)
-                                
-                                # Save to file
-                                save_file("output_angular.txt", code)
-                                
-                                st.success("Angular components generated successfully!")
+                            try:
+                                # Progress indicator for code generation
+                                with st.spinner("Generating Angular components..."):
+                                    # Determine which API to use
+                                    use_azure = bool(azure_api_key and azure_endpoint and azure_model)
+                                    
+                                    # Import the mixed approach generator
+                                    from enhanced_generator import process_figma_with_mixed_approach
+                                    
+                                    # Generate Angular code using the mixed approach
+                                    code = process_figma_with_mixed_approach(
+                                        file_data,
+                                        openai_api_key=openai_api_key,
+                                        responsive=responsive,
+                                        additional_instructions=additional_instructions,
+                                        use_azure=use_azure,
+                                        azure_endpoint=azure_endpoint,
+                                        azure_model=azure_model,
+                                        node_limit=node_limit,
+                                        openai_model=openai_model,
+                                        use_material=use_material,
+                                        use_cache=use_cache
+                                    )
+                                    
+                                    # Save generated code
+                                    set_generated_code(code)
+                                    
+                                    # Add to conversion history
+                                    add_history_item(file_key, node_id, code)
+                                    
+                                    # Save to file
+                                    save_file_if_changed("output_angular.txt", code, st.session_state.generated_code_digest)
+                                    
+                                    st.success("Angular components generated successfully!")
+                            finally:
+                                # The preview download ran alongside code generation
+                                if preview_future is not None:
+                                    show_preview_download(preview_download_slot, preview_future)
                         else:
                             st.error("Failed to retrieve Figma file data. Please check your file key and access token.")
                     
@@ -313,11 +626,14 @@ with col1:
             elif not uploaded_file:
                 st.error("Please upload an image file")
             else:
-                os.environ["OPENAI_API_KEY"] = openai_api_key
+                apply_api_keys(openai_api_key, azure_api_key)
+                
+                # Read the upload once; the same bytes are displayed and sent to the model
+                image_bytes = uploaded_file.getvalue()
                 
                 # Display the uploaded image
                 st.subheader("Uploaded Design")
-                st.image(uploaded_file, use_container_width=True)
+                st.image(image_bytes, use_container_width=True)
                 
                 # Process the image
                 with st.spinner("Generating Angular components from image..."):
@@ -325,32 +641,29 @@ with col1:
                     use_azure = bool(azure_api_key and azure_endpoint and azure_model)
                     
                     try:
+                        # Import the image generator (pulls in Pillow and the OpenAI client)
+                        from image_to_code import generate_angular_from_image
+                        
                         # Generate Angular code from image
                         code = generate_angular_from_image(
-                            uploaded_file,
+                            image_bytes,
                             responsive=responsive_img,
                             additional_instructions=additional_instructions_img,
                             use_azure=use_azure,
                             azure_endpoint=azure_endpoint,
                             azure_model=azure_model,
-                            openai_model=openai_model
+                            openai_model=openai_model,
+                            use_cache=use_cache
                         )
                         
                         # Save generated code
-                        st.session_state.generated_code = code
+                        set_generated_code(code)
                         
                         # Add to conversion history
-                        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-                        history_item = {
-                            "timestamp": timestamp,
-                            "file_key": "image_upload",
-                            "node_id": "",
-                            "code": code
-                        }
-                        st.session_state.conversion_history.insert(0, history_item)
+                        add_history_item("image_upload", "", code)
                         
                         # Save to file
-                        save_file("output_angular.txt", code)
+                        save_file_if_changed("output_angular.txt", code, st.session_state.generated_code_digest)
                         
                         st.success("Angular components generated successfully from image!")
                     except Exception as e:
@@ -380,87 +693,12 @@ with col2:
     with preview_tab:
         # Show a preview of the generated HTML
         if st.session_state.generated_code:
-            # Extract the HTML part from the code
-            html_start = st.session_state.generated_code.find("<!-- component.html -->")
-            if html_start != -1:
-                html_end = st.session_state.generated_code.find("/* component.scss */") if "/* component.scss */" in st.session_state.generated_code else -1
-                if html_end == -1:  # If scss not found, try to find next code block
-                    html_end = st.session_state.generated_code.find("\n\n", html_start + 20)
-                
-                # Extract HTML code
-                if html_end > html_start:
-                    html_code = st.session_state.generated_code[html_start:html_end].strip()
-                    html_code = html_code.replace("<!-- component.html -->", "").strip()
-                    
-                    # Extract SCSS styles
-                    scss_start = st.session_state.generated_code.find("/* component.scss */")
-                    if scss_start != -1:
-                        scss_code = st.session_state.generated_code[scss_start:].replace("/* component.scss */", "").strip()
-                    else:
-                        scss_code = ""
-                    
-                    # Create a preview HTML with the styles and enhanced display
-                    preview_html = f"""
-                    <!DOCTYPE html>
-                    <html>
-                    <head>
-                        <meta charset="UTF-8">
-                        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                        <title>Angular Component Preview</title>
-                        <!-- Include fonts if needed -->
-                        <link href="https://fonts.googleapis.com/css2?family=Roboto:wght@300;400;500;700&display=swap" rel="stylesheet">
-                        <link href="https://fonts.googleapis.com/css2?family=Material+Icons&display=swap" rel="stylesheet">
-                        <!-- Base styles to improve rendering -->
-                        <style>
-                            body {{
-                                font-family: 'Roboto', Arial, sans-serif;
-                                margin: 0;
-                                padding: 0;
-                                box-sizing: border-box;
-                                background-color: #f5f5f5;
-                            }}
-                            .component-preview {{
-                                background-color: white;
-                                padding: 20px;
-                                border-radius: 8px;
-                                box-shadow: 0 2px 10px rgba(0, 0, 0, 0.1);
-                                margin: 20px auto;
-                                max-width: 1200px;
-                                overflow: auto;
-                            }}
-                            /* Angular Material mock styles */
-                            .mat-button {{
-                                display: inline-block;
-                                padding: 8px 16px;
-                                border-radius: 4px;
-                                background-color: #3f51b5;
-                                color: white;
-                                font-weight: 500;
-                                text-align: center;
-                                text-decoration: none;
-                                cursor: pointer;
-                            }}
-                            .mat-card {{
-                                background-color: #fff;
-                                border-radius: 4px;
-                                box-shadow: 0 2px 1px -1px rgba(0,0,0,.2), 0 1px 1px 0 rgba(0,0,0,.14), 0 1px 3px 0 rgba(0,0,0,.12);
-                                padding: 16px;
-                                margin-bottom: 16px;
-                            }}
-                            /* Custom SCSS from generated code */
-                            {scss_code}
-                        </style>
-                    </head>
-                    <body>
-                        <div class="component-preview">
-                            {html_code}
-                        </div>
-                    </body>
-                    </html>
-                    """
-                    
+            # Extract the HTML part from the code and build the preview (cached per code)
+            if HTML_MARKER in st.session_state.generated_code:
+                preview_html = build_preview_html(st.session_state.generated_code_digest, st.session_state.generated_code)
+                if preview_html is not None:
                     # Save the preview HTML to a file
-                    save_file("output.html", preview_html)
+                    save_file_if_changed("output.html", preview_html, st.session_state.generated_code_digest)
                     
                     # Display preview using HTML component
                     st.components.v1.html(preview_html, height=600, scrolling=True)
@@ -481,14 +719,23 @@ with col2:
     
     with history_tab:
         # Show conversion history
-        if st.session_state.conversion_history:
-            for i, item in enumerate(st.session_state.conversion_history):
-                with st.expander(f"{item['timestamp']} - {item['file_key']}"):
-                    st.code(item['code'], language="typescript")
+        conversion_history = load_history()
+        if conversion_history:
+            for i, item in enumerate(conversion_history):
+                code_ref = item['code_ref']
+                with st.expander(f"{item['timestamp']} - {item['file_key']}", expanded=False):
+                    # Expanders render their content even when collapsed, so load the code on demand
+                    if code_ref not in st.session_state.shown_history:
+                        if not st.button("Show", key=f"show_history_{code_ref}"):
+                            continue
+                        st.session_state.shown_history.add(code_ref)
+                    
+                    history_code = load_history_code(code_ref)
+                    st.code(history_code, language="typescript")
                     
                     st.download_button(
                         f"Download #{i+1}",
-                        item['code'],
+                        history_code,
                         file_name=f"figma_angular_{i+1}.txt",
                         mime="text/plain"
                     )
@@ -557,9 +804,10 @@ if st.session_state.show_debug:
     if st.button("Test API Connection"):
         try:
             if openai_api_key:
-                import openai
-                openai.api_key = openai_api_key
-                response = openai.chat.completions.create(
+                from openai import OpenAI
+                # Fail fast instead of blocking the script on retries and the default timeout
+                client = OpenAI(api_key=openai_api_key, timeout=API_TEST_TIMEOUT, max_retries=0)
+                response = client.chat.completions.create(
                     model="gpt-3.5-turbo",
                     messages=[{"role": "user", "content": "Hello!"}],
                     max_tokens=5
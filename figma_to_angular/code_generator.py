@@ -1,14 +1,598 @@
 import os
+import re
+import json
+import hashlib
+import shelve
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from itertools import islice
+from json.decoder import scanstring
+import numpy as np
 import openai
+import tiktoken
 from openai import OpenAI, AzureOpenAI
 import streamlit as st
-from utils import extract_nodes, flatten_figma_tree
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from utils import extract_nodes, iter_figma_tree
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
+# Note: API clients are looked up on each call with the current environment
+# variables and settings, and shared by calls that use the same ones
+
+# Text style properties kept in the simplified nodes sent to the model
+STYLE_KEYS = frozenset({
+    "fontFamily", "fontSize", "fontWeight",
+    "textAlignHorizontal", "textAlignVertical"
+})
+
+# Nodes included in the standard OpenAI prompt
+MAX_PROMPT_NODES = 100
+
+# Solid fills from which color channels are scaled with NumPy instead of one by one
+VECTORIZE_MIN_COLORS = 64
+
+# Fenced code blocks in the model's response and the component file each one holds;
+# the last block may lack its closing fence when the response hit max_tokens
+_FENCE_RE = re.compile(r"```(typescript|ts|html|scss|css)\s*\n(.*?)(?:```|\Z)", re.DOTALL)
+_FENCE_FILES = {
+    "typescript": "ts",
+    "ts": "ts",
+    "html": "html",
+    "scss": "scss",
+    "css": "scss",
+}
+
+# Key that opens each file's string in a JSON response
+_JSON_FILE_KEY_RE = re.compile(r'"(ts|html|scss)"\s*:\s*"')
+
+# Component files in output order: (file, header, separator after the code)
+_COMPONENT_FILES = (
+    ("ts", "// component.ts\n", "\n\n"),
+    ("html", "<!-- component.html -->\n", "\n\n"),
+    ("scss", "/* component.scss */\n", "\n"),
+)
+
+# Attempts for a generation request that times out, can't connect, is rate
+# limited or gets a transient server error, and the wait before the first retry (doubled after each failure)
+REQUEST_ATTEMPTS = 3
+RETRY_BACKOFF = 0.5
+
+# Output limit for the one retry of a JSON response cut off at max_tokens
+# (the most gpt-4o and gpt-4o-mini can return)
+RETRY_MAX_TOKENS = 16384
+
+# Responses reused for identical requests: an in-memory LRU, optionally backed by
+# a file under ~/.cache (set FIGMA_TO_ANGULAR_RESPONSE_CACHE=1 to keep responses
+# across restarts; nothing is written to disk otherwise)
+RESPONSE_CACHE_SIZE = 32
+RESPONSE_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "figma2code", "responses")
+PERSIST_RESPONSES = os.environ.get("FIGMA_TO_ANGULAR_RESPONSE_CACHE", "0") == "1"
+_response_cache = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+# Opt-in cache of responses for near-duplicate designs, matched by the cosine
+# similarity of an embedding of each design's fingerprint
+EMBEDDING_MODEL = "text-embedding-3-small"
+SEMANTIC_CACHE_SIZE = 64
+_semantic_cache = []  # (scope, unit embedding, response)
+
+
+# Static parts of the prompts, built once; only the design data is filled in per call
+SYSTEM_MESSAGE = "You are an expert Angular developer specializing in converting Figma designs to Angular components with TypeScript, HTML templates, and SCSS styles."
+
+AZURE_PROMPT_TEMPLATE = """You are an expert Angular developer converting a Figma design to Angular components (TypeScript, HTML templates, and SCSS styles).
 
-# Note: we'll initialize the API clients as needed inside the function
-# to ensure we always use the current environment variables and settings
+Design Summary:
+{design_summary}
+
+Extract from design:
+- Colors: {colors}
+- Fonts: {fonts}
+- Element Types: {element_types}
+
+Requirements:
+1. Generate complete, valid Angular component code based on the design.
+2. Create THREE files:
+   - component.ts (TypeScript class with @Component decorator)
+   - component.html (Angular template)
+   - component.scss (SCSS styles)
+3. {responsive_text}
+4. Use Angular best practices including:
+   - Proper component structure and annotations
+   - Reactive approach for data handling (no template forms)
+   - TypeScript interfaces for data models
+   - Angular Material components where appropriate
+5. Ensure semantic HTML with appropriate tags.
+6. Use modern SCSS techniques with variables for colors and dimensions.
+7. Implement responsive design with Angular Flex Layout or CSS Grid/Flexbox.
+8. Use Angular routing for navigation elements when appropriate.
+9. Organize and comment your code for clarity.
+10. Ensure fonts are properly imported in the styles.
+11. Create reusable sub-components when appropriate.
+
+{additional_instructions}
+
+FIGMA DESIGN NODES (SIMPLIFIED):
+{simplified_nodes}
+
+Return the complete Angular component files. Include all three files (TS, HTML, SCSS) in the response, each in its own code block.
+"""
+
+# Static head of the enhanced prompt. It carries no design values, so the system
+# message plus this text form an identical prefix across requests and providers
+# can reuse their prompt cache; everything that varies goes in the data block below.
+ENHANCED_PROMPT_HEAD = """You are a senior Angular developer tasked with PERFECTLY recreating a Figma design in code.
+
+IMPORTANT: Your objective is PIXEL-PERFECT recreation of the design given in the DESIGN DATA section at the end, with exact colors, spacing, typography, and layout.
+
+EXACT DESIGN DETAILS
+====================
+
+Colors:
+- Document all colors exactly as they appear in HEX format, using the colors listed in the design data
+
+Typography:
+- Use the fonts listed in the design data
+- Maintain exact font sizes, weights, and line heights from the design
+
+Layout:
+- Preserve all spacing, padding, and margins exactly as shown
+- Maintain the precise grid structure shown in the design
+- Keep the same vertical and horizontal alignment of elements
+
+Elements:
+- Cards should have the exact same corner radius as in the design
+- Buttons should match the design's exact styling (borders, shadows, etc.)
+- Icons must be positioned and sized exactly as shown
+
+Content:
+- Text content must be identical to what appears in the design
+- Maintain the same text formatting (bold, italic, etc.)
+
+Design Notes:
+- Pay special attention to color gradients or shadows if present
+- Reproduce any hover states or interactive elements faithfully
+- Ensure the responsive behavior maintains the design's integrity at different screen sizes
+
+STRICT REQUIREMENTS:
+1. Create THREE complete files matching the design EXACTLY:
+   - component.ts (TypeScript class with @Component decorator)
+   - component.html (Angular template with EXACT structure matching design)
+   - component.scss (SCSS with PRECISE styling matching design)
+2. Follow the layout approach given in the design data
+3. Follow Angular best practices
+4. Use semantic HTML (section, article, nav, etc. as appropriate)
+5. Use CSS Grid AND Flexbox for layout as needed
+6. Match ALL visual details: colors, fonts, spacing, borders, shadows, etc.
+7. Do not substitute or simplify ANY visual elements
+8. Include ALL text content exactly as shown in the design
+9. Generate ALL necessary CSS for the layout to work properly
+10. Follow the additional instructions given in the design data, if any
+
+CRITICAL: Compare your work to the design multiple times during creation. Your code must reproduce the design exactly as shown, including all visual details, layout, and styling.
+
+Return the complete Angular component files as a JSON object with exactly the keys "ts", "html" and "scss", each holding the full content of that file.
+"""
+
+# Dynamic tail of the enhanced prompt, appended after ENHANCED_PROMPT_HEAD
+ENHANCED_PROMPT_DATA_TEMPLATE = """
+DESIGN DATA
+===========
+
+Layout approach: {responsive_text}
+
+Additional instructions: {additional_instructions}
+
+Design Summary:
+{design_summary}
+
+Extract from design:
+- Colors: {colors}
+- Fonts: {fonts}
+- Element Types: {element_types}
+
+{node_note}
+
+FIGMA DESIGN NODES (SIMPLIFIED):
+{simplified_nodes}
+"""
+
+# Placeholder component returned when generation fails; `error` is shown in the
+# comment and `error_js` (without single quotes) in the TypeScript string literal
+ERROR_COMPONENT_TEMPLATE = """
+// Error in Angular component generation
+
+/**
+ * ERROR DETAILS
+ * -------------
+ * {error}
+ */
+
+// component.ts
+import {{ Component, OnInit }} from '@angular/core';
+
+@Component({{
+  selector: 'app-error',
+  templateUrl: './error.component.html',
+  styleUrls: ['./error.component.scss']
+}})
+export class ErrorComponent implements OnInit {{
+  errorMessage = '{error_js}';
+  
+  constructor() {{ }}
+  
+  ngOnInit(): void {{
+    console.error('Error generating Angular code:', this.errorMessage);
+  }}
+}}
+
+<!-- component.html -->
+<div class="error-container">
+  <h1>Error Generating Angular Code</h1>
+  <div class="error-message">
+    <p>An error occurred while generating the Angular components:</p>
+    <pre>{{errorMessage}}</pre>
+  </div>
+  <p>Please check your API configuration and try again.</p>
+</div>
+
+/* component.scss */
+.error-container {{
+  font-family: Arial, sans-serif;
+  padding: 20px;
+  max-width: 800px;
+  margin: 0 auto;
+}}
+
+.error-message {{
+  color: #d32f2f;
+  background: #ffebee;
+  padding: 15px;
+  border-radius: 4px;
+  margin: 20px 0;
+}}
+
+pre {{
+  white-space: pre-wrap;
+  word-break: break-all;
+  background: #f5f5f5;
+  padding: 10px;
+  border-radius: 4px;
+}}
+"""
+
+
+@lru_cache(maxsize=8)
+def _get_encoding(model):
+    """
+    Get the tokenizer for a model, loading its BPE ranks only once per process
+    
+    Falls back to cl100k_base for model names tiktoken doesn't know
+    """
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+@lru_cache(maxsize=4)
+def _get_openai_client(api_key):
+    """OpenAI client shared by calls with the same key, so its keep-alive connections are reused"""
+    return OpenAI(api_key=api_key, max_retries=0)  # Retries are handled by _stream_completion_with_retry
+
+
+@lru_cache(maxsize=4)
+def _get_azure_client(azure_endpoint, api_key, api_version):
+    """Azure OpenAI client shared by calls with the same settings, so its keep-alive connections are reused"""
+    return AzureOpenAI(
+        azure_endpoint=azure_endpoint,
+        api_key=api_key,
+        api_version=api_version,
+        max_retries=0  # Retries are handled by _stream_completion_with_retry
+    )
 
 
-def generate_angular_code(figma_data, responsive=True, additional_instructions="", use_azure=False, azure_endpoint="", azure_model="", node_limit=50, openai_model="gpt-4o"):
+def _to_json(value):
+    """Compact JSON for embedding design data in prompts (fewer tokens than Python's repr)"""
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def _estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token) that avoids running the BPE tokenizer"""
+    return (len(text) + 3) // 4
+
+
+def _count_tokens(prompt, max_tokens):
+    """
+    Count the prompt tokens, tokenizing exactly only when the estimate is close to the limit
+    
+    Both the estimate and the count used are recorded in the debug info
+    """
+    estimated_tokens = _estimate_tokens(prompt)
+    st.session_state["debug_info"]["estimated_token_count"] = estimated_tokens
+    
+    if estimated_tokens > max_tokens * 0.9:
+        # encode_ordinary skips the special-token scan, which the prompt never needs
+        token_count = len(_get_encoding("gpt-4o-mini").encode_ordinary(prompt))
+    else:
+        token_count = estimated_tokens
+    
+    st.session_state["debug_info"]["token_count"] = token_count
+    return token_count
+
+
+def _check_prompt_size(prompt):
+    """
+    Log the prompt's token count (helpful for debugging) and warn if it exceeds the context size
+    
+    Returns:
+        int: Token count of the prompt
+    """
+    max_tokens = 128000  # Context size for gpt-4o
+    token_count = _count_tokens(prompt, max_tokens)
+
+    # Check if prompt is too large
+    if token_count > max_tokens:
+        st.warning(
+            f"Prompt is too large ({token_count} tokens). Implementando estrategia de procesamiento por bloques."
+        )
+        
+        # Don't simplify - instead, split the design and process in chunks if needed
+        st.session_state["debug_info"]["original_token_count"] = token_count
+        
+        # We'll handle this with a multi-pass approach below instead of truncating
+        # prompt remains unchanged
+        st.session_state["debug_info"]["processing_strategy"] = "multi_pass"
+
+    return token_count
+
+
+def _stream_completion(client, **kwargs):
+    """
+    Request a chat completion as a stream and collect its text as it arrives
+    
+    Returns:
+        tuple: (full response content, finish reason, e.g. "stop" or "length")
+    """
+    parts = []
+    add_part = parts.append
+    finish_reason = None
+    for chunk in client.chat.completions.create(stream=True, **kwargs):
+        # Some chunks (e.g. usage or content filter results) carry no choices
+        if chunk.choices:
+            choice = chunk.choices[0]
+            content = choice.delta.content
+            if content:
+                add_part(content)
+            if choice.finish_reason:
+                finish_reason = choice.finish_reason
+    return "".join(parts), finish_reason
+
+
+def _stream_completion_with_retry(client, request_timeout, **kwargs):
+    """
+    Stream a chat completion, retrying transient failures with exponential backoff
+    
+    Timeouts, connection errors, rate limits, 5xx and 409 responses are retried (what
+    the SDK's own retries cover; the clients are built with max_retries=0). The last
+    failure is re-raised. `request_timeout` bounds connecting and each wait for the
+    next chunk, not the whole attempt: a response that keeps streaming can take longer
+    
+    Returns:
+        tuple: (response content, finish reason), as from _stream_completion
+    """
+    for attempt in range(REQUEST_ATTEMPTS):
+        try:
+            return _stream_completion(client, timeout=request_timeout, **kwargs)
+        except (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError,
+                openai.InternalServerError, openai.ConflictError):
+            if attempt == REQUEST_ATTEMPTS - 1:
+                raise
+            time.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+
+def _response_cache_key(provider, request):
+    """Hash of everything that determines a completion: provider, model, messages and sampling options"""
+    # Hash the serialized bytes directly (image requests carry megabytes of base64);
+    # sorted keys make the key independent of argument and dict order
+    if orjson is not None:
+        payload = orjson.dumps([provider, request], option=orjson.OPT_SORT_KEYS)
+    else:
+        payload = json.dumps([provider, request], separators=(",", ":"), ensure_ascii=False, sort_keys=True).encode("utf-8")
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+def _get_cached_response(key):
+    """Look up a response in memory, then on disk; None if it isn't cached"""
+    with _response_cache_lock:
+        if key in _response_cache:
+            _response_cache.move_to_end(key)
+            return _response_cache[key]
+
+        if not PERSIST_RESPONSES:
+            return None
+        try:
+            with shelve.open(RESPONSE_CACHE_PATH, flag="r") as db:
+                response = db.get(key)
+        except Exception:
+            # No cache file yet, or it can't be read; treat it as a miss
+            return None
+
+        if response is not None:
+            _response_cache[key] = response
+            if len(_response_cache) > RESPONSE_CACHE_SIZE:
+                _response_cache.popitem(last=False)
+        return response
+
+
+def _store_response(key, response):
+    """Remember a response in memory and, if enabled, on disk"""
+    with _response_cache_lock:
+        _response_cache[key] = response
+        if len(_response_cache) > RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+
+        if not PERSIST_RESPONSES:
+            return
+        try:
+            os.makedirs(os.path.dirname(RESPONSE_CACHE_PATH), exist_ok=True)
+            with shelve.open(RESPONSE_CACHE_PATH) as db:
+                db[key] = response
+        except Exception:
+            # The disk cache is best effort; the in-memory copy is still used
+            pass
+
+
+def _embed(client, text):
+    """Unit-length embedding of a text"""
+    response = client.embeddings.create(model=EMBEDDING_MODEL, input=text)
+    vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _find_similar_response(scope, vector, threshold):
+    """Response of the most similar cached design in the same scope, if it reaches the threshold"""
+    with _response_cache_lock:
+        candidates = [(cached_vector, response) for cached_scope, cached_vector, response in _semantic_cache if cached_scope == scope]
+    if not candidates:
+        return None
+
+    similarities = np.stack([cached_vector for cached_vector, _ in candidates]) @ vector
+    best = int(np.argmax(similarities))
+    return candidates[best][1] if similarities[best] >= threshold else None
+
+
+def _store_similar_response(scope, vector, response):
+    """Remember a response for later near-duplicate designs"""
+    with _response_cache_lock:
+        _semantic_cache.append((scope, vector, response))
+        if len(_semantic_cache) > SEMANTIC_CACHE_SIZE:
+            del _semantic_cache[0]
+
+
+def _cached_completion(create_client, provider, use_cache, similarity=None, request_timeout=30, retry_max_tokens=None, **request):
+    """
+    Get the response for a chat completion request, reusing the response of an identical earlier request
+    
+    Args:
+        create_client (callable): Builds the API client; only called on a cache miss
+        provider (str): Identifies where the request is sent (part of the cache key)
+        use_cache (bool): Whether to look up and store the response in the cache
+        similarity (tuple): Optional (scope, fingerprint, threshold) to also reuse the response
+            of a design whose fingerprint embedding is at least `threshold` similar
+        request_timeout (float): Seconds to wait for the connection and for each streamed chunk
+        retry_max_tokens (int): If set, a response cut off at max_tokens is requested once
+            more with this limit; responses that are still cut off are returned but not cached
+        **request: Arguments for chat.completions.create
+        
+    Returns:
+        str: The response content
+    """
+    key = _response_cache_key(provider, request) if use_cache else None
+    if key is not None:
+        cached_response = _get_cached_response(key)
+        if cached_response is not None:
+            st.info("Reusing the response of an identical earlier request.")
+            return cached_response
+
+    client = create_client()
+
+    vector = None
+    if use_cache and similarity is not None:
+        scope, fingerprint, threshold = similarity
+        try:
+            vector = _embed(client, fingerprint)
+        except Exception as e:
+            # Without an embedding the request is simply generated
+            st.warning(f"Couldn't check for similar designs: {str(e)}")
+        else:
+            similar_response = _find_similar_response(scope, vector, threshold)
+            if similar_response is not None:
+                st.info("Reusing the response generated for a very similar design.")
+                return similar_response
+
+    generated_code, finish_reason = _stream_completion_with_retry(client, request_timeout, **request)
+    if finish_reason == "length" and retry_max_tokens:
+        st.info("The response was cut off at the token limit; requesting it again with a larger limit.")
+        generated_code, finish_reason = _stream_completion_with_retry(
+            client, request_timeout, **{**request, "max_tokens": retry_max_tokens}
+        )
+
+    if generated_code and finish_reason != "length":
+        if key is not None:
+            _store_response(key, generated_code)
+        if vector is not None:
+            _store_similar_response(scope, vector, generated_code)
+    return generated_code
+
+
+def _component_files_from_json(generated_code):
+    """
+    Assemble the component files from a JSON response with "ts", "html" and "scss" keys
+    
+    A response cut off before the end isn't valid JSON; the files whose strings were
+    completed are still returned
+    
+    Returns:
+        str: The files with their headers, or an empty string if the response isn't such an object
+    """
+    try:
+        files = orjson.loads(generated_code) if orjson is not None else json.loads(generated_code)
+    except ValueError:
+        files = _completed_json_files(generated_code)
+    if not isinstance(files, dict):
+        return ""
+
+    return "".join(
+        header + files[name].strip() + separator
+        for name, header, separator in _COMPONENT_FILES if isinstance(files.get(name), str)
+    )
+
+
+def _completed_json_files(generated_code):
+    """Values of the "ts", "html" and "scss" keys whose strings are complete in a truncated JSON response"""
+    files = {}
+    match = _JSON_FILE_KEY_RE.search(generated_code)
+    while match:
+        try:
+            value, end = scanstring(generated_code, match.end())
+        except ValueError:
+            # The string was cut off; nothing after it is complete either
+            break
+        files.setdefault(match.group(1), value)
+        match = _JSON_FILE_KEY_RE.search(generated_code, end)
+    return files
+
+
+def _extract_component_files(generated_code):
+    """
+    Extract the TypeScript, HTML and SCSS code blocks from the model's response in a single pass
+    
+    Returns:
+        str: The files with their headers, or an empty string if no code blocks were found
+    """
+    blocks = {}
+    for match in _FENCE_RE.finditer(generated_code):
+        # The first block of each file wins
+        blocks.setdefault(_FENCE_FILES[match.group(1)], match.group(2).strip())
+
+    return "".join(
+        header + blocks[name] + separator
+        for name, header, separator in _COMPONENT_FILES if name in blocks
+    )
+
+
+def generate_angular_code(figma_data, responsive=True, additional_instructions="", use_azure=False, azure_endpoint="", azure_model="", node_limit=50, openai_model="gpt-4o", use_cache=True, semantic_cache_threshold=None, request_timeout=30):
     """
     Generate Angular component code from Figma data using OpenAI (standard or Azure)
     
@@ -20,6 +604,11 @@ def generate_angular_code(figma_data, responsive=True, additional_instructions="
         azure_endpoint (str): Azure OpenAI endpoint URL
         azure_model (str): Azure OpenAI model deployment name
         node_limit (int): Maximum number of nodes to process
+        use_cache (bool): Whether to reuse the response of an identical earlier request
+        semantic_cache_threshold (float): If set (e.g. 0.97), reuse the response of an earlier design
+            whose embedding has at least this cosine similarity (standard OpenAI only)
+        request_timeout (float): Seconds to wait for the API to connect or send the next
+            streamed chunk before the attempt is retried (a response that keeps streaming isn't cut off)
         
     Returns:
         str: Generated Angular component code (HTML, TS, SCSS)
@@ -30,17 +619,19 @@ def generate_angular_code(figma_data, responsive=True, additional_instructions="
     # Prepare the Figma nodes for processing
     nodes = extract_nodes(document)
 
-    # Flatten the Figma node tree for easier processing
-    flattened_nodes = flatten_figma_tree(nodes)
+    # Flatten the Figma node tree for easier processing, stopping one node
+    # past the limit (enough to know the design exceeds it)
+    flattened_nodes = list(islice(iter_figma_tree(nodes), node_limit + 1))
 
     # Limit the number of nodes to prevent token overflow
     if len(flattened_nodes) > node_limit:
         st.warning(
-            f"Design contains {len(flattened_nodes)} nodes. Processing only the first {node_limit} nodes to prevent API limits."
+            f"Design contains more than {node_limit} nodes. Processing only the first {node_limit} nodes to prevent API limits."
         )
         flattened_nodes = flattened_nodes[:node_limit]
 
     # Create a structured summary of the design
+    children_names = []
     design_summary = {
         "name":
         figma_data.get("name", "Untitled Design"),
@@ -48,45 +639,58 @@ def generate_angular_code(figma_data, responsive=True, additional_instructions="
         len(flattened_nodes),
         "canvas":
         document.get("type", ""),
-        "children": [
-            node.get("name", f"Element-{i}")
-            for i, node in enumerate(flattened_nodes)
-        ],
+        "children": children_names,
     }
 
-    # Extract key design properties
-    colors_used = set()
+    # Azure gets every node; the standard OpenAI prompt only uses the first
+    # MAX_PROMPT_NODES, so nodes past that are never simplified
+    use_azure_api = use_azure and azure_endpoint and azure_model
+    simplified_limit = len(flattened_nodes) if use_azure_api else MAX_PROMPT_NODES
+
+    # Extract key design properties and a simplified representation of
+    # nodes for the prompt in a single pass
+    solid_colors = []  # (r, g, b) channels in 0-1, scaled after the loop
+    alphas = []
     fonts_used = set()
     element_types = set()
+    simplified_nodes = []
+
+    add_rgb = solid_colors.append
+    add_alpha = alphas.append
+    add_font = fonts_used.add
+    add_type = element_types.add
+    add_name = children_names.append
+    add_node = simplified_nodes.append
+
+    for i, node in enumerate(flattened_nodes):
+        name = node.get("name", f"Element-{i}")
+        node_type = node.get("type", "")
+        add_name(name)
 
-    for node in flattened_nodes:
         # Extract colors
         if "fills" in node:
-            for fill in node.get("fills", []):
+            for fill in node["fills"]:
                 if fill.get("type") == "SOLID" and "color" in fill:
                     color = fill["color"]
-                    r = int(color["r"] * 255)
-                    g = int(color["g"] * 255)
-                    b = int(color["b"] * 255)
-                    a = color.get("a", 1)
-                    colors_used.add(f"rgba({r}, {g}, {b}, {a})")
+                    add_rgb((color["r"], color["g"], color["b"]))
+                    add_alpha(color.get("a", 1))
 
         # Extract fonts
         if "style" in node:
-            style = node.get("style", {})
+            style = node["style"]
             if "fontFamily" in style:
-                fonts_used.add(style["fontFamily"])
+                add_font(style["fontFamily"])
 
         # Extract element types
-        element_types.add(node.get("type", ""))
+        add_type(node_type)
+
+        if i >= simplified_limit:
+            continue
 
-    # Create a simplified representation of nodes for the prompt
-    simplified_nodes = []
-    for i, node in enumerate(flattened_nodes):
         # Only include essential properties
         simplified_node = {
-            "name": node.get("name", f"Element-{i}"),
-            "type": node.get("type", ""),
+            "name": name,
+            "type": node_type,
             "id": node.get("id", ""),
         }
 
@@ -94,110 +698,72 @@ def generate_angular_code(figma_data, responsive=True, additional_instructions="
         if "style" in node:
             simplified_node["style"] = {
                 k: v
-                for k, v in node["style"].items() if k in [
-                    "fontFamily", "fontSize", "fontWeight",
-                    "textAlignHorizontal", "textAlignVertical"
-                ]
+                for k, v in style.items() if k in STYLE_KEYS
             }
 
         # Include basic layout properties
         if "absoluteBoundingBox" in node:
+            bbox = node["absoluteBoundingBox"]
             simplified_node["dimensions"] = {
-                "width": node["absoluteBoundingBox"].get("width", 0),
-                "height": node["absoluteBoundingBox"].get("height", 0),
-                "x": node["absoluteBoundingBox"].get("x", 0),
-                "y": node["absoluteBoundingBox"].get("y", 0),
+                "width": bbox.get("width", 0),
+                "height": bbox.get("height", 0),
+                "x": bbox.get("x", 0),
+                "y": bbox.get("y", 0),
             }
 
-        simplified_nodes.append(simplified_node)
+        add_node(simplified_node)
 
-    # Create a prompt for the AI
-    responsive_text = "Make the design fully responsive with mobile-first approach." if responsive else "Focus on pixel-perfect desktop implementation."
-    
-    # We already applied the node limit earlier, so this is just to correct simplified_nodes
-    if len(simplified_nodes) > len(flattened_nodes):
-        simplified_nodes = simplified_nodes[:len(flattened_nodes)]
-
-    prompt = f"""You are an expert Angular developer converting a Figma design to Angular components (TypeScript, HTML templates, and SCSS styles).
-
-Design Summary:
-{design_summary}
+    # Scale every color channel to 0-255 in one pass (truncating like int());
+    # for a handful of colors the scalar path is cheaper than building an array
+    if len(solid_colors) >= VECTORIZE_MIN_COLORS:
+        channels = (np.array(solid_colors, dtype=np.float64) * 255).astype(np.int64).tolist()
+    else:
+        channels = [(int(r * 255), int(g * 255), int(b * 255)) for r, g, b in solid_colors]
+    colors_used = {f"rgba({r}, {g}, {b}, {a})" for (r, g, b), a in zip(channels, alphas)}
 
-Extract from design:
-- Colors: {list(colors_used)}
-- Fonts: {list(fonts_used)}
-- Element Types: {list(element_types)}
+    # Serialize the design data once for the prompts
+    design_summary_json = _to_json(design_summary)
+    colors_json = _to_json(sorted(colors_used))
+    fonts_json = _to_json(sorted(fonts_used))
+    element_types_json = _to_json(sorted(element_types))
+    simplified_nodes_json = _to_json(simplified_nodes)
 
-Requirements:
-1. Generate complete, valid Angular component code based on the design.
-2. Create THREE files:
-   - component.ts (TypeScript class with @Component decorator)
-   - component.html (Angular template)
-   - component.scss (SCSS styles)
-3. {responsive_text}
-4. Use Angular best practices including:
-   - Proper component structure and annotations
-   - Reactive approach for data handling (no template forms)
-   - TypeScript interfaces for data models
-   - Angular Material components where appropriate
-5. Ensure semantic HTML with appropriate tags.
-6. Use modern SCSS techniques with variables for colors and dimensions.
-7. Implement responsive design with Angular Flex Layout or CSS Grid/Flexbox.
-8. Use Angular routing for navigation elements when appropriate.
-9. Organize and comment your code for clarity.
-10. Ensure fonts are properly imported in the styles.
-11. Create reusable sub-components when appropriate.
-
-{additional_instructions}
-
-FIGMA DESIGN NODES (SIMPLIFIED):
-{simplified_nodes}
-
-Return the complete Angular component files. Include all three files (TS, HTML, SCSS) in the response, each in its own code block.
-"""
-
-    # Log the token count (helpful for debugging)
-    import tiktoken
-    encoding = tiktoken.encoding_for_model("gpt-4o-mini")
-    token_count = len(encoding.encode(prompt))
-    st.session_state["debug_info"]["token_count"] = token_count
-
-    # Check if prompt is too large
-    max_tokens = 128000  # Context size for gpt-4o
-    if token_count > max_tokens:
-        st.warning(
-            f"Prompt is too large ({token_count} tokens). Implementando estrategia de procesamiento por bloques."
-        )
-        
-        # Don't simplify - instead, split the design and process in chunks if needed
-        st.session_state["debug_info"]["original_token_count"] = token_count
-        
-        # We'll handle this with a multi-pass approach below instead of truncating
-        # prompt remains unchanged
-        st.session_state["debug_info"]["processing_strategy"] = "multi_pass"
+    # Create a prompt for the AI
+    responsive_text = "Make the design fully responsive with mobile-first approach." if responsive else "Focus on pixel-perfect desktop implementation."
 
     # Generate code using OpenAI API (standard or Azure)
     try:
-        system_message = "You are an expert Angular developer specializing in converting Figma designs to Angular components with TypeScript, HTML templates, and SCSS styles."
-        
-        if use_azure and azure_endpoint and azure_model:
-            import openai
-            from openai import AzureOpenAI
-            
+        if use_azure_api:
             # Use Azure OpenAI API
             st.info(f"Using Azure OpenAI API with model: {azure_model}")
             
+            prompt = AZURE_PROMPT_TEMPLATE.format(
+                design_summary=design_summary_json,
+                colors=colors_json,
+                fonts=fonts_json,
+                element_types=element_types_json,
+                responsive_text=responsive_text,
+                additional_instructions=additional_instructions,
+                simplified_nodes=simplified_nodes_json
+            )
+            _check_prompt_size(prompt)
+            
             # Set up Azure OpenAI client
-            client = AzureOpenAI(
-                azure_endpoint=azure_endpoint,
-                api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-                api_version="2023-05-15"  # Update to latest API version
+            create_client = partial(
+                _get_azure_client,
+                azure_endpoint,
+                os.getenv("AZURE_OPENAI_API_KEY"),
+                "2023-05-15"  # Update to latest API version
             )
             
-            response = client.chat.completions.create(
+            generated_code = _cached_completion(
+                create_client,
+                f"azure:{azure_endpoint}",
+                use_cache,
+                request_timeout=request_timeout,
                 model=azure_model,
                 messages=[
-                    {"role": "system", "content": system_message},
+                    {"role": "system", "content": SYSTEM_MESSAGE},
                     {"role": "user", "content": prompt}
                 ],
                 temperature=0.3,
@@ -206,148 +772,75 @@ Return the complete Angular component files. Include all three files (TS, HTML,
         else:
             # Use standard OpenAI API
             # Initialize OpenAI client with current API key
-            openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+            create_client = partial(_get_openai_client, os.getenv("OPENAI_API_KEY"))
             
             # Use the model provided or fallback to default
             model_name = openai_model if openai_model else "gpt-4o"
             
             st.info(f"Using standard OpenAI API with model: {model_name}")
             
-            # Use single-phase approach for all designs, regardless of size
-            st.info(f"Diseño con {token_count} tokens. Usando un enfoque de fase única para mejor fidelidad.")
-            
-            # Prepare a detailed design description for accurate reproduction
-            design_description = f"""
-            EXACT DESIGN DETAILS
-            ====================
-            
-            Colors:
-            - Document all colors exactly as they appear in HEX format: {list(colors_used)}
-            
-            Typography:
-            - Fonts: {list(fonts_used)}
-            - Maintain exact font sizes, weights, and line heights from the design
-            
-            Layout:
-            - Preserve all spacing, padding, and margins exactly as shown
-            - Maintain the precise grid structure shown in the design
-            - Keep the same vertical and horizontal alignment of elements
-            
-            Elements:
-            - Cards should have the exact same corner radius as in the design
-            - Buttons should match the design's exact styling (borders, shadows, etc.)
-            - Icons must be positioned and sized exactly as shown
-            
-            Content:
-            - Text content must be identical to what appears in the design
-            - Maintain the same text formatting (bold, italic, etc.)
-            
-            Design Notes:
-            - Pay special attention to color gradients or shadows if present
-            - Reproduce any hover states or interactive elements faithfully
-            - Ensure the responsive behavior maintains the design's integrity at different screen sizes
-            """
-            
             # We'll use a more focused subset of nodes if needed
-            if len(simplified_nodes) > 100:
-                subset_nodes = simplified_nodes[:100]  # Focus on first 100 nodes
-                node_note = f"Note: Focusing on a subset of {len(subset_nodes)} most important nodes out of {len(simplified_nodes)} total nodes"
+            # (simplified_nodes is already capped at MAX_PROMPT_NODES)
+            if len(flattened_nodes) > MAX_PROMPT_NODES:
+                node_note = f"Note: Focusing on a subset of {len(simplified_nodes)} most important nodes out of {len(flattened_nodes)} total nodes"
             else:
-                subset_nodes = simplified_nodes
                 node_note = "Processing all design nodes"
             
-            # Create enhanced single-phase prompt
-            enhanced_prompt = f"""You are a senior Angular developer tasked with PERFECTLY recreating a Figma design in code.
-
-            IMPORTANT: Your objective is PIXEL-PERFECT recreation of the following design, with exact colors, spacing, typography, and layout.
-            
-            Design Summary:
-            {design_summary}
-            
-            Extract from design:
-            - Colors: {list(colors_used)}
-            - Fonts: {list(fonts_used)}
-            - Element Types: {list(element_types)}
-            
-            {design_description}
-            
-            {node_note}
-            
-            FIGMA DESIGN NODES (SIMPLIFIED):
-            {subset_nodes}
-            
-            STRICT REQUIREMENTS:
-            1. Create THREE complete files matching the design EXACTLY:
-               - component.ts (TypeScript class with @Component decorator)
-               - component.html (Angular template with EXACT structure matching design)
-               - component.scss (SCSS with PRECISE styling matching design)
-            2. {responsive_text}
-            3. Follow Angular best practices
-            4. Use semantic HTML (section, article, nav, etc. as appropriate)
-            5. Use CSS Grid AND Flexbox for layout as needed
-            6. Match ALL visual details: colors, fonts, spacing, borders, shadows, etc.
-            7. Do not substitute or simplify ANY visual elements
-            8. Include ALL text content exactly as shown in the design
-            9. Generate ALL necessary CSS for the layout to work properly
-            10. {additional_instructions}
+            # Create enhanced single-phase prompt: static head first, design data last
+            enhanced_prompt = ENHANCED_PROMPT_HEAD + ENHANCED_PROMPT_DATA_TEMPLATE.format(
+                responsive_text=responsive_text,
+                additional_instructions=additional_instructions or "None",
+                design_summary=design_summary_json,
+                colors=colors_json,
+                fonts=fonts_json,
+                element_types=element_types_json,
+                node_note=node_note,
+                simplified_nodes=simplified_nodes_json
+            )
             
-            CRITICAL: Compare your work to the design multiple times during creation. Your code must reproduce the design exactly as shown, including all visual details, layout, and styling.
+            token_count = _check_prompt_size(enhanced_prompt)
             
-            Return the complete Angular component files. Include all three files (TS, HTML, SCSS) in your response, each in its own code block.
-            """
+            # Use single-phase approach for all designs, regardless of size; small
+            # prompts are only estimated (exact tokenization is skipped), so say so
+            if st.session_state["debug_info"].get("estimated_token_count") == token_count:
+                token_text = f"~{token_count} tokens (estimado)"
+            else:
+                token_text = f"{token_count} tokens"
+            st.info(f"Diseño con {token_text}. Usando un enfoque de fase única para mejor fidelidad.")
             
             # Use the enhanced single-phase approach for all designs
-            response = openai_client.chat.completions.create(
+            # Designs are compared by an embedding of their summary and extracted properties,
+            # only against earlier ones generated with the same model and options
+            similarity = None
+            if semantic_cache_threshold is not None:
+                fingerprint = f'{{"summary":{design_summary_json},"types":{element_types_json},"colors":{colors_json},"fonts":{fonts_json}}}'
+                similarity = ((model_name, responsive, additional_instructions), fingerprint, semantic_cache_threshold)
+            
+            generated_code = _cached_completion(
+                create_client,
+                "openai",
+                use_cache,
+                similarity,
+                request_timeout,
+                RETRY_MAX_TOKENS,
                 model=model_name,
                 messages=[
-                    {"role": "system", "content": system_message},
+                    {"role": "system", "content": SYSTEM_MESSAGE},
                     {"role": "user", "content": enhanced_prompt}
                 ],
                 temperature=0.3,
-                max_tokens=4500
+                max_tokens=4500,
+                # The files come back as JSON, so no markdown fences need parsing
+                response_format={"type": "json_object"}
             )
 
-        # Extract the generated code
-        generated_code = response.choices[0].message.content
-        
-        # Process the Angular component files (extract from markdown code blocks)
-        processed_response = ""
-        
-        # Extract TypeScript component code
-        if "```typescript" in generated_code or "```ts" in generated_code:
-            ts_start = generated_code.find("```typescript")
-            if ts_start == -1: 
-                ts_start = generated_code.find("```ts")
-                ts_start = ts_start + 5 if ts_start != -1 else -1
-            else:
-                ts_start = ts_start + 13
-                
-            if ts_start != -1:
-                ts_end = generated_code.find("```", ts_start)
-                ts_code = generated_code[ts_start:ts_end].strip()
-                processed_response += "// component.ts\n" + ts_code + "\n\n"
-        
-        # Extract HTML template code
-        if "```html" in generated_code:
-            html_start = generated_code.find("```html") + 7
-            html_end = generated_code.find("```", html_start)
-            html_code = generated_code[html_start:html_end].strip()
-            processed_response += "<!-- component.html -->\n" + html_code + "\n\n"
+        # Process the Angular component files (JSON from standard OpenAI, markdown
+        # code blocks from Azure)
+        if use_azure_api:
+            processed_response = _extract_component_files(generated_code)
+        else:
+            processed_response = _component_files_from_json(generated_code)
         
-        # Extract SCSS style code
-        if "```scss" in generated_code or "```css" in generated_code:
-            scss_start = generated_code.find("```scss")
-            if scss_start == -1: 
-                scss_start = generated_code.find("```css")
-                scss_start = scss_start + 6 if scss_start != -1 else -1
-            else:
-                scss_start = scss_start + 7
-                
-            if scss_start != -1:
-                scss_end = generated_code.find("```", scss_start)
-                scss_code = generated_code[scss_start:scss_end].strip()
-                processed_response += "/* component.scss */\n" + scss_code + "\n"
-                
         # If no code blocks were found, return the raw response
         if not processed_response:
             return "/* No properly formatted code blocks found in response */\n\n" + generated_code
@@ -355,65 +848,32 @@ Return the complete Angular component files. Include all three files (TS, HTML,
         return processed_response
 
     except Exception as e:
-        error_message = f"""
-// Error in Angular component generation
-
-/**
- * ERROR DETAILS
- * -------------
- * {str(e)}
- */
-
-// component.ts
-import {{ Component, OnInit }} from '@angular/core';
-
-@Component({{
-  selector: 'app-error',
-  templateUrl: './error.component.html',
-  styleUrls: ['./error.component.scss']
-}})
-export class ErrorComponent implements OnInit {{
-  errorMessage = '{str(e).replace("'", "")}';
-  
-  constructor() {{ }}
-  
-  ngOnInit(): void {{
-    console.error('Error generating Angular code:', this.errorMessage);
-  }}
-}}
-
-<!-- component.html -->
-<div class="error-container">
-  <h1>Error Generating Angular Code</h1>
-  <div class="error-message">
-    <p>An error occurred while generating the Angular components:</p>
-    <pre>{{errorMessage}}</pre>
-  </div>
-  <p>Please check your API configuration and try again.</p>
-</div>
+        error_message = ERROR_COMPONENT_TEMPLATE.format(error=str(e), error_js=str(e).replace("'", ""))
+        return error_message
 
-/* component.scss */
-.error-container {{
-  font-family: Arial, sans-serif;
-  padding: 20px;
-  max-width: 800px;
-  margin: 0 auto;
-}}
 
-.error-message {{
-  color: #d32f2f;
-  background: #ffebee;
-  padding: 15px;
-  border-radius: 4px;
-  margin: 20px 0;
-}}
-
-pre {{
-  white-space: pre-wrap;
-  word-break: break-all;
-  background: #f5f5f5;
-  padding: 10px;
-  border-radius: 4px;
-}}
-"""
-        return error_message
+def generate_angular_code_batch(figma_data_list, concurrency=8, **kwargs):
+    """
+    Generate Angular component code for several designs concurrently
+    
+    Each request spends almost all its time waiting on the model, so running them
+    on threads brings the total time close to that of the slowest request.
+    
+    Args:
+        figma_data_list (list): Figma file data of each design
+        concurrency (int): Maximum number of requests in flight at once
+        **kwargs: Options passed to generate_angular_code for every design
+        
+    Returns:
+        list: Generated code for each design, in the same order as figma_data_list
+    """
+    if not figma_data_list:
+        return []
+
+    # Workers need the script context so their Streamlit messages are shown
+    ctx = get_script_run_ctx()
+    with ThreadPoolExecutor(
+        max_workers=min(concurrency, len(figma_data_list)),
+        initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx)
+    ) as executor:
+        return list(executor.map(lambda figma_data: generate_angular_code(figma_data, **kwargs), figma_data_list))
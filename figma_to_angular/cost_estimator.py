@@ -1,34 +1,66 @@
-import math
+from functools import lru_cache
+import numpy as np
 
+# Modelos estándar de OpenAI
+_OPENAI_RATES = {
+    "gpt-4o":
+    (0.005, 0.015
+     ),  # $5/M input, $15/M output (precios hipotéticos, no confirmados)
+    "gpt-4o-mini": (0.00015, 0.0006),  # $0.15/M input, $0.60/M output
+    "gpt-3.5-turbo": (0.0015, 0.002),  # $1.5/M input, $2/M output
+}
 
-def estimate_cost_per_thousand_tokens(model):
+# Modelos de Azure - pueden variar según el acuerdo
+_AZURE_RATES = {
+    "gpt-4o": (0.03, 0.06),  # Tarifa típica de Azure
+    "gpt-4o-mini":
+    (0.00015,
+     0.0006),  # Tarifa típica de Azure (asumiendo similar al de OpenAI)
+    "gpt-35-turbo": (0.0015, 0.002),  # Tarifa típica de Azure
+}
+
+_RATES_BY_PROVIDER = {
+    "openai": _OPENAI_RATES,
+    "azure": _AZURE_RATES,
+}
+
+
+@lru_cache(maxsize=64)
+def estimate_cost_per_thousand_tokens(model, provider="openai"):
     """
     Returns the cost in USD per 1000 tokens for different models
     
     Args:
         model (str): The model name
+        provider (str): "openai" or "azure"; unknown providers use OpenAI rates
         
     Returns:
         tuple: (input_cost, output_cost) in USD per 1000 tokens
     """
-    models = {
-        # Modelos estándar de OpenAI
-        "gpt-4o":
-        (0.005, 0.015
-         ),  # $5/M input, $15/M output (precios hipotéticos, no confirmados)
-        "gpt-4o-mini": (0.00015, 0.0006),  # $0.15/M input, $0.60/M output
-        "gpt-3.5-turbo": (0.0015, 0.002),  # $1.5/M input, $2/M output
-
-        # Modelos de Azure - pueden variar según el acuerdo
-        "gpt-4o": (0.03, 0.06),  # Tarifa típica de Azure
-        "gpt-4o-mini":
-        (0.00015,
-         0.0006),  # Tarifa típica de Azure (asumiendo similar al de OpenAI)
-        "gpt-35-turbo": (0.0015, 0.002),  # Tarifa típica de Azure
-    }
+    rates = _RATES_BY_PROVIDER.get(provider, _OPENAI_RATES)
 
     # Default to GPT-4 pricing if model not found
-    return models.get(model.lower(), (0.01, 0.03))
+    return rates.get(model.lower(), (0.01, 0.03))
+
+
+def _effective_nodes(node_count, rate_after_500, rate_after_1000):
+    """
+    Apply the diminishing-returns curve to a node count or an array of node counts
+    
+    Nodes count fully up to 500, at `rate_after_500` up to 1000 and at
+    `rate_after_1000` beyond that
+    """
+    nodes = np.asarray(node_count, dtype=np.float64)
+    return np.select(
+        [nodes > 1000, nodes > 500],
+        [1000 + (nodes - 1000) * rate_after_1000, 500 + (nodes - 500) * rate_after_500],
+        nodes
+    )
+
+
+def _as_token_count(tokens):
+    """Plain int for a single estimate, int array for a batch"""
+    return int(tokens) if tokens.ndim == 0 else tokens.astype(np.int64)
 
 
 def estimate_tokens_from_nodes(node_count, avg_complexity=1.0):
@@ -36,23 +68,19 @@ def estimate_tokens_from_nodes(node_count, avg_complexity=1.0):
     Estimates the number of tokens required based on node count
     
     Args:
-        node_count (int): Number of Figma nodes
+        node_count (int or numpy.ndarray): Number of Figma nodes, or an array of node counts
         avg_complexity (float): Complexity multiplier (1.0 = average)
         
     Returns:
-        int: Estimated number of tokens for prompt
+        int or numpy.ndarray: Estimated number of tokens for prompt (same shape as node_count)
     """
     # Base tokens for system message + fixed parts of prompt
     base_tokens = 1000
 
     # For very large node counts, apply a diminishing return curve
     # This simulates token compression or summarization for large designs
-    if node_count > 1000:
-        effective_nodes = 1000 + (node_count - 1000) * 0.3  # 30% efficiency after 1000 nodes
-    elif node_count > 500:
-        effective_nodes = 500 + (node_count - 500) * 0.5  # 50% efficiency after 500 nodes
-    else:
-        effective_nodes = node_count
+    # (50% efficiency after 500 nodes, 30% after 1000)
+    effective_nodes = _effective_nodes(node_count, 0.5, 0.3)
         
     # Tokens per node (varies by complexity)
     tokens_per_node = 100 * avg_complexity
@@ -61,10 +89,28 @@ def estimate_tokens_from_nodes(node_count, avg_complexity=1.0):
     total_tokens = base_tokens + (effective_nodes * tokens_per_node)
 
     # Cap at model context limit
-    return min(math.ceil(total_tokens), 128000)  # gpt-4o context limit
+    return _as_token_count(np.minimum(np.ceil(total_tokens), 128000))  # gpt-4o context limit
 
 
-def estimate_cost(node_count, model, avg_complexity=1.0):
+def estimate_output_tokens_from_nodes(node_count):
+    """
+    Estimates the number of tokens of the generated code based on node count
+    
+    Args:
+        node_count (int or numpy.ndarray): Number of Figma nodes, or an array of node counts
+        
+    Returns:
+        int or numpy.ndarray: Estimated number of output tokens (same shape as node_count)
+    """
+    # For very large designs, the output doesn't scale linearly
+    # (40% efficiency after 500 nodes, 20% after 1000)
+    effective_output_nodes = _effective_nodes(node_count, 0.4, 0.2)
+
+    # Angular components are verbose (TypeScript, HTML, and SCSS)
+    return _as_token_count(np.minimum(np.ceil(effective_output_nodes * 250), 64000))  # Cap at 64k for response
+
+
+def estimate_cost(node_count, model, avg_complexity=1.0, provider="openai"):
     """
     Estimate the cost of generating code for a design with the given number of nodes
     
@@ -72,27 +118,17 @@ def estimate_cost(node_count, model, avg_complexity=1.0):
         node_count (int): Number of Figma nodes
         model (str): Model name to use for generation
         avg_complexity (float): Complexity multiplier (1.0 = average)
+        provider (str): "openai" or "azure", selects the pricing table
         
     Returns:
         dict: Cost estimate with details
     """
     # Get cost rates
-    input_rate, output_rate = estimate_cost_per_thousand_tokens(model)
+    input_rate, output_rate = estimate_cost_per_thousand_tokens(model, provider)
 
     # Estimate tokens
     input_tokens = estimate_tokens_from_nodes(node_count, avg_complexity)
-
-    # Estimate output tokens with diminishing returns for large designs
-    # For very large designs, the output doesn't scale linearly
-    if node_count > 1000:
-        effective_output_nodes = 1000 + (node_count - 1000) * 0.2  # 20% efficiency after 1000 nodes
-    elif node_count > 500:
-        effective_output_nodes = 500 + (node_count - 500) * 0.4  # 40% efficiency after 500 nodes
-    else:
-        effective_output_nodes = node_count
-        
-    # Angular components are verbose (TypeScript, HTML, and SCSS)
-    output_tokens = min(effective_output_nodes * 250, 64000)  # Cap at 64k for response
+    output_tokens = estimate_output_tokens_from_nodes(node_count)
 
     # Calculate costs
     input_cost = (input_tokens / 1000) * input_rate
@@ -109,3 +145,36 @@ def estimate_cost(node_count, model, avg_complexity=1.0):
         "total_cost": round(total_cost, 4),
         "formatted_total": f"${total_cost:.4f}"
     }
+
+
+def estimate_cost_batch(node_counts, model, avg_complexity=1.0, provider="openai"):
+    """
+    Estimate the cost for many node counts at once, without a Python-level loop
+    
+    Args:
+        node_counts (sequence or numpy.ndarray): Node counts of the candidate designs
+        model (str): Model name to use for generation
+        avg_complexity (float): Complexity multiplier (1.0 = average)
+        provider (str): "openai" or "azure", selects the pricing table
+        
+    Returns:
+        dict: Arrays of tokens and (unrounded) costs, one entry per node count
+    """
+    node_counts = np.asarray(node_counts)
+    input_rate, output_rate = estimate_cost_per_thousand_tokens(model, provider)
+
+    input_tokens = estimate_tokens_from_nodes(node_counts, avg_complexity)
+    output_tokens = estimate_output_tokens_from_nodes(node_counts)
+
+    input_cost = (input_tokens / 1000) * input_rate
+    output_cost = (output_tokens / 1000) * output_rate
+    total_cost = input_cost + output_cost
+
+    return {
+        "model": model,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "input_cost": input_cost,
+        "output_cost": output_cost,
+        "total_cost": total_cost,
+    }
@@ -3,6 +3,10 @@ Módulo para integrar la nueva generación de código optimizada con el flujo ex
 """
 
 import os
+import json
+import hashlib
+import logging
+from itertools import islice
 import openai
 from openai import OpenAI, AzureOpenAI
 import streamlit as st
@@ -10,8 +14,100 @@ from utils import extract_nodes, flatten_figma_tree
 from alt_nodes import convert_to_angular_nodes, analyze_layout, AngularNode
 from angular_generator import AngularGenerator
 
+try:
+    import orjson
+except ImportError:  # orjson es opcional; se usa el codificador de la biblioteca estándar
+    orjson = None
 
-def generate_enhanced_angular_code(figma_data, responsive=True, use_material=True, additional_instructions="", node_limit=50):
+logger = logging.getLogger(__name__)
+
+# Documentos distintos cuyos recorridos y análisis se conservan entre reruns de Streamlit
+TREE_CACHE_ENTRIES = 4
+
+
+def _document_digest(document):
+    """Huella estable del contenido del documento, usada como clave de las cachés"""
+    if orjson is not None:
+        data = orjson.dumps(document)
+    else:
+        data = json.dumps(document, separators=(",", ":")).encode("utf-8")
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+@st.cache_data(max_entries=TREE_CACHE_ENTRIES, show_spinner=False)
+def _flatten_and_extract(document_digest, _document, extract_limit=None, flatten_limit=None):
+    """
+    Extrae y aplana los nodos del documento una sola vez por contenido
+    
+    Ambos recorridos se detienen un nodo después de su límite: basta para saber
+    si hubo que truncar sin recorrer el resto del árbol.
+    
+    Args:
+        document_digest (str): Huella del documento (clave de la caché)
+        _document (dict): Documento de Figma; no se hashea
+        extract_limit (int, optional): Máximo de nodos extraídos que se aplanan
+        flatten_limit (int, optional): Máximo de nodos aplanados que se necesitan
+        
+    Returns:
+        tuple: (número de nodos extraídos, hasta extract_limit + 1; nodos aplanados,
+            hasta flatten_limit + 1)
+    """
+    extracted_nodes = extract_nodes(_document, limit=None if extract_limit is None else extract_limit + 1)
+    flattened_nodes = flatten_figma_tree(
+        islice(extracted_nodes, extract_limit),
+        limit=None if flatten_limit is None else flatten_limit + 1
+    )
+    return len(extracted_nodes), flattened_nodes
+
+
+@st.cache_data(max_entries=TREE_CACHE_ENTRIES, show_spinner=False)
+def _convert_and_analyze(document_digest, node_count, _flattened_nodes):
+    """
+    Convierte los nodos aplanados a AngularNode y analiza su layout, una sola vez
+    por documento y cantidad de nodos
+    
+    Args:
+        document_digest (str): Huella del documento (clave de la caché)
+        node_count (int): Cantidad de nodos aplanados procesados (clave de la caché)
+        _flattened_nodes (list): Nodos aplanados; no se hashean
+        
+    Returns:
+        list: Nodos AngularNode raíz con el layout ya analizado
+    """
+    angular_nodes = convert_to_angular_nodes(_flattened_nodes)
+    analyze_layout(angular_nodes)
+    return angular_nodes
+
+
+@st.cache_data(max_entries=TREE_CACHE_ENTRIES, show_spinner=False)
+def _generate_code_files(document_digest, node_count, use_material, responsive, component_name, _flattened_nodes):
+    """
+    Genera los archivos del componente una sola vez por documento y opciones
+    
+    El generador es determinista, así que un rerun con el mismo diseño y las mismas
+    opciones reutiliza el resultado sin convertir ni recorrer de nuevo el árbol.
+    
+    Args:
+        document_digest (str): Huella del documento (clave de la caché)
+        node_count (int): Cantidad de nodos aplanados procesados (clave de la caché)
+        use_material (bool): Si se deben usar componentes de Angular Material
+        responsive (bool): Si el código debe ser responsive
+        component_name (str): Nombre del componente
+        _flattened_nodes (list): Nodos aplanados; no se hashean
+        
+    Returns:
+        dict: Archivos generados con claves 'ts', 'html' y 'scss'
+    """
+    # Convertir a nodos intermedios (AltNodes) y analizar layout para detectar
+    # estructuras como flexbox y grid
+    angular_nodes = _convert_and_analyze(document_digest, node_count, _flattened_nodes)
+    
+    generator = AngularGenerator(use_material=use_material, responsive=responsive)
+    return generator.generate(angular_nodes, {"component_name": component_name})
+
+
+def generate_enhanced_angular_code(figma_data, responsive=True, use_material=True, additional_instructions="", node_limit=50,
+                                   status=None, document_digest=None):
     """
     Genera código Angular usando nuestro nuevo sistema de procesamiento intermedio
     
@@ -21,35 +117,45 @@ def generate_enhanced_angular_code(figma_data, responsive=True, use_material=Tru
         use_material (bool): Si se deben usar componentes de Angular Material
         additional_instructions (str): Instrucciones adicionales
         node_limit (int): Límite de nodos a procesar
+        status (StatusContainer, optional): Contenedor de `st.status` donde mostrar el
+            progreso; si no se indica se crea uno
+        document_digest (str, optional): Huella del documento ya calculada por quien
+            llama; si no se indica se calcula aquí
         
     Returns:
         str: Código Angular generado (HTML, SCSS, TS)
     """
+    # Un único contenedor de estado cuya etiqueta se va actualizando, en lugar de
+    # un mensaje (y un delta al frontend) por paso
+    label = f"Iniciando generación de código con {node_limit} nodos límite, Material UI: {use_material}"
+    if status is None:
+        status = st.status(label, expanded=False)
+    else:
+        status.update(label=label)
+    
     try:
-        # Añadir logs para debugging
-        st.info(f"Iniciando generación de código con {node_limit} nodos límite, Material UI: {use_material}")
         
         # Extraer document data
         document = figma_data.get("document", {})
         if not document:
             st.error("No se pudo obtener el documento de Figma")
+            status.update(state="error")
             return "// Error: No se encontró documento en los datos de Figma"
         
-        # Extraer los nodos del documento
-        st.info("Extrayendo nodos del documento...")
-        figma_nodes = extract_nodes(document)
-        st.info(f"Se extrajeron {len(figma_nodes)} nodos iniciales")
-        
-        # Aplanar los nodos para mejor procesamiento
-        st.info("Aplanando árbol de nodos...")
-        flattened_nodes = flatten_figma_tree(figma_nodes)
-        st.info(f"Árbol aplanado: {len(flattened_nodes)} nodos")
-        
         # Limitar la cantidad de nodos para prevenir problemas de memoria
         max_safe_nodes = min(node_limit, 500)  # Limitar a un máximo seguro
+        
+        # Extraer y aplanar los nodos del documento (en caché entre reruns); el
+        # aplanado se detiene en cuanto supera el límite seguro
+        status.update(label="Extrayendo y aplanando nodos del documento...")
+        if document_digest is None:
+            document_digest = _document_digest(document)
+        extracted_count, flattened_nodes = _flatten_and_extract(document_digest, document, flatten_limit=max_safe_nodes)
+        status.update(label=f"Se extrajeron {extracted_count} nodos iniciales")
+        
         if len(flattened_nodes) > max_safe_nodes:
             st.warning(
-                f"Diseño contiene {len(flattened_nodes)} nodos. Procesando solo los primeros {max_safe_nodes} para prevenir problemas de memoria."
+                f"Diseño contiene más de {max_safe_nodes} nodos. Procesando solo los primeros {max_safe_nodes} para prevenir problemas de memoria."
             )
             flattened_nodes = flattened_nodes[:max_safe_nodes]
         
@@ -61,61 +167,53 @@ def generate_enhanced_angular_code(figma_data, responsive=True, use_material=Tru
             "nodes_procesados": min(len(flattened_nodes), max_safe_nodes)
         }
         
-        # Convertir a nodos intermedios (AltNodes)
-        st.info("Convirtiendo nodos de Figma a representación intermedia...")
-        angular_nodes = convert_to_angular_nodes(flattened_nodes)
-        st.info(f"Se convirtieron {len(angular_nodes)} nodos raíz")
-        
-        # Analizar layout para detectar estructuras como flexbox y grid
-        st.info("Analizando layout y optimizando estructura...")
-        analyze_layout(angular_nodes)
-        
-        # Generar código Angular
-        st.info("Generando código Angular optimizado...")
-        generator = AngularGenerator(use_material=use_material, responsive=responsive)
-        
         # Obtener el nombre del componente del documento
         component_name = figma_data.get("name", "figma-component").lower().replace(" ", "-")
-        st.info(f"Generando componente: {component_name}")
+        status.update(label=f"Generando componente {component_name} a partir de {len(flattened_nodes)} nodos...")
         
-        # Generar el código
-        options = {"component_name": component_name}
-        st.info("Llamando al generador...")
-        code_files = generator.generate(angular_nodes, options)
+        # Convertir a nodos intermedios, analizar el layout y generar el código
+        # Angular (en caché entre reruns)
+        code_files = _generate_code_files(
+            document_digest, len(flattened_nodes), use_material, responsive, component_name, flattened_nodes
+        )
         
         # Verificar resultado
         if not code_files or not isinstance(code_files, dict):
             st.error(f"Error: El generador devolvió un resultado inválido: {type(code_files)}")
+            status.update(state="error")
             return "// Error: Formato de código generado inválido"
         
         # Formatear el resultado para la interfaz
-        st.info("Formateando resultado final...")
         ts_code = code_files.get("ts", "// No se generó código TypeScript")
         html_code = code_files.get("html", "<!-- No se generó código HTML -->")
         scss_code = code_files.get("scss", "/* No se generó código SCSS */")
         
-        # Crear el resultado final
-        result = ""
-        result += f"// component.ts\n{ts_code}\n\n"
-        result += f"<!-- component.html -->\n{html_code}\n\n"
-        result += f"/* component.scss */\n{scss_code}\n"
+        # Crear el resultado final con una sola unión de las partes
+        parts = [
+            "// component.ts\n", ts_code, "\n\n",
+            "<!-- component.html -->\n", html_code, "\n\n",
+            "/* component.scss */\n", scss_code, "\n",
+        ]
         
         # Añadir comentario con instrucciones adicionales procesadas
         if additional_instructions:
-            result += f"\n/* \nInstrucciones adicionales aplicadas:\n{additional_instructions}\n*/\n"
+            parts.extend(("\n/* \nInstrucciones adicionales aplicadas:\n", additional_instructions, "\n*/\n"))
+        
+        result = "".join(parts)
         
-        st.success("Código generado correctamente")
+        status.update(label="Código generado correctamente", state="complete")
         return result
         
     except MemoryError:
         st.error("Error de memoria: El procesamiento requiere demasiados recursos")
+        status.update(state="error")
         return "// Error: Se produjo un error de memoria durante la generación de código.\n// Intente reducir el límite de nodos o utilizar un diseño más simple."
     
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
+        # La traza completa va a la consola, no a la interfaz
+        logger.exception("Error en la generación de código")
         st.error(f"Error en la generación de código: {str(e)}")
-        st.info(f"Detalles del error: {error_details}")
+        status.update(state="error")
         return f"// Error durante la generación de código: {str(e)}\n// Consulte la consola para más detalles"
 
 
@@ -123,7 +221,7 @@ def process_figma_with_mixed_approach(figma_data, openai_api_key, responsive=Tru
                               additional_instructions="", use_azure=False, 
                               azure_endpoint="", azure_model="", 
                               node_limit=50, openai_model="gpt-4o", 
-                              use_material=True):
+                              use_material=True, use_cache=True):
     """
     Función que determina qué enfoque usar para procesar el diseño Figma
     
@@ -138,10 +236,13 @@ def process_figma_with_mixed_approach(figma_data, openai_api_key, responsive=Tru
         node_limit (int): Límite de nodos a procesar
         openai_model (str): El modelo de OpenAI a usar
         use_material (bool): Si se deben usar componentes de Angular Material
+        use_cache (bool): Si se reutiliza la respuesta de una petición idéntica anterior
+            (solo en el enfoque basado en OpenAI)
         
     Returns:
         str: Código Angular generado
     """
+    status = None  # Contenedor de progreso, creado una vez validados los datos
     try:
         # Importar aquí para evitar problemas de importación circular
         from code_generator import generate_angular_code
@@ -157,22 +258,25 @@ def process_figma_with_mixed_approach(figma_data, openai_api_key, responsive=Tru
             st.error("No se pudo obtener el documento de Figma")
             return "// Error: No se encontró documento en los datos de Figma"
             
-        st.info("Analizando estructura del documento...")
+        # Un único contenedor de estado cuya etiqueta se actualiza en cada paso
+        status = st.status("Analizando estructura del documento...", expanded=False)
         
-        # Extraer y aplanar nodos con manejo de errores
+        # Extraer y aplanar nodos con manejo de errores (en caché entre reruns); la
+        # huella del documento se calcula una sola vez y se reutiliza en el generador
         try:
-            extracted_nodes = extract_nodes(document)
-            st.info(f"Extracción inicial: {len(extracted_nodes)} nodos")
-            
+            document_digest = _document_digest(document)
             # Limitar número de nodos antes de aplanar para evitar problemas de memoria
-            if len(extracted_nodes) > 1000:  # Umbral arbitrario para protección
-                st.warning(f"Demasiados nodos extraídos ({len(extracted_nodes)}), truncando a 1000")
-                extracted_nodes = extracted_nodes[:1000]
+            extracted_count, flattened_nodes = _flatten_and_extract(
+                document_digest, document, extract_limit=1000  # Umbral arbitrario para protección
+            )
+            if extracted_count > 1000:
+                st.warning("Demasiados nodos extraídos (más de 1000), truncando a 1000")
+                extracted_count = "más de 1000"
                 
-            flattened_nodes = flatten_figma_tree(extracted_nodes)
-            st.info(f"Nodos aplanados: {len(flattened_nodes)}")
+            status.update(label=f"Extracción inicial: {extracted_count} nodos; nodos aplanados: {len(flattened_nodes)}")
         except Exception as e:
             st.error(f"Error al procesar nodos: {str(e)}")
+            status.update(state="error")
             return f"// Error al procesar nodos del documento: {str(e)}"
         
         # Guardar información para debugging
@@ -184,30 +288,44 @@ def process_figma_with_mixed_approach(figma_data, openai_api_key, responsive=Tru
         }
         
         # Calcular complejidad aproximada
-        st.info("Calculando métricas de complejidad...")
+        status.update(label="Calculando métricas de complejidad...")
+        # Una sola pasada que termina en cuanto todas las señales están encendidas;
+        # auto layout y constraints solo se muestrean en los primeros 100 nodos
+        has_auto_layout = has_constraints = has_vector_nodes = has_text_nodes = False
+        for i, node in enumerate(flattened_nodes):
+            if i < 100:  # Muestreo
+                if "layoutMode" in node:
+                    has_auto_layout = True
+                if "constraints" in node:
+                    has_constraints = True
+            node_type = node.get("type")
+            if node_type == "VECTOR":
+                has_vector_nodes = True
+            elif node_type == "TEXT":
+                has_text_nodes = True
+            if has_auto_layout and has_constraints and has_vector_nodes and has_text_nodes:
+                break
+        
         complexity_factors = {
             "node_count": len(flattened_nodes),
-            "has_auto_layout": any("layoutMode" in node for node in flattened_nodes[:100]),  # Muestreo
-            "has_constraints": any("constraints" in node for node in flattened_nodes[:100]),  # Muestreo
-            "has_vector_nodes": any(node.get("type") == "VECTOR" for node in flattened_nodes),
-            "has_text_nodes": any(node.get("type") == "TEXT" for node in flattened_nodes),
+            "has_auto_layout": has_auto_layout,
+            "has_constraints": has_constraints,
+            "has_vector_nodes": has_vector_nodes,
+            "has_text_nodes": has_text_nodes,
         }
         
         # Actualizar información de debugging
         st.session_state["debug_info"].update(complexity_factors)
         
+        # Si el usuario especificó el uso de Material en instrucciones ("angular material"
+        # ya contiene "material", basta con una búsqueda)
+        use_material_from_instructions = "material" in additional_instructions.lower() if additional_instructions else False
+        
         # Decidir la estrategia basada en la complejidad
         use_enhanced = (
             complexity_factors["has_auto_layout"] or 
             complexity_factors["has_constraints"] or
-            "material" in additional_instructions.lower() or
-            "angular material" in additional_instructions.lower()
-        )
-        
-        # Si el usuario especificó el uso de Material en instrucciones, actualizar la variable
-        use_material_from_instructions = (
-            "material" in additional_instructions.lower() or
-            "angular material" in additional_instructions.lower()
+            use_material_from_instructions
         )
         
         # Combinar la opción del usuario con las instrucciones
@@ -222,21 +340,23 @@ def process_figma_with_mixed_approach(figma_data, openai_api_key, responsive=Tru
         safe_node_limit = min(node_limit, 500)  # Limitar para prevenir problemas de memoria
         
         if use_enhanced:
-            st.info(f"Utilizando generador optimizado con representación intermedia (nodos: {safe_node_limit})...")
+            status.update(label=f"Utilizando generador optimizado con representación intermedia (nodos: {safe_node_limit})...")
             st.session_state["debug_info"]["modo_enhanced"] = True
             return generate_enhanced_angular_code(
                 figma_data, 
                 responsive=responsive,
                 use_material=use_material,
                 additional_instructions=additional_instructions,
-                node_limit=safe_node_limit  # Usar límite seguro
+                node_limit=safe_node_limit,  # Usar límite seguro
+                status=status,
+                document_digest=document_digest
             )
         else:
-            st.info(f"Utilizando generador basado en OpenAI (nodos: {safe_node_limit})...")
+            status.update(label=f"Utilizando generador basado en OpenAI (nodos: {safe_node_limit})...")
             # Configurar variable de entorno para la API key
             os.environ["OPENAI_API_KEY"] = openai_api_key
             
-            return generate_angular_code(
+            code = generate_angular_code(
                 figma_data,
                 responsive=responsive,
                 additional_instructions=additional_instructions,
@@ -244,16 +364,22 @@ def process_figma_with_mixed_approach(figma_data, openai_api_key, responsive=Tru
                 azure_endpoint=azure_endpoint,
                 azure_model=azure_model,
                 node_limit=safe_node_limit,  # Usar límite seguro
-                openai_model=openai_model
+                openai_model=openai_model,
+                use_cache=use_cache
             )
+            status.update(label=f"Código generado con OpenAI (nodos: {safe_node_limit})", state="complete")
+            return code
             
     except MemoryError:
         st.error("Error de memoria: El procesamiento requiere demasiados recursos")
+        if status is not None:
+            status.update(state="error")
         return "// Error: Se produjo un error de memoria durante la generación de código.\n// Intente reducir el límite de nodos o utilizar un diseño más simple."
     
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
+        # La traza completa va a la consola, no a la interfaz
+        logger.exception("Error en el procesamiento")
         st.error(f"Error en el procesamiento: {str(e)}")
-        st.info(f"Detalles del error: {error_details}")
+        if status is not None:
+            status.update(state="error")
         return f"// Error durante el procesamiento: {str(e)}\n// Consulte la consola para más detalles"
\ No newline at end of file
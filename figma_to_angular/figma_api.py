@@ -1,23 +1,113 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
 
+try:
+    from orjson import loads as _loads
+except ImportError:  # orjson is optional; json.loads also accepts raw bytes
+    _loads = json.loads
+
+# Node IDs sent per image request, keeping URLs well under Figma's length limit,
+# and how many of those requests run at once
+IMAGE_IDS_PER_REQUEST = 200
+IMAGE_REQUEST_WORKERS = 8
+
+# Longest Retry-After wait honored between retries, in seconds; longer rate limit
+# waits are cut short so they can't stall the script run
+MAX_RETRY_AFTER = 5
+
+class _CappedRetry(Retry):
+    """Retry policy that waits at most MAX_RETRY_AFTER seconds for a Retry-After header"""
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, MAX_RETRY_AFTER)
+
+# Shared session so every client reuses pooled keep-alive connections to the API;
+# rate limiting and transient server errors are retried with backoff, and once the
+# retries run out the last response is returned for the usual status handling
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=IMAGE_REQUEST_WORKERS,
+    max_retries=_CappedRetry(total=3, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504),
+                             raise_on_status=False)
+))
+
+# Two-digit hex for every 0-255 channel value
+_HEX = tuple(f"{i:02x}" for i in range(256))
+
+# Successful responses kept per client so repeat requests can be revalidated
+# with If-None-Match/If-Modified-Since and answered by a 304
+REVALIDATE_CACHE_SIZE = 8
+
 class FigmaAPI:
     """
     Class to interact with the Figma API
     """
-    def __init__(self, access_token):
+    def __init__(self, access_token, session=None):
         """
         Initialize the Figma API with the access token
         
         Args:
             access_token (str): Figma personal access token
+            session (requests.Session, optional): Session to send requests through;
+                defaults to a module-wide pooled session
         """
         self.access_token = access_token
+        self.session = session if session is not None else _SESSION
         self.base_url = "https://api.figma.com/v1"
         self.headers = {
             "X-Figma-Token": self.access_token
         }
+        self._revalidate_cache = OrderedDict()
+        self._revalidate_lock = threading.Lock()
+    
+    def _get(self, url, params=None):
+        """
+        Send a GET request, revalidating a previously fetched response when possible
+        
+        Args:
+            url (str): The API URL
+            params (dict, optional): Query parameters
+            
+        Returns:
+            tuple: (status code, response body bytes, response). A 304 for a
+                cached response is returned as a 200 with the cached body
+        """
+        key = (url, tuple(sorted(params.items())) if params else ())
+        with self._revalidate_lock:
+            cached = self._revalidate_cache.get(key)
+        
+        headers = {**self.headers, **cached[0]} if cached is not None else self.headers
+        response = self.session.get(url, headers=headers, params=params)
+        
+        if response.status_code == 304 and cached is not None:
+            with self._revalidate_lock:
+                if key in self._revalidate_cache:
+                    self._revalidate_cache.move_to_end(key)
+            return 200, cached[1], response
+        
+        if response.status_code == 200:
+            validators = {}
+            if response.headers.get("ETag"):
+                validators["If-None-Match"] = response.headers["ETag"]
+            if response.headers.get("Last-Modified"):
+                validators["If-Modified-Since"] = response.headers["Last-Modified"]
+            if validators:
+                with self._revalidate_lock:
+                    self._revalidate_cache[key] = (validators, response.content)
+                    self._revalidate_cache.move_to_end(key)
+                    if len(self._revalidate_cache) > REVALIDATE_CACHE_SIZE:
+                        self._revalidate_cache.popitem(last=False)
+        
+        return response.status_code, response.content, response
     
     def get_file(self, file_key, node_id=None):
         """
@@ -45,20 +135,20 @@ class FigmaAPI:
             }
             
             # Make the API request
-            response = requests.get(url, headers=self.headers)
+            status_code, content, response = self._get(url)
             
-            # Save response info for debugging
-            st.session_state['debug_info']["response_status"] = response.status_code
-            st.session_state['debug_info']["response_text"] = response.text[:500] + "..." if len(response.text) > 500 else response.text
+            # Save response info for debugging (decoding only the first 500 bytes of the body)
+            st.session_state['debug_info']["response_status"] = status_code
+            st.session_state['debug_info']["response_text"] = content[:500].decode("utf-8", "replace") + ("..." if len(content) > 500 else "")
             
             # Check if the request was successful
-            if response.status_code == 200:
+            if status_code == 200:
                 # Parse and return the JSON data
-                file_data = response.json()
+                file_data = _loads(content)
                 
                 # Process and clean up the data
                 return self._process_file_data(file_data, node_id)
-            elif response.status_code == 404:
+            elif status_code == 404:
                 # Not Found - Common issue with file key or permissions
                 error_msg = f"Figma API Error: 404 - File Not Found\n\nPossible reasons:\n"
                 error_msg += "1. The file key is incorrect\n"
@@ -67,7 +157,7 @@ class FigmaAPI:
                 error_msg += "\nEnsure your Figma access token has 'files:read' permission"
                 st.error(error_msg)
                 return None
-            elif response.status_code == 403:
+            elif status_code == 403:
                 # Forbidden - Usually a permission issue
                 error_msg = f"Figma API Error: 403 - Access Forbidden\n\nPossible reasons:\n"
                 error_msg += "1. Your access token doesn't have sufficient permissions\n"
@@ -75,7 +165,7 @@ class FigmaAPI:
                 error_msg += "\nCreate a new Personal Access Token with 'files:read' permission"
                 st.error(error_msg)
                 return None
-            elif response.status_code == 401:
+            elif status_code == 401:
                 # Unauthorized - Invalid token
                 error_msg = f"Figma API Error: 401 - Unauthorized\n\nPossible reasons:\n"
                 error_msg += "1. Invalid access token\n"
@@ -85,7 +175,7 @@ class FigmaAPI:
                 return None
             else:
                 # Handle other API errors
-                error_msg = f"Figma API Error: {response.status_code} - {response.text}"
+                error_msg = f"Figma API Error: {status_code} - {response.text}"
                 st.error(error_msg)
                 return None
                 
@@ -109,25 +199,31 @@ class FigmaAPI:
             # Construct the API URL
             url = f"{self.base_url}/images/{file_key}"
             
-            # Prepare the query parameters
-            params = {
-                "ids": ",".join(ids),
-                "scale": scale,
-                "format": "svg"
-            }
-            
-            # Make the API request
-            response = requests.get(url, headers=self.headers, params=params)
+            # Request the IDs in chunks, concurrently when there is more than one
+            ids = list(ids)
+            chunks = [ids[i:i + IMAGE_IDS_PER_REQUEST] for i in range(0, len(ids), IMAGE_IDS_PER_REQUEST)] or [[]]
+            params_list = [{"ids": ",".join(chunk), "scale": scale, "format": "svg"} for chunk in chunks]
             
-            # Check if the request was successful
-            if response.status_code == 200:
-                # Parse and return the JSON data
-                return response.json().get("images", {})
+            # Make the API requests
+            if len(params_list) == 1:
+                results = [self._get(url, params_list[0])]
             else:
-                # Handle API errors
-                error_msg = f"Figma API Error (images): {response.status_code} - {response.text}"
-                st.error(error_msg)
-                return {}
+                with ThreadPoolExecutor(max_workers=min(IMAGE_REQUEST_WORKERS, len(params_list))) as executor:
+                    results = list(executor.map(lambda params: self._get(url, params), params_list))
+            
+            images = {}
+            for status_code, content, response in results:
+                # Check if the request was successful
+                if status_code == 200:
+                    # Parse and merge the JSON data
+                    images.update(_loads(content).get("images") or {})
+                else:
+                    # Handle API errors
+                    error_msg = f"Figma API Error (images): {status_code} - {response.text}"
+                    st.error(error_msg)
+                    return {}
+            
+            return images
                 
         except Exception as e:
             st.error(f"Error fetching Figma images: {str(e)}")
@@ -181,12 +277,12 @@ class FigmaAPI:
         """
         try:
             url = f"{self.base_url}/files/{file_key}/styles"
-            response = requests.get(url, headers=self.headers)
+            status_code, content, response = self._get(url)
             
-            if response.status_code == 200:
-                return response.json()
+            if status_code == 200:
+                return _loads(content)
             else:
-                error_msg = f"Figma API Error (styles): {response.status_code} - {response.text}"
+                error_msg = f"Figma API Error (styles): {status_code} - {response.text}"
                 st.error(error_msg)
                 return {"meta": {"styles": []}}
                 
@@ -205,12 +301,20 @@ class FigmaAPI:
             dict: Dictionary of color styles
         """
         colors = {}
+        seen = {}  # (r, g, b, opacity) -> (hex, rgba)
         
-        def traverse_node(node):
-            # Check for fills with solid colors
-            if "fills" in node and node["fills"]:
-                for fill in node["fills"]:
-                    if fill["type"] == "SOLID" and "color" in fill:
+        # Walk the tree in pre-order with an explicit stack, so deep documents
+        # can't hit the recursion limit
+        stack = [document]
+        while stack:
+            node = stack.pop()
+            
+            # Check for fills with solid colors on named nodes
+            fills = node.get("fills")
+            if fills and "name" in node:
+                name = node["name"]
+                for fill in fills:
+                    if fill.get("type") == "SOLID" and "color" in fill:
                         color = fill["color"]
                         # Convert RGB values (0-1) to hex
                         r = int(color["r"] * 255)
@@ -218,20 +322,24 @@ class FigmaAPI:
                         b = int(color["b"] * 255)
                         opacity = color.get("a", 1)
                         
-                        hex_color = f"#{r:02x}{g:02x}{b:02x}"
+                        # Palettes repeat across many nodes, so each distinct
+                        # color is formatted only once
+                        key = (r, g, b, opacity)
+                        formatted = seen.get(key)
+                        if formatted is None:
+                            formatted = seen[key] = (
+                                "#" + _HEX[r] + _HEX[g] + _HEX[b],
+                                "rgba(%d, %d, %d, %s)" % (r, g, b, opacity)
+                            )
                         
-                        # Add to colors dict if it has a name
-                        if "name" in node:
-                            colors[node["name"]] = {
-                                "hex": hex_color,
-                                "rgba": f"rgba({r}, {g}, {b}, {opacity})"
-                            }
-            
-            # Recursively traverse children
-            if "children" in node:
-                for child in node["children"]:
-                    traverse_node(child)
+                        colors[name] = {
+                            "hex": formatted[0],
+                            "rgba": formatted[1]
+                        }
+            
+            # Push children in reverse so they are visited in document order
+            children = node.get("children")
+            if children:
+                stack.extend(reversed(children))
         
-        # Start traversal from the document root
-        traverse_node(document)
         return colors
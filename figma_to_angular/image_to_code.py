@@ -1,9 +1,12 @@
 import os
+import re
 import base64
 from io import BytesIO
 from PIL import Image
 import streamlit as st
-from openai import OpenAI
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from code_generator import _cached_completion, _extract_component_files, _get_openai_client, _get_azure_client
 
 def encode_image_to_base64(image_file):
     """
@@ -15,222 +18,148 @@ def encode_image_to_base64(image_file):
     Returns:
         str: Base64 encoded string
     """
-    if hasattr(image_file, "read"):
+    if hasattr(image_file, "getbuffer"):
+        # In-memory buffer: encode its contents from the current position
+        # without copying them out first
+        with image_file.getbuffer() as view:
+            base64_encoded = base64.b64encode(view[image_file.tell():])
+    elif hasattr(image_file, "read"):
         # If it's a file-like object
-        img_data = image_file.read()
+        base64_encoded = base64.b64encode(image_file.read())
     else:
         # If it's a path
         with open(image_file, "rb") as f:
-            img_data = f.read()
+            base64_encoded = base64.b64encode(f.read())
             
-    # Convert to base64
-    base64_encoded = base64.b64encode(img_data).decode("utf-8")
-    return base64_encoded
+    # Base64 output is plain ASCII
+    return base64_encoded.decode("ascii")
+
+def _byte_length(image_file):
+    """Size in bytes of raw image bytes, an in-memory buffer or a path; None if unknown"""
+    if isinstance(image_file, memoryview):
+        return image_file.nbytes
+    if isinstance(image_file, (bytes, bytearray)):
+        return len(image_file)
+    if hasattr(image_file, "getbuffer"):
+        return image_file.getbuffer().nbytes
+    if isinstance(image_file, (str, os.PathLike)):
+        return os.path.getsize(image_file)
+    return None
+
+def _to_rgb(img):
+    """Convert an image to RGB for JPEG, flattening any transparency onto white"""
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+    return img.convert("RGB")
 
 def resize_image_if_needed(image_file, max_size=10*1024*1024):
     """
     Resize an image if it's too large (for API limits)
     
     Args:
-        image_file: Image file (BytesIO or path)
+        image_file: Image file (BytesIO, raw bytes or path)
         max_size: Maximum file size in bytes
         
     Returns:
-        BytesIO: Processed image in BytesIO object
+        BytesIO: Processed image in BytesIO object (a JPEG if it had to be shrunk)
     """
+    # Other file-like objects are read once so their size is known
+    size = _byte_length(image_file)
+    if size is None:
+        image_file.seek(0)  # Reset file pointer to beginning
+        image_file = image_file.read()
+        size = len(image_file)
+    
+    # An upload already within the budget is returned as is, without decoding
+    # and re-encoding it just to measure its size
+    if size <= max_size:
+        if isinstance(image_file, (bytes, bytearray, memoryview)):
+            return BytesIO(image_file)
+        if hasattr(image_file, "seek"):
+            image_file.seek(0)
+            return image_file
+        with open(image_file, "rb") as f:
+            return BytesIO(f.read())
+    
     # Read the image
-    if hasattr(image_file, "read"):
+    if isinstance(image_file, (bytes, bytearray, memoryview)):
+        img = Image.open(BytesIO(image_file))
+    elif hasattr(image_file, "read"):
         image_file.seek(0)  # Reset file pointer to beginning
         img = Image.open(image_file)
     else:
         img = Image.open(image_file)
     
-    # Check file size with BytesIO
-    temp_buffer = BytesIO()
-    img.save(temp_buffer, format=img.format or "PNG")
-    current_size = temp_buffer.tell()
+    # Oversized uploads are mostly PNG screenshots; as a JPEG the same pixels
+    # are usually several times smaller, which often fits the budget without
+    # shrinking the image and losing layout detail
+    img = _to_rgb(img)
+    output_buffer = BytesIO()
+    img.save(output_buffer, format="JPEG", quality=85, optimize=True)
+    current_size = output_buffer.tell()
     
-    # If the image is already small enough, return it
+    # If the image is now small enough, return it
     if current_size <= max_size:
-        temp_buffer.seek(0)
-        return temp_buffer
+        output_buffer.seek(0)
+        return output_buffer
+    
+    # The full-size JPEG is only needed for its size from here on
+    output_buffer.close()
     
     # Calculate scale factor to reduce size
     scale_factor = (max_size / current_size) ** 0.5 * 0.9  # 0.9 is a safety factor
     new_width = int(img.width * scale_factor)
     new_height = int(img.height * scale_factor)
     
-    # Resize the image
-    resized_img = img.resize((new_width, new_height), Image.LANCZOS)
+    # Resize the image; reducing_gap shrinks by whole factors with a cheap box
+    # reduction first and runs Lanczos only on the last step. The image is only
+    # sent to the vision API, so the tiny quality difference doesn't matter
+    resized_img = img.resize((new_width, new_height), Image.LANCZOS, reducing_gap=3.0)
     
     # Save to buffer
     output_buffer = BytesIO()
-    resized_img.save(output_buffer, format=img.format or "PNG")
+    resized_img.save(output_buffer, format="JPEG", quality=85, optimize=True)
     output_buffer.seek(0)
     
     return output_buffer
 
-def generate_angular_from_image(image_file, responsive=True, additional_instructions="", use_azure=False, azure_endpoint="", azure_model="", openai_model="gpt-4o"):
-    """
-    Generate Angular component code from an image using OpenAI Vision API
-    
-    Args:
-        image_file: The uploaded image file
-        responsive: Whether to make the component responsive
-        additional_instructions: Additional instructions for code generation
-        use_azure: Whether to use Azure OpenAI
-        azure_endpoint: Azure endpoint URL
-        azure_model: Azure model name
-        openai_model: OpenAI model to use
-        
-    Returns:
-        str: Generated Angular component code (HTML, TS, SCSS)
-    """
-    try:
-        # Process the image (resize if needed)
-        processed_image = resize_image_if_needed(image_file)
-        
-        # Convert the image to base64
-        base64_image = encode_image_to_base64(processed_image)
-        
-        # Responsive text for the prompt
-        responsive_text = "Ensure the layout is fully responsive and works well on all screen sizes." if responsive else "Focus on pixel-perfect implementation for desktop screens."
-        
-        # Build system message
-        system_message = "You are an expert Angular developer specializing in converting designs to Angular components with TypeScript, HTML templates, and SCSS styles."
-        
-        # Build the user prompt
-        prompt = f"""Please convert this image into Angular component code.
+# First bytes of every PNG file
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
 
-EXACT DESIGN DETAILS:
-Focus on creating a pixel-perfect recreation of the design shown in the image.
+# Most images converted per vision request by generate_angular_from_images.
+# Each image gets MAX_TOKENS_PER_IMAGE output tokens, so a batch only goes out
+# when the model's output limit covers all of them
+IMAGES_PER_REQUEST = 3
+MAX_TOKENS_PER_IMAGE = 4500
 
-Requirements:
-1. Generate complete, valid Angular component code based on the design.
-2. Create THREE files:
-   - component.ts (TypeScript class with @Component decorator)
-   - component.html (Angular template with EXACT structure matching design)
-   - component.scss (SCSS with PRECISE styling matching design)
-3. {responsive_text}
-4. Follow Angular best practices
-5. Use semantic HTML (section, article, nav, etc. as appropriate)
-6. Use CSS Grid AND Flexbox for layout as needed
-7. Match ALL visual details: colors, fonts, spacing, borders, shadows, etc.
-8. Do not substitute or simplify ANY visual elements
-9. Include ALL text content exactly as shown in the design
-10. Generate ALL necessary CSS for the layout to work properly
+# Output token limit of the OpenAI models known to take larger batches; older
+# snapshots and unknown models are assumed to stop at DEFAULT_MAX_OUTPUT_TOKENS
+MODEL_MAX_OUTPUT_TOKENS = {
+    "gpt-4o": 16384,
+    "gpt-4o-2024-08-06": 16384,
+    "gpt-4o-2024-11-20": 16384,
+    "gpt-4o-mini": 16384,
+    "gpt-4o-mini-2024-07-18": 16384,
+}
+DEFAULT_MAX_OUTPUT_TOKENS = 4096
 
-{additional_instructions}
+# Heading that opens each image's section in a batched response
+_IMAGE_SECTION_RE = re.compile(r"^[#*\s]*image_(\d+)\b.*$", re.MULTILINE | re.IGNORECASE)
 
-Return the complete Angular component files. Include all three files (TS, HTML, SCSS) in your response, each in its own code block.
-"""
-        
-        # Generate code using OpenAI API (standard or Azure)
-        if use_azure and azure_endpoint and azure_model:
-            import openai
-            from openai import AzureOpenAI
-            
-            # Use Azure OpenAI API
-            st.info(f"Using Azure OpenAI API with model: {azure_model}")
-            
-            # Set up Azure OpenAI client
-            client = AzureOpenAI(
-                azure_endpoint=azure_endpoint,
-                api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-                api_version="2023-05-15"  # Update to the latest API version
-            )
-            
-            # Azure OpenAI call with vision capabilities
-            response = client.chat.completions.create(
-                model=azure_model,
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": [
-                        {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
-                    ]}
-                ],
-                temperature=0.3,
-                max_tokens=4500
-            )
-        else:
-            # Use standard OpenAI API
-            # Initialize OpenAI client with current API key
-            openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-            
-            # Use the model provided or fallback to default
-            model_name = openai_model if openai_model else "gpt-4o"
-            
-            st.info(f"Using standard OpenAI API with model: {model_name}")
-            
-            response = openai_client.chat.completions.create(
-                model=model_name,
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": [
-                        {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
-                    ]}
-                ],
-                temperature=0.3,
-                max_tokens=4500
-            )
-        
-        # Extract the generated code
-        generated_code = response.choices[0].message.content
-        
-        # Process the Angular component files (extract from markdown code blocks)
-        processed_response = ""
-        
-        # Extract TypeScript component code
-        if "```typescript" in generated_code or "```ts" in generated_code:
-            ts_start = generated_code.find("```typescript")
-            if ts_start == -1: 
-                ts_start = generated_code.find("```ts")
-                ts_start = ts_start + 5 if ts_start != -1 else -1
-            else:
-                ts_start = ts_start + 13
-                
-            if ts_start != -1:
-                ts_end = generated_code.find("```", ts_start)
-                ts_code = generated_code[ts_start:ts_end].strip()
-                processed_response += "// component.ts\n" + ts_code + "\n\n"
-        
-        # Extract HTML template code
-        if "```html" in generated_code:
-            html_start = generated_code.find("```html") + 7
-            html_end = generated_code.find("```", html_start)
-            html_code = generated_code[html_start:html_end].strip()
-            processed_response += "<!-- component.html -->\n" + html_code + "\n\n"
-        
-        # Extract SCSS style code
-        if "```scss" in generated_code or "```css" in generated_code:
-            scss_start = generated_code.find("```scss")
-            if scss_start == -1: 
-                scss_start = generated_code.find("```css")
-                scss_start = scss_start + 6 if scss_start != -1 else -1
-            else:
-                scss_start = scss_start + 7
-                
-            if scss_start != -1:
-                scss_end = generated_code.find("```", scss_start)
-                scss_code = generated_code[scss_start:scss_end].strip()
-                processed_response += "/* component.scss */\n" + scss_code + "\n"
-                
-        # If no code blocks were found, return the raw response
-        if not processed_response:
-            return "/* No properly formatted code blocks found in response */\n\n" + generated_code
-            
-        return processed_response
-    
-    except Exception as e:
-        error_message = f"""
+SYSTEM_MESSAGE = "You are an expert Angular developer specializing in converting designs to Angular components with TypeScript, HTML templates, and SCSS styles."
+
+# Placeholder component returned when generation fails; `error` is shown in the
+# comment and `error_js` (without single quotes) in the TypeScript string literal
+ERROR_COMPONENT_TEMPLATE = """
 // Error in Angular component generation from image
 
 /**
  * ERROR DETAILS
  * -------------
- * {str(e)}
+ * {error}
  */
 
 // component.ts
@@ -242,7 +171,7 @@ import {{ Component, OnInit }} from '@angular/core';
   styleUrls: ['./error.component.scss']
 }})
 export class ErrorComponent implements OnInit {{
-  errorMessage = '{str(e).replace("'", "")}';
+  errorMessage = '{error_js}';
   
   constructor() {{ }}
   
@@ -285,4 +214,250 @@ pre {{
   border-radius: 4px;
 }}
 """
-        return error_message
\ No newline at end of file
+
+def _build_prompt(responsive, additional_instructions, image_count=1):
+    """Build the user prompt for converting one image, or a batch of `image_count` images"""
+    # Responsive text for the prompt
+    responsive_text = "Ensure the layout is fully responsive and works well on all screen sizes." if responsive else "Focus on pixel-perfect implementation for desktop screens."
+    
+    if image_count == 1:
+        intro = "Please convert this image into Angular component code."
+        closing = "Return the complete Angular component files. Include all three files (TS, HTML, SCSS) in your response, each in its own code block."
+    else:
+        intro = f"Please convert each of these {image_count} images into its own Angular component code."
+        closing = (
+            "Return the complete Angular component files for every image, in the order the images were given. "
+            f"Start each image's answer with a line containing only its label (image_1 to image_{image_count}), "
+            "followed by all three files (TS, HTML, SCSS), each in its own code block."
+        )
+    
+    return f"""{intro}
+
+EXACT DESIGN DETAILS:
+Focus on creating a pixel-perfect recreation of the design shown in the image.
+
+Requirements:
+1. Generate complete, valid Angular component code based on the design.
+2. Create THREE files:
+   - component.ts (TypeScript class with @Component decorator)
+   - component.html (Angular template with EXACT structure matching design)
+   - component.scss (SCSS with PRECISE styling matching design)
+3. {responsive_text}
+4. Follow Angular best practices
+5. Use semantic HTML (section, article, nav, etc. as appropriate)
+6. Use CSS Grid AND Flexbox for layout as needed
+7. Match ALL visual details: colors, fonts, spacing, borders, shadows, etc.
+8. Do not substitute or simplify ANY visual elements
+9. Include ALL text content exactly as shown in the design
+10. Generate ALL necessary CSS for the layout to work properly
+
+{additional_instructions}
+
+{closing}
+"""
+
+def _select_client(use_azure, azure_endpoint, azure_model, openai_model):
+    """
+    Pick the API to send the vision request to
+    
+    Returns:
+        tuple: (client factory, provider for the cache key, model name)
+    """
+    if use_azure and azure_endpoint and azure_model:
+        # Use Azure OpenAI API
+        st.info(f"Using Azure OpenAI API with model: {azure_model}")
+        
+        # Azure OpenAI client, shared with earlier calls using the same settings
+        create_client = partial(
+            _get_azure_client,
+            azure_endpoint,
+            os.getenv("AZURE_OPENAI_API_KEY"),
+            "2023-05-15"  # Update to the latest API version
+        )
+        return create_client, f"azure:{azure_endpoint}", azure_model
+    
+    # Use standard OpenAI API
+    # OpenAI client for the current API key, shared with earlier calls so its
+    # keep-alive connections are reused
+    create_client = partial(_get_openai_client, os.getenv("OPENAI_API_KEY"))
+    
+    # Use the model provided or fallback to default
+    model_name = openai_model if openai_model else "gpt-4o"
+    
+    st.info(f"Using standard OpenAI API with model: {model_name}")
+    return create_client, "openai", model_name
+
+def _images_per_request(use_azure, azure_endpoint, azure_model, openai_model):
+    """How many images fit in one vision request without exceeding the model's output limit"""
+    if use_azure and azure_endpoint and azure_model:
+        # A deployment name says nothing about the model behind it
+        return 1
+    
+    limit = MODEL_MAX_OUTPUT_TOKENS.get(openai_model or "gpt-4o", DEFAULT_MAX_OUTPUT_TOKENS)
+    return max(1, min(IMAGES_PER_REQUEST, limit // MAX_TOKENS_PER_IMAGE))
+
+def _image_part(image_file):
+    """Resize (if needed) and inline an image as an image_url message part"""
+    # Process the image (resize if needed)
+    processed_image = resize_image_if_needed(image_file)
+    
+    # Uploads within the budget keep their format; anything re-encoded is a JPEG
+    with processed_image.getbuffer() as view:
+        mime_type = "image/png" if view[:8] == _PNG_SIGNATURE else "image/jpeg"
+    
+    # Convert the image to base64
+    base64_image = encode_image_to_base64(processed_image)
+    
+    return {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{base64_image}"}}
+
+def _image_parts(image_files):
+    """Image parts for a batch of images, in order"""
+    return [_image_part(image_file) for image_file in image_files]
+
+def _process_generated_code(generated_code):
+    """
+    Extract the component files from the markdown code blocks of a response
+    
+    Returns:
+        str: The files with their headers, or the raw response with a note if no code blocks were found
+    """
+    # Extract the files in one pass over the response, shared with the Figma path
+    processed_response = _extract_component_files(generated_code)
+    
+    # If no code blocks were found, return the raw response
+    if not processed_response:
+        return "/* No properly formatted code blocks found in response */\n\n" + generated_code
+    
+    return processed_response
+
+def _error_component(e):
+    """Placeholder component that reports an error from the generation"""
+    return ERROR_COMPONENT_TEMPLATE.format(error=str(e), error_js=str(e).replace("'", ""))
+
+def generate_angular_from_image(image_file, responsive=True, additional_instructions="", use_azure=False, azure_endpoint="", azure_model="", openai_model="gpt-4o", use_cache=True, image_url_override=None):
+    """
+    Generate Angular component code from an image using OpenAI Vision API
+    
+    Args:
+        image_file: The uploaded image file, or its raw bytes
+        responsive: Whether to make the component responsive
+        additional_instructions: Additional instructions for code generation
+        use_azure: Whether to use Azure OpenAI
+        azure_endpoint: Azure endpoint URL
+        azure_model: Azure model name
+        openai_model: OpenAI model to use
+        use_cache: Whether to reuse the response of an identical earlier request
+            (same image, prompt, model and options)
+        image_url_override: Publicly reachable URL of the image (PNG, JPEG, GIF or WebP);
+            when given, the API fetches the image itself and image_file isn't read
+        
+    Returns:
+        str: Generated Angular component code (HTML, TS, SCSS)
+    """
+    try:
+        if image_url_override:
+            # Hosted image: send the URL instead of inlining the base64 bytes
+            image_part = {"type": "image_url", "image_url": {"url": image_url_override}}
+        else:
+            image_part = _image_part(image_file)
+        
+        # Build the user prompt
+        prompt = _build_prompt(responsive, additional_instructions)
+        
+        # Generate code using OpenAI API (standard or Azure)
+        create_client, provider, model_name = _select_client(use_azure, azure_endpoint, azure_model, openai_model)
+        
+        # Vision call; the image is part of the request, so it is also part of
+        # the cache key and only an identical upload reuses a response
+        generated_code = _cached_completion(
+            create_client,
+            provider,
+            use_cache,
+            model=model_name,
+            messages=[
+                {"role": "system", "content": SYSTEM_MESSAGE},
+                {"role": "user", "content": [
+                    {"type": "text", "text": prompt},
+                    image_part
+                ]}
+            ],
+            temperature=0.3,
+            max_tokens=MAX_TOKENS_PER_IMAGE
+        )
+        
+        return _process_generated_code(generated_code)
+    
+    except Exception as e:
+        return _error_component(e)
+
+def _split_image_sections(generated_code, image_count):
+    """Split a batched response into the text answering each image (None where a section is missing)"""
+    sections = [None] * image_count
+    matches = list(_IMAGE_SECTION_RE.finditer(generated_code))
+    for i, match in enumerate(matches):
+        index = int(match.group(1)) - 1
+        if 0 <= index < image_count and sections[index] is None:
+            end = matches[i + 1].start() if i + 1 < len(matches) else len(generated_code)
+            sections[index] = generated_code[match.end():end]
+    return sections
+
+def generate_angular_from_images(image_files, responsive=True, additional_instructions="", use_azure=False, azure_endpoint="", azure_model="", openai_model="gpt-4o", use_cache=True):
+    """
+    Generate Angular component code for several images, sending up to
+    IMAGES_PER_REQUEST of them in each vision request. Azure deployments and
+    models whose output limit can't hold a batch get one request per image
+    
+    Args:
+        image_files: The uploaded image files, or their raw bytes
+        (the other arguments are as in generate_angular_from_image)
+        
+    Returns:
+        list: Generated Angular component code for each image, in order
+    """
+    image_files = list(image_files)
+    images_per_request = _images_per_request(use_azure, azure_endpoint, azure_model, openai_model)
+    if len(image_files) <= 1 or images_per_request == 1:
+        return [generate_angular_from_image(image_file, responsive, additional_instructions, use_azure, azure_endpoint, azure_model, openai_model, use_cache) for image_file in image_files]
+    
+    try:
+        create_client, provider, model_name = _select_client(use_azure, azure_endpoint, azure_model, openai_model)
+    except Exception as e:
+        return [_error_component(e)] * len(image_files)
+    
+    batches = [image_files[start:start + images_per_request] for start in range(0, len(image_files), images_per_request)]
+    
+    results = []
+    # One encoder thread resizes and encodes the next batch while the current
+    # request waits on the API, so the CPU and network phases overlap
+    with ThreadPoolExecutor(max_workers=1) as encoder:
+        pending = encoder.submit(_image_parts, batches[0])
+        for index, batch in enumerate(batches):
+            encoded = pending
+            if index + 1 < len(batches):
+                pending = encoder.submit(_image_parts, batches[index + 1])
+            
+            try:
+                prompt = _build_prompt(responsive, additional_instructions, len(batch))
+                generated_code = _cached_completion(
+                    create_client,
+                    provider,
+                    use_cache,
+                    model=model_name,
+                    messages=[
+                        {"role": "system", "content": SYSTEM_MESSAGE},
+                        {"role": "user", "content": [{"type": "text", "text": prompt}] + encoded.result()}
+                    ],
+                    temperature=0.3,
+                    max_tokens=MAX_TOKENS_PER_IMAGE * len(batch)
+                )
+            except Exception as e:
+                results.extend([_error_component(e)] * len(batch))
+                continue
+            
+            for section in _split_image_sections(generated_code, len(batch)):
+                if section is None:
+                    results.append("/* No section for this image found in response */\n\n" + generated_code)
+                else:
+                    results.append(_process_generated_code(section))
+    
+    return results
@@ -0,0 +1,242 @@
+"""
+Kernels numéricos para el análisis de layout de los hijos de un contenedor
+
+Trabajan sobre arrays float64 paralelos (posiciones y tamaños) y solo usan
+operaciones de NumPy soportadas por Numba. Si Numba está instalado y la
+variable de entorno FIGMA_TO_ANGULAR_NUMBA=1 está definida, se compilan con
+@njit; en caso contrario se ejecutan como funciones NumPy normales.
+"""
+
+import os
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # Numba es opcional
+    njit = None
+
+USE_NUMBA = njit is not None and os.environ.get("FIGMA_TO_ANGULAR_NUMBA", "0") == "1"
+
+# Códigos de alineación devueltos por detect_alignment
+ALIGN_NONE = 0
+ALIGN_START = 1
+ALIGN_END = 2
+ALIGN_CENTER = 3
+ALIGN_SPACE_BETWEEN = 4
+
+
+def _jit(func):
+    """Compila la función con Numba cuando está habilitado"""
+    if USE_NUMBA:
+        return njit(cache=True)(func)
+    return func
+
+
+@_jit
+def aligned_along(main, cross):
+    """
+    Verifica si los elementos comparten posición en el eje cruzado (±5px
+    respecto al promedio) y están repartidos en el eje principal (>20px)
+    """
+    if main.shape[0] < 2:
+        return False
+
+    if not np.all(np.abs(cross - cross.mean()) <= 5.0):
+        return False
+
+    return main.max() - main.min() > 20.0
+
+
+@_jit
+def average_spacing(starts, extents, order):
+    """
+    Calcula el espaciado positivo promedio entre elementos adyacentes en un eje
+
+    `order` son los índices que ordenan `starts` (argsort estable), calculados
+    una sola vez por contenedor
+    """
+    if starts.shape[0] < 2:
+        return 0.0
+
+    sorted_starts = starts[order]
+    sorted_extents = extents[order]
+
+    spacings = sorted_starts[1:] - (sorted_starts[:-1] + sorted_extents[:-1])
+    positive = spacings[spacings > 0]
+    if positive.shape[0] == 0:
+        return 0.0
+    return positive.mean()
+
+
+@_jit
+def detect_alignment(starts, extents):
+    """Detecta la alineación de los elementos en un eje; devuelve un código ALIGN_*"""
+    count = starts.shape[0]
+    if count == 0:
+        return ALIGN_NONE
+
+    start_min = starts.min()
+    start_max = starts.max()
+
+    # Alineación al inicio
+    if np.all(np.abs(starts - start_min) < 5.0):
+        return ALIGN_START
+
+    # Alineación al final
+    ends = starts + extents
+    if np.all(np.abs(ends - ends.max()) < 5.0):
+        return ALIGN_END
+
+    # Alineación central
+    centers = starts + extents / 2
+    if np.all(np.abs(centers - centers.mean()) < 10.0):
+        return ALIGN_CENTER
+
+    # Espaciado uniforme (hay más de una posición distinta si max > min)
+    if start_max > start_min and count > 2:
+        return ALIGN_SPACE_BETWEEN
+
+    return ALIGN_NONE
+
+
+@_jit
+def grid_bands(positions):
+    """
+    Agrupa posiciones en bandas de decenas (redondeo al par, como round())
+
+    Returns:
+        Tupla (número de bandas, índice de banda de cada elemento)
+    """
+    buckets = np.round(positions / 10.0)
+    bands = np.unique(buckets)
+    return bands.shape[0], np.searchsorted(bands, buckets)
+
+
+@_jit
+def _average_band_gap_loop(starts, extents, band_index, band_count):
+    """Versión con un bucle por elemento de average_band_gap, para compilar con Numba"""
+    if band_count < 2:
+        return 0.0
+
+    band_starts = np.full(band_count, np.inf)
+    band_ends = np.full(band_count, -np.inf)
+    for i in range(starts.shape[0]):
+        band = band_index[i]
+        band_starts[band] = min(band_starts[band], starts[i])
+        band_ends[band] = max(band_ends[band], starts[i] + extents[i])
+
+    return (band_starts[1:] - band_ends[:-1]).mean()
+
+
+def _average_band_gap_reduceat(starts, extents, band_index, band_count):
+    """Versión de average_band_gap con reduceat sobre los elementos ordenados por banda"""
+    if band_count < 2:
+        return 0.0
+
+    order = np.argsort(band_index, kind="stable")
+    boundaries = np.searchsorted(band_index[order], np.arange(band_count))
+    band_starts = np.minimum.reduceat(starts[order], boundaries)
+    band_ends = np.maximum.reduceat((starts + extents)[order], boundaries)
+    return (band_starts[1:] - band_ends[:-1]).mean()
+
+
+# Gap promedio entre bandas consecutivas (columnas o filas): inicio mínimo de la
+# banda siguiente menos el final máximo de la actual. Numba compila el bucle;
+# sin Numba el bucle sería Python puro, así que se usa reduceat
+average_band_gap = _average_band_gap_loop if USE_NUMBA else _average_band_gap_reduceat
+
+
+def spacing_along(starts, extents):
+    """Espaciado positivo promedio en un eje, ordenando los elementos una sola vez"""
+    return float(average_spacing(starts, extents, np.argsort(starts, kind="stable")))
+
+
+# Versiones escalares de los kernels para contenedores pequeños. Con pocos
+# hijos construir los arrays cuesta más que lo que ahorran las operaciones
+# vectorizadas, así que trabajan sobre listas de floats con la misma semántica
+
+
+def aligned_along_small(main, cross):
+    """Versión escalar de aligned_along"""
+    if len(main) < 2:
+        return False
+
+    cross_avg = sum(cross) / len(cross)
+    for value in cross:
+        if abs(value - cross_avg) > 5.0:
+            return False
+
+    return max(main) - min(main) > 20.0
+
+
+def spacing_along_small(starts, extents):
+    """Versión escalar de spacing_along (sorted es estable, como el argsort)"""
+    if len(starts) < 2:
+        return 0.0
+
+    order = sorted(range(len(starts)), key=starts.__getitem__)
+    total = 0.0
+    count = 0
+    for current, following in zip(order, order[1:]):
+        spacing = starts[following] - (starts[current] + extents[current])
+        if spacing > 0:
+            total += spacing
+            count += 1
+    return total / count if count else 0.0
+
+
+def detect_alignment_small(starts, extents):
+    """Versión escalar de detect_alignment"""
+    count = len(starts)
+    if count == 0:
+        return ALIGN_NONE
+
+    start_min = min(starts)
+    start_max = max(starts)
+
+    # Alineación al inicio
+    if all(abs(start - start_min) < 5.0 for start in starts):
+        return ALIGN_START
+
+    # Alineación al final
+    ends = [start + extent for start, extent in zip(starts, extents)]
+    end_max = max(ends)
+    if all(abs(end - end_max) < 5.0 for end in ends):
+        return ALIGN_END
+
+    # Alineación central
+    centers = [start + extent / 2 for start, extent in zip(starts, extents)]
+    center_avg = sum(centers) / count
+    if all(abs(center - center_avg) < 10.0 for center in centers):
+        return ALIGN_CENTER
+
+    # Espaciado uniforme
+    if start_max > start_min and count > 2:
+        return ALIGN_SPACE_BETWEEN
+
+    return ALIGN_NONE
+
+
+def grid_bands_small(positions):
+    """Versión escalar de grid_bands; round() también redondea al par"""
+    buckets = [round(position / 10.0) for position in positions]
+    band_of = {bucket: band for band, bucket in enumerate(sorted(set(buckets)))}
+    return len(band_of), [band_of[bucket] for bucket in buckets]
+
+
+def average_band_gap_small(starts, extents, band_index, band_count):
+    """Versión escalar de average_band_gap"""
+    if band_count < 2:
+        return 0.0
+
+    band_starts = [float("inf")] * band_count
+    band_ends = [float("-inf")] * band_count
+    for start, extent, band in zip(starts, extents, band_index):
+        if start < band_starts[band]:
+            band_starts[band] = start
+        end = start + extent
+        if end > band_ends[band]:
+            band_ends[band] = end
+
+    return sum(band_starts[band + 1] - band_ends[band] for band in range(band_count - 1)) / (band_count - 1)
@@ -14,6 +14,7 @@ setup(
         "numpy>=1.24.3",
         "msgpack>=1.0.7",
         "anthropic>=0.7.8",
+        "orjson>=3.9.10",
     ],
     author="Tu Nombre",
     author_email="tu@email.com",
@@ -1,5 +1,12 @@
 import os
 import re
+import logging
+from itertools import islice
+
+logger = logging.getLogger(__name__)
+
+# Valid Figma file key; \Z (unlike $) doesn't let a trailing newline through
+_FILE_KEY_RE = re.compile(r'^[a-zA-Z0-9_-]+\Z')
 
 def save_file(file_path, content):
     """
@@ -14,7 +21,7 @@ def save_file(file_path, content):
             file.write(content)
         return True
     except Exception as e:
-        print(f"Error saving file: {str(e)}")
+        logger.exception("Error saving file: %s", e)
         return False
 
 def read_file(file_path):
@@ -33,7 +40,7 @@ def read_file(file_path):
                 return file.read()
         return ""
     except Exception as e:
-        print(f"Error reading file: {str(e)}")
+        logger.exception("Error reading file: %s", e)
         return ""
 
 def validate_inputs(file_key, access_token, openai_api_key):
@@ -58,79 +65,102 @@ def validate_inputs(file_key, access_token, openai_api_key):
         return False, "OpenAI API key is required"
     
     # Check if file_key is in valid format
-    if not re.match(r'^[a-zA-Z0-9_-]+$', file_key):
+    if not _FILE_KEY_RE.match(file_key):
         return False, "Invalid Figma file key format"
     
     return True, ""
 
-def extract_nodes(document):
+def extract_nodes(document, limit=None):
     """
     Extract nodes from Figma document
     
     Args:
         document (dict): Figma document data
+        limit (int, optional): Stop the traversal once this many nodes are extracted
         
     Returns:
         list: List of extracted nodes
     """
     nodes = []
     
-    def traverse_node(node):
-        # Skip nodes without type
+    # Walk in pre-order with an explicit stack, so deep documents can't hit
+    # the recursion limit
+    stack = [document] if document else []
+    while stack:
+        node = stack.pop()
+        
+        # Skip nodes without type (and everything below them)
         if "type" not in node:
-            return
+            continue
         
         # Add current node to the list
         nodes.append(node)
+        if len(nodes) == limit:
+            break
         
-        # Recursively traverse children
-        if "children" in node:
-            for child in node["children"]:
-                traverse_node(child)
-    
-    # Start traversal from root
-    if document:
-        traverse_node(document)
+        # Push children in reverse so they are visited in document order
+        children = node.get("children")
+        if children:
+            stack.extend(reversed(children))
     
     return nodes
 
-def flatten_figma_tree(nodes):
+def _detach_node(node, parent):
+    """Copy a node with a reference to its parent, splitting off its children"""
+    # Create a copy to avoid modifying the original
+    node_copy = node.copy()
+    
+    # Add parent reference
+    if parent:
+        node_copy["parent_id"] = parent.get("id")
+        node_copy["parent_type"] = parent.get("type")
+    
+    # Remove children to keep the node simple
+    children = node_copy.pop("children") if "children" in node_copy else ()
+    return node_copy, iter(children)
+
+# Marks an exhausted children iterator in iter_figma_tree
+_NO_CHILD = object()
+
+def iter_figma_tree(nodes):
     """
-    Flatten the Figma node tree into a simple list
+    Lazily flatten the Figma node tree, yielding each node after its children
+    
+    Walks with an explicit stack, so deep designs don't hit the recursion limit,
+    and stops as soon as the consumer does (e.g. with itertools.islice)
     
     Args:
         nodes (list): Hierarchical list of Figma nodes
         
-    Returns:
-        list: Flattened list of nodes with parent references
+    Yields:
+        dict: Nodes with parent references, in the same order as flatten_figma_tree
     """
-    flattened = []
-    
-    def process_node(node, parent=None):
-        # Create a copy to avoid modifying the original
-        node_copy = node.copy()
-        
-        # Add parent reference
-        if parent:
-            node_copy["parent_id"] = parent.get("id")
-            node_copy["parent_type"] = parent.get("type")
-        
-        # Remove children to keep the node simple
-        if "children" in node_copy:
-            children = node_copy.pop("children")
-            # Process children
-            for child in children:
-                process_node(child, node_copy)
-        
-        # Add to flattened list
-        flattened.append(node_copy)
-    
     # Process each root node
     for node in nodes:
         if node.get("type") in ["CANVAS", "FRAME", "GROUP", "COMPONENT"]:
-            process_node(node)
+            stack = [_detach_node(node, None)]
+            while stack:
+                node_copy, children = stack[-1]
+                child = next(children, _NO_CHILD)
+                if child is _NO_CHILD:
+                    # All children done; emit the node itself
+                    stack.pop()
+                    yield node_copy
+                else:
+                    stack.append(_detach_node(child, node_copy))
+
+def flatten_figma_tree(nodes, limit=None):
+    """
+    Flatten the Figma node tree into a simple list
     
-    return flattened
+    Args:
+        nodes (iterable): Hierarchical list of Figma nodes
+        limit (int, optional): Stop flattening once this many nodes are produced
+        
+    Returns:
+        list: Flattened list of nodes with parent references
+    """
+    return list(islice(iter_figma_tree(nodes), limit))
 
 def rgb_to_hex(r, g, b):
     """